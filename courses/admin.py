@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.admin.sites import NotRegistered
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import (
     User,
     Student,
@@ -9,15 +12,77 @@ from .models import (
     Category,
     Tag,
     Course,
+    CourseVersion,
     Enrollment,
     Lesson,
     Assignment,
+    AssignmentTestCase,
     Submission,
     Review,
     LessonProgress,
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids COUNT(*) over an unfiltered large table.
+
+    When the changelist is not filtered, the row count comes from the
+    planner statistics (pg_class on PostgreSQL, sqlite_stat1 after ANALYZE
+    on SQLite). Filtered lists and backends without statistics fall back to
+    an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, "query", None) is not None and not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate:
+                return estimate
+        return super().count
+
+
+def estimate_row_count(model, using="default"):
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [table],
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                "AND name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone() is None:
+                return None
+            # The first number of any stat row is the table's row count.
+            cursor.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate > 0 else None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow to millions of rows.
+
+    Subclasses filter dates with list_filter (indexed range lookups) rather
+    than date_hierarchy, whose DISTINCT date-trunc query scans the table.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
 # Custom User Admin
 class CustomUserAdmin(UserAdmin):
     list_display = ("username", "email", "role", "is_staff", "is_active")
@@ -37,19 +102,25 @@ admin.site.register(User, CustomUserAdmin)
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ("user", "phone", "date_of_birth")
+    list_select_related = ("user",)
     search_fields = ("user__username", "user__email")
+    autocomplete_fields = ("user",)
 
 
 @admin.register(Instructor)
 class InstructorAdmin(admin.ModelAdmin):
     list_display = ("user", "expertise", "years_experience")
+    list_select_related = ("user",)
     search_fields = ("user__username", "user__email", "expertise")
+    autocomplete_fields = ("user",)
 
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
     list_display = ("user", "department", "position")
+    list_select_related = ("user",)
     search_fields = ("user__username", "user__email", "department")
+    autocomplete_fields = ("user",)
 
 
 @admin.register(Category)
@@ -74,48 +145,81 @@ class CourseAdmin(admin.ModelAdmin):
         "published",
         "created_date",
     )
+    list_select_related = ("instructor__user", "category")
     list_filter = ("published", "category", "created_date")
     search_fields = ("title", "instructor__user__username")
     filter_horizontal = ("tags",)
+    autocomplete_fields = ("instructor", "category")
 
 
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
+class EnrollmentAdmin(LargeTableAdmin):
     list_display = ("student", "course", "enrolled_date", "completed", "progress")
+    list_select_related = ("student__user", "course")
     list_filter = ("completed", "enrolled_date")
     search_fields = ("student__user__username", "course__title")
+    autocomplete_fields = ("student", "course", "version")
+
+
+@admin.register(CourseVersion)
+class CourseVersionAdmin(admin.ModelAdmin):
+    list_display = ("course", "number", "created_date")
+    list_select_related = ("course",)
+    list_filter = ("created_date",)
+    search_fields = ("course__title",)
+    readonly_fields = ("course", "number", "content", "content_hash", "created_date")
+
+    def has_change_permission(self, request, obj=None):
+        # Versions are immutable; the change view is read-only.
+        return False
 
 
 @admin.register(Lesson)
 class LessonAdmin(admin.ModelAdmin):
     list_display = ("title", "course", "order", "created_date")
+    list_select_related = ("course",)
     list_filter = ("course", "created_date")
     search_fields = ("title", "course__title")
+    autocomplete_fields = ("course",)
+
+
+class AssignmentTestCaseInline(admin.TabularInline):
+    model = AssignmentTestCase
+    extra = 1
 
 
 @admin.register(Assignment)
 class AssignmentAdmin(admin.ModelAdmin):
-    list_display = ("title", "lesson", "due_date", "max_score")
+    list_display = ("title", "lesson", "due_date", "max_score", "weight")
+    list_select_related = ("lesson__course",)
     list_filter = ("due_date", "created_date")
     search_fields = ("title", "lesson__title")
+    autocomplete_fields = ("lesson",)
+    inlines = (AssignmentTestCaseInline,)
 
 
 @admin.register(Submission)
-class SubmissionAdmin(admin.ModelAdmin):
+class SubmissionAdmin(LargeTableAdmin):
     list_display = ("student", "assignment", "submitted_date", "score", "graded")
+    list_select_related = ("student__user", "assignment__lesson")
     list_filter = ("graded", "submitted_date")
     search_fields = ("student__user__username", "assignment__title")
+    autocomplete_fields = ("student", "assignment")
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     list_display = ("student", "course", "rating", "approved", "created_date")
+    list_select_related = ("student__user", "course")
     list_filter = ("rating", "approved", "created_date")
     search_fields = ("student__user__username", "course__title")
+    autocomplete_fields = ("student", "course")
 
 
 @admin.register(LessonProgress)
-class LessonProgressAdmin(admin.ModelAdmin):
+class LessonProgressAdmin(LargeTableAdmin):
     list_display = ("student", "lesson", "completed", "completed_date")
+    list_select_related = ("student__user", "lesson__course")
     list_filter = ("completed", "completed_date")
     search_fields = ("student__user__username", "lesson__title")
+    autocomplete_fields = ("student", "lesson")
@@ -0,0 +1,671 @@
+"""
+JSON API for the course catalog, lessons, enrollments, submissions and grades.
+
+Every list endpoint supports:
+
+- ``?fields=a,b`` to return only some fields of each item, and
+  ``?fields[<include>]=a,b`` to do the same for an included relation
+- ``?include=x,y`` to embed related objects; to-one relations are joined
+  with select_related and to-many relations are loaded with prefetch_related,
+  so the query count does not grow with the page size
+- cursor pagination via ``?cursor=`` and ``?limit=`` (ordered by primary key)
+- ``ETag`` / ``If-None-Match`` so unchanged responses come back as 304
+
+Access rules mirror the HTML views in views.py. Requests are authenticated by
+the normal session cookie, so write requests need the CSRF token.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Avg, Count
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import require_http_methods
+
+from . import events
+from .autocomplete import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    autocomplete_index,
+    suggestion_url,
+)
+from .cloning import enroll_student
+from .forms import CourseForm, LessonForm, SubmissionForm, GradeSubmissionForm
+from .models import Course, Enrollment, Lesson, Assignment, Submission, User
+from .ordering import move_lesson, next_order
+from .provisioning import provision_users, text_lines
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _field(name):
+    return lambda obj: getattr(obj, name)
+
+
+def _file_url(name):
+    def get(obj):
+        value = getattr(obj, name)
+        return value.url if value else None
+
+    return get
+
+
+def _full_name(user):
+    return user.get_full_name() or user.username
+
+
+def _percentage(score, max_score):
+    if score is None or not max_score:
+        return None
+    return round(100 * score / max_score, 1)
+
+
+CATEGORY_FIELDS = {"id": _field("pk"), "name": _field("name")}
+
+TAG_FIELDS = {"id": _field("pk"), "name": _field("name")}
+
+INSTRUCTOR_FIELDS = {
+    "id": _field("pk"),
+    "username": lambda i: i.user.username,
+    "name": lambda i: _full_name(i.user),
+    "expertise": _field("expertise"),
+}
+
+STUDENT_FIELDS = {
+    "id": _field("pk"),
+    "username": lambda s: s.user.username,
+    "name": lambda s: _full_name(s.user),
+}
+
+ASSIGNMENT_FIELDS = {
+    "id": _field("pk"),
+    "lesson_id": _field("lesson_id"),
+    "title": _field("title"),
+    "description": _field("description"),
+    "due_date": _field("due_date"),
+    "max_score": _field("max_score"),
+    "weight": _field("weight"),
+}
+
+LESSON_FIELDS = {
+    "id": _field("pk"),
+    "course_id": _field("course_id"),
+    "title": _field("title"),
+    "description": _field("description"),
+    "video_url": _field("video_url"),
+    "video_file": _file_url("video_file"),
+    "pdf_file": _file_url("pdf_file"),
+    "order": _field("order"),
+    "created_date": _field("created_date"),
+}
+
+COURSE_FIELDS = {
+    "id": _field("pk"),
+    "title": _field("title"),
+    "description": _field("description"),
+    "instructor_id": _field("instructor_id"),
+    "category_id": _field("category_id"),
+    "price": _field("price"),
+    "image": _file_url("image"),
+    "published": _field("published"),
+    "average_rating": lambda c: c.rating_avg or 0,
+    "review_count": _field("review_count"),
+    "created_date": _field("created_date"),
+    "updated_date": _field("updated_date"),
+}
+
+# Embedded courses come from a join and carry no rating annotations.
+COURSE_SUMMARY_FIELDS = {
+    name: get
+    for name, get in COURSE_FIELDS.items()
+    if name not in ("average_rating", "review_count")
+}
+
+ENROLLMENT_FIELDS = {
+    "id": _field("pk"),
+    "student_id": _field("student_id"),
+    "course_id": _field("course_id"),
+    "enrolled_date": _field("enrolled_date"),
+    "completed": _field("completed"),
+    "progress": _field("progress"),
+}
+
+SUBMISSION_FIELDS = {
+    "id": _field("pk"),
+    "assignment_id": _field("assignment_id"),
+    "student_id": _field("student_id"),
+    "content": _field("content"),
+    "file": _file_url("file"),
+    "submitted_date": _field("submitted_date"),
+    "score": _field("score"),
+    "feedback": _field("feedback"),
+    "graded": _field("graded"),
+}
+
+GRADE_FIELDS = {
+    "id": _field("pk"),
+    "assignment_id": _field("assignment_id"),
+    "course_id": lambda s: s.assignment.lesson.course_id,
+    "score": _field("score"),
+    "max_score": lambda s: s.assignment.max_score,
+    "percentage": lambda s: _percentage(s.score, s.assignment.max_score),
+    "feedback": _field("feedback"),
+    "submitted_date": _field("submitted_date"),
+}
+
+# include name -> (ORM lookup, field map, to-many)
+COURSE_INCLUDES = {
+    "category": ("category", CATEGORY_FIELDS, False),
+    "instructor": ("instructor__user", INSTRUCTOR_FIELDS, False),
+    "tags": ("tags", TAG_FIELDS, True),
+    "lessons": ("lessons", LESSON_FIELDS, True),
+}
+
+LESSON_INCLUDES = {
+    "course": ("course", COURSE_SUMMARY_FIELDS, False),
+    "assignments": ("assignments", ASSIGNMENT_FIELDS, True),
+}
+
+ENROLLMENT_INCLUDES = {
+    "course": ("course", COURSE_SUMMARY_FIELDS, False),
+    "student": ("student__user", STUDENT_FIELDS, False),
+}
+
+SUBMISSION_INCLUDES = {
+    "assignment": ("assignment", ASSIGNMENT_FIELDS, False),
+    "student": ("student__user", STUDENT_FIELDS, False),
+}
+
+GRADE_INCLUDES = {
+    "assignment": ("assignment", ASSIGNMENT_FIELDS, False),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.errors = errors
+
+
+def api_view(view):
+    """Require a logged-in user and turn ApiError into a JSON error response."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            if not request.user.is_authenticated and not getattr(
+                view, "public", False
+            ):
+                raise ApiError(401, "Authentication required.")
+            return view(request, *args, **kwargs)
+        except ApiError as exc:
+            payload = {"error": exc.message}
+            if exc.errors is not None:
+                payload["errors"] = exc.errors
+            return JsonResponse(payload, status=exc.status)
+
+    return wrapper
+
+
+def public(view):
+    view.public = True
+    return view
+
+
+def _csv(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _select_fields(field_map, requested):
+    if not requested:
+        return field_map
+    unknown = set(requested) - set(field_map)
+    if unknown:
+        raise ApiError(400, f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return {name: field_map[name] for name in requested}
+
+
+def _parse_includes(request, includes):
+    names = _csv(request.GET.get("include", ""))
+    unknown = set(names) - set(includes)
+    if unknown:
+        raise ApiError(400, f"Unknown include: {', '.join(sorted(unknown))}.")
+    return {name: includes[name] for name in names}
+
+
+def _apply_includes(queryset, included):
+    for lookup, _, many in included.values():
+        if many:
+            queryset = queryset.prefetch_related(lookup)
+        else:
+            queryset = queryset.select_related(lookup)
+    return queryset
+
+
+def _serializer(request, field_map, included):
+    fields = _select_fields(field_map, _csv(request.GET.get("fields", "")))
+    nested = {}
+    for name, (lookup, related_fields, many) in included.items():
+        requested = _csv(request.GET.get(f"fields[{name}]", ""))
+        nested[name] = (
+            lookup.split("__")[0],
+            _select_fields(related_fields, requested),
+            many,
+        )
+
+    def serialize(obj):
+        data = {name: get(obj) for name, get in fields.items()}
+        for name, (attr, related_fields, many) in nested.items():
+            related = getattr(obj, attr)
+            if many:
+                data[name] = [
+                    {key: get(item) for key, get in related_fields.items()}
+                    for item in related.all()
+                ]
+            elif related is not None:
+                data[name] = {key: get(related) for key, get in related_fields.items()}
+            else:
+                data[name] = None
+        return data
+
+    return serialize
+
+
+def _encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ApiError(400, "Invalid cursor.")
+
+
+def _id(value, name):
+    """``value`` (a query parameter or JSON value) as an object id."""
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and 0 < value < 2**63:
+        return value
+    raise ApiError(400, f"{name} must be an integer id.")
+
+
+def _page_size(request):
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, "limit must be an integer.")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _json_response(request, payload, status=200):
+    body = json.dumps(payload, cls=DjangoJSONEncoder)
+    etag = '"%s"' % hashlib.md5(body.encode()).hexdigest()
+    if request.method in ("GET", "HEAD") and status == 200:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            patch_vary_headers(not_modified, ["Cookie"])
+            return not_modified
+    response = HttpResponse(body, status=status, content_type="application/json")
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+def _list(request, queryset, field_map, includes):
+    included = _parse_includes(request, includes)
+    serialize = _serializer(request, field_map, included)
+    limit = _page_size(request)
+
+    queryset = _apply_includes(queryset, included).order_by("pk")
+    cursor = request.GET.get("cursor")
+    if cursor:
+        queryset = queryset.filter(pk__gt=_decode_cursor(cursor))
+    page = list(queryset[: limit + 1])
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    return _json_response(
+        request,
+        {
+            "results": [serialize(obj) for obj in page],
+            "next_cursor": _encode_cursor(page[-1].pk) if has_next else None,
+        },
+    )
+
+
+def _detail(request, queryset, pk, field_map, includes):
+    included = _parse_includes(request, includes)
+    serialize = _serializer(request, field_map, included)
+    obj = get_object_or_404(_apply_includes(queryset, included), pk=pk)
+    return _json_response(request, serialize(obj))
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError(400, "Request body must be valid JSON.")
+    if not isinstance(data, dict):
+        raise ApiError(400, "Request body must be a JSON object.")
+    return data
+
+
+def _validate(form):
+    if not form.is_valid():
+        raise ApiError(400, "Validation failed.", errors=form.errors.get_json_data())
+    return form
+
+
+def _require_role(request, *roles):
+    if request.user.role not in roles:
+        raise ApiError(403, "Access denied.")
+
+
+def _courses():
+    return Course.objects.annotate(
+        rating_avg=Avg("reviews__rating"), review_count=Count("reviews")
+    )
+
+
+def _visible_lessons(user):
+    # Mirrors lesson_detail: students only see lessons of courses they are
+    # enrolled in, other roles can open any lesson.
+    if user.role == "student":
+        return Lesson.objects.filter(course__enrollments__student__user=user)
+    return Lesson.objects.all()
+
+
+def _visible_enrollments(user):
+    if user.role == "student":
+        return Enrollment.objects.filter(student__user=user)
+    if user.role == "instructor":
+        return Enrollment.objects.filter(course__instructor__user=user)
+    return Enrollment.objects.all()
+
+
+def _visible_submissions(user):
+    if user.role == "student":
+        return Submission.objects.filter(student__user=user)
+    if user.role == "instructor":
+        return Submission.objects.filter(
+            assignment__lesson__course__instructor__user=user
+        )
+    raise ApiError(403, "Access denied.")
+
+
+def _course_owner_or_employee(request, course):
+    if request.user.role == "employee":
+        return
+    user = request.user
+    if user.role == "instructor" and course.instructor.user_id == user.pk:
+        return
+    raise ApiError(403, "Access denied.")
+
+
+@require_http_methods(["GET", "HEAD", "POST"])
+@api_view
+@public
+def course_list(request):
+    if request.method != "POST":
+        return _list(
+            request, _courses().filter(published=True), COURSE_FIELDS, COURSE_INCLUDES
+        )
+
+    if not request.user.is_authenticated:
+        raise ApiError(401, "Authentication required.")
+    _require_role(request, "instructor")
+    form = _validate(CourseForm(_json_body(request)))
+    course = form.save(commit=False)
+    course.instructor = request.user.instructor_profile
+    course.save()
+    form.save_m2m()
+    serialize = _serializer(request, COURSE_FIELDS, {})
+    return _json_response(request, serialize(_courses().get(pk=course.pk)), 201)
+
+
+@require_http_methods(["GET", "HEAD"])
+@api_view
+@public
+def course_detail(request, pk):
+    return _detail(
+        request,
+        _courses().filter(published=True),
+        pk,
+        COURSE_FIELDS,
+        COURSE_INCLUDES,
+    )
+
+
+@require_http_methods(["GET", "HEAD", "POST"])
+@api_view
+def lesson_list(request):
+    if request.method != "POST":
+        lessons = _visible_lessons(request.user)
+        if request.GET.get("course"):
+            lessons = lessons.filter(course_id=_id(request.GET["course"], "course"))
+        return _list(request, lessons, LESSON_FIELDS, LESSON_INCLUDES)
+
+    data = _json_body(request)
+    course = get_object_or_404(Course, pk=_id(data.get("course"), "course"))
+    _course_owner_or_employee(request, course)
+    form = _validate(LessonForm(data))
+    lesson = form.save(commit=False)
+    lesson.course = course
+    if not lesson.order:
+        lesson.order = next_order(course)
+    lesson.save()
+    return _json_response(request, _serializer(request, LESSON_FIELDS, {})(lesson), 201)
+
+
+@require_http_methods(["GET", "HEAD"])
+@api_view
+def lesson_detail(request, pk):
+    return _detail(
+        request, _visible_lessons(request.user), pk, LESSON_FIELDS, LESSON_INCLUDES
+    )
+
+
+@require_http_methods(["POST"])
+@api_view
+def move_lesson_view(request, pk):
+    """Move a lesson to directly after ``{"after": <lesson id>}``, or to the
+    start of its course with ``{"after": null}``. Only the moved row is
+    updated, see ordering.py."""
+    lesson = get_object_or_404(
+        Lesson.objects.select_related("course__instructor"), pk=pk
+    )
+    _course_owner_or_employee(request, lesson.course)
+    data = _json_body(request)
+    if "after" not in data:
+        raise ApiError(400, "after is required (a lesson id or null).")
+    after = None
+    if data["after"] is not None:
+        after = Lesson.objects.filter(
+            pk=_id(data["after"], "after"), course_id=lesson.course_id
+        ).first()
+        if after is None or after.pk == lesson.pk:
+            raise ApiError(400, "after must be another lesson of the same course.")
+    move_lesson(lesson, after)
+    return _json_response(request, _serializer(request, LESSON_FIELDS, {})(lesson))
+
+
+@require_http_methods(["GET", "HEAD", "POST"])
+@api_view
+def enrollment_list(request):
+    if request.method != "POST":
+        return _list(
+            request,
+            _visible_enrollments(request.user),
+            ENROLLMENT_FIELDS,
+            ENROLLMENT_INCLUDES,
+        )
+
+    _require_role(request, "student")
+    data = _json_body(request)
+    course = get_object_or_404(
+        Course, pk=_id(data.get("course"), "course"), published=True
+    )
+    enrollment, created = enroll_student(request.user.student_profile, course)
+    if created:
+        events.record(events.ENROLL, request.user, course=course.pk)
+    return _json_response(
+        request,
+        _serializer(request, ENROLLMENT_FIELDS, {})(enrollment),
+        201 if created else 200,
+    )
+
+
+@require_http_methods(["GET", "HEAD", "POST"])
+@api_view
+def submission_list(request):
+    if request.method != "POST":
+        submissions = _visible_submissions(request.user)
+        if request.GET.get("assignment"):
+            submissions = submissions.filter(
+                assignment_id=_id(request.GET["assignment"], "assignment")
+            )
+        return _list(request, submissions, SUBMISSION_FIELDS, SUBMISSION_INCLUDES)
+
+    _require_role(request, "student")
+    data = _json_body(request)
+    assignment = get_object_or_404(
+        Assignment.objects.select_related("lesson"),
+        pk=_id(data.get("assignment"), "assignment"),
+    )
+    student = request.user.student_profile
+    if Submission.objects.filter(assignment=assignment, student=student).exists():
+        raise ApiError(409, "You have already submitted this assignment.")
+    form = _validate(SubmissionForm(data))
+    submission = form.save(commit=False)
+    submission.assignment = assignment
+    submission.student = student
+    submission.save()
+    events.record(
+        events.SUBMISSION,
+        request.user,
+        course=assignment.lesson.course_id,
+        assignment=assignment.pk,
+        submission=submission.pk,
+    )
+    return _json_response(
+        request, _serializer(request, SUBMISSION_FIELDS, {})(submission), 201
+    )
+
+
+@require_http_methods(["GET", "HEAD"])
+@api_view
+def submission_detail(request, pk):
+    return _detail(
+        request,
+        _visible_submissions(request.user),
+        pk,
+        SUBMISSION_FIELDS,
+        SUBMISSION_INCLUDES,
+    )
+
+
+@require_http_methods(["POST"])
+@api_view
+def grade_submission(request, pk):
+    _require_role(request, "instructor")
+    submission = get_object_or_404(
+        Submission.objects.select_related("assignment__lesson", "student"),
+        pk=pk,
+        assignment__lesson__course__instructor__user=request.user,
+    )
+    form = _validate(GradeSubmissionForm(_json_body(request), instance=submission))
+    submission = form.save(commit=False)
+    submission.graded = True
+    submission.save()
+    events.record(
+        events.GRADE,
+        request.user,
+        course=submission.assignment.lesson.course_id,
+        assignment=submission.assignment_id,
+        submission=submission.pk,
+        student=submission.student.user_id,
+        score=submission.score,
+    )
+    serialize = _serializer(request, SUBMISSION_FIELDS, {})
+    return _json_response(request, serialize(submission))
+
+
+@require_http_methods(["GET", "HEAD"])
+@api_view
+def grade_list(request):
+    _require_role(request, "student")
+    grades = Submission.objects.filter(
+        student__user=request.user, graded=True
+    ).select_related("assignment__lesson")
+    return _list(request, grades, GRADE_FIELDS, GRADE_INCLUDES)
+
+
+@require_http_methods(["GET", "HEAD"])
+@api_view
+@public
+def autocomplete(request):
+    """Suggestions for ``?q=`` across course titles, tags, categories and
+    instructors, most enrolled first. Served from the in-memory prefix index
+    in autocomplete.py, so a keystroke does not touch the database."""
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(400, "limit must be an integer.")
+    limit = max(1, min(limit, MAX_LIMIT))
+    results = [
+        {
+            "type": kind,
+            "id": pk,
+            "label": label,
+            "enrollments": enrollments,
+            "url": suggestion_url(kind, pk),
+        }
+        for kind, pk, label, enrollments in autocomplete_index.suggest(
+            request.GET.get("q", ""), limit
+        )
+    ]
+    return _json_response(request, {"results": results})
+
+
+PROVISIONING_FORMATS = {
+    "text/csv": "csv",
+    "application/jsonl": "jsonl",
+    "application/x-ndjson": "jsonl",
+}
+
+
+@require_http_methods(["POST"])
+@api_view
+def provision_users_view(request):
+    """Create users from a CSV or JSON Lines request body (employees only).
+
+    The body is streamed; ``?role=`` sets the default role and ``?sso=1``
+    gives every account an unusable password.
+    """
+    _require_role(request, "employee")
+    fmt = PROVISIONING_FORMATS.get(request.content_type)
+    if fmt is None:
+        raise ApiError(
+            415, "Send text/csv or application/jsonl (application/x-ndjson)."
+        )
+    default_role = request.GET.get("role", "student")
+    if default_role not in dict(User.ROLE_CHOICES):
+        raise ApiError(400, f"Unknown role {default_role!r}.")
+    report = provision_users(
+        text_lines(request, request.encoding or "utf-8"),
+        fmt=fmt,
+        default_role=default_role,
+        sso=request.GET.get("sso") in ("1", "true"),
+    )
+    return _json_response(request, report.as_dict(), status=201)
@@ -0,0 +1,286 @@
+"""
+In-memory prefix index for catalog autocomplete.
+
+Every published course title, tag, category and instructor name is an
+"item". Each item is indexed under every word suffix of its normalised label
+("web development with django", "development with django", "with django",
+"django"), so a query matches the start of any word and multi-word queries
+work too. The keys live in one sorted list; a lookup is a bisect to the
+first key with the query as prefix and a scan to the last one. Very short
+prefixes can match a large part of the catalog, so when the matching range
+is longer than SCAN_LIMIT the lookup walks the items in rank order instead
+and stops after ``limit`` hits, which is quick precisely because so many
+items match.
+
+Items are ranked by enrollments: a course by its own enrollment count, a tag,
+category or instructor by the total over its published courses. Results for
+recent prefixes are memoised until the next change, so repeated keystrokes
+from many users cost a dict lookup.
+
+Like the facet index, the index is built lazily per process, kept in sync by
+the signals in signals.py and rebuilt after AUTOCOMPLETE_INDEX_TTL seconds to
+pick up changes made by other processes.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+from django.urls import reverse
+
+from .models import Category, Course, Instructor, Tag
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+CACHE_SIZE = 2048
+SCAN_LIMIT = 1000
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalise(text):
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def _keys(label):
+    words = normalise(label).split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+def _instructor_label(first, last, username):
+    return f"{first} {last}".strip() or username
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.built_at = 0.0
+        # (key, kind, id), sorted by key
+        self.keys = []
+        # (kind, id) -> label
+        self.labels = {}
+        # (kind, id) -> the item's keys
+        self.item_keys = {}
+        # all items, most enrolled first; rebuilt lazily after changes
+        self.ranking = None
+        self._resort = False
+        # (kind, id) -> enrollments used for ranking
+        self.weights = defaultdict(int)
+        # course id -> (category id, tag ids, instructor id, enrollments)
+        self.courses = {}
+        self._cache = {}
+
+    # Building -----------------------------------------------------------
+
+    def build(self):
+        index = AutocompleteIndex()
+        tags = defaultdict(list)
+        for course_id, tag_id in Course.tags.through.objects.filter(
+            course__published=True
+        ).values_list("course_id", "tag_id"):
+            tags[course_id].append(tag_id)
+        for name in ("category", "tag"):
+            model = Category if name == "category" else Tag
+            for pk, label in model.objects.values_list("pk", "name"):
+                index._add_item((name, pk), label)
+        for pk, first, last, username in Instructor.objects.values_list(
+            "pk", "user__first_name", "user__last_name", "user__username"
+        ):
+            index._add_item(
+                ("instructor", pk), _instructor_label(first, last, username)
+            )
+        rows = (
+            Course.objects.filter(published=True)
+            .annotate(enrollment_count=Count("enrollments"))
+            .values_list(
+                "pk", "title", "category_id", "instructor_id", "enrollment_count"
+            )
+        )
+        for pk, title, category_id, instructor_id, enrollments in rows:
+            index._add_course(
+                pk, title, category_id, tuple(tags[pk]), instructor_id, enrollments
+            )
+        index.keys.sort()
+        index.built_at = time.monotonic()
+        with self._lock:
+            self.__dict__.update(
+                {k: v for k, v in index.__dict__.items() if k != "_lock"}
+            )
+
+    def _changed(self):
+        self.ranking = None
+        self._cache.clear()
+
+    def _add_item(self, item, label, sort=False):
+        self.labels[item] = label
+        self.item_keys[item] = keys = tuple(_keys(label))
+        for key in keys:
+            entry = (key, *item)
+            if sort:
+                bisect.insort(self.keys, entry)
+            else:
+                self.keys.append(entry)
+
+    def _remove_item(self, item):
+        if self.labels.pop(item, None) is None:
+            return
+        for key in self.item_keys.pop(item):
+            entry = (key, *item)
+            position = bisect.bisect_left(self.keys, entry)
+            if position < len(self.keys) and self.keys[position] == entry:
+                del self.keys[position]
+
+    def _related(self, category_id, tag_ids, instructor_id):
+        yield "category", category_id
+        yield "instructor", instructor_id
+        for tag_id in tag_ids:
+            yield "tag", tag_id
+
+    def _add_course(
+        self, pk, title, category_id, tag_ids, instructor_id, enrollments, sort=False
+    ):
+        self._add_item(("course", pk), title, sort=sort)
+        self.courses[pk] = (category_id, tag_ids, instructor_id, enrollments)
+        self.weights["course", pk] = enrollments
+        for item in self._related(category_id, tag_ids, instructor_id):
+            self.weights[item] += enrollments
+
+    def _remove_course(self, pk):
+        entry = self.courses.pop(pk, None)
+        if entry is None:
+            return
+        category_id, tag_ids, instructor_id, enrollments = entry
+        self._remove_item(("course", pk))
+        self.weights.pop(("course", pk), None)
+        for item in self._related(category_id, tag_ids, instructor_id):
+            self.weights[item] -= enrollments
+
+    # Incremental updates (called from signals) --------------------------
+
+    def refresh_course(self, pk):
+        if not self.built_at:
+            return
+        row = (
+            Course.objects.filter(pk=pk, published=True)
+            .annotate(enrollment_count=Count("enrollments"))
+            .values_list("title", "category_id", "instructor_id", "enrollment_count")
+            .first()
+        )
+        tag_ids = (
+            tuple(
+                Course.tags.through.objects.filter(course_id=pk).values_list(
+                    "tag_id", flat=True
+                )
+            )
+            if row
+            else ()
+        )
+        with self._lock:
+            self._remove_course(pk)
+            if row:
+                title, category_id, instructor_id, enrollments = row
+                self._add_course(
+                    pk,
+                    title,
+                    category_id,
+                    tag_ids,
+                    instructor_id,
+                    enrollments,
+                    sort=True,
+                )
+            self._changed()
+
+    def refresh_item(self, kind, pk, label=None):
+        """Re-key a category, tag or instructor; ``label=None`` removes it."""
+        if not self.built_at:
+            return
+        with self._lock:
+            self._remove_item((kind, pk))
+            if label is not None:
+                self._add_item((kind, pk), label, sort=True)
+            self._changed()
+
+    def enrollments_changed(self, course_id, delta):
+        if not self.built_at:
+            return
+        with self._lock:
+            entry = self.courses.get(course_id)
+            if entry is None:
+                return
+            category_id, tag_ids, instructor_id, enrollments = entry
+            self.courses[course_id] = (
+                category_id,
+                tag_ids,
+                instructor_id,
+                enrollments + delta,
+            )
+            self.weights["course", course_id] += delta
+            for item in self._related(category_id, tag_ids, instructor_id):
+                self.weights[item] += delta
+            # The ranking is still nearly sorted, which timsort handles in
+            # linear time, so re-sort it in place rather than from scratch.
+            self._resort = True
+            self._cache.clear()
+
+    # Querying -----------------------------------------------------------
+
+    def ensure_fresh(self):
+        ttl = getattr(settings, "AUTOCOMPLETE_INDEX_TTL", 300)
+        if not self.built_at or time.monotonic() - self.built_at > ttl:
+            self.build()
+
+    def _rank_key(self, item):
+        return -self.weights[item], self.labels[item]
+
+    def _walk_ranking(self, prefix, limit):
+        if self.ranking is None:
+            self.ranking = sorted(self.labels, key=self._rank_key)
+        elif self._resort:
+            self.ranking.sort(key=self._rank_key)
+        self._resort = False
+        top = []
+        for item in self.ranking:
+            if any(key.startswith(prefix) for key in self.item_keys[item]):
+                top.append(item)
+                if len(top) == limit:
+                    break
+        return top
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Return up to ``limit`` (kind, id, label, enrollments) tuples."""
+        prefix = normalise(query)
+        if not prefix:
+            return []
+        self.ensure_fresh()
+        with self._lock:
+            cached = self._cache.get((prefix, limit))
+            if cached is not None:
+                return cached
+            start = bisect.bisect_left(self.keys, (prefix,))
+            end = bisect.bisect_left(self.keys, (prefix + "\uffff",), start)
+            if end - start > SCAN_LIMIT:
+                top = self._walk_ranking(prefix, limit)
+            else:
+                items = {(kind, pk) for _, kind, pk in self.keys[start:end]}
+                top = heapq.nsmallest(limit, items, key=self._rank_key)
+            result = [
+                (kind, pk, self.labels[kind, pk], self.weights[kind, pk])
+                for kind, pk in top
+            ]
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[prefix, limit] = result
+            return result
+
+
+def suggestion_url(kind, pk):
+    if kind == "course":
+        return reverse("course_detail", args=[pk])
+    return f"{reverse('course_list')}?{kind}={pk}"
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,321 @@
+"""
+Autograder for Python code submissions.
+
+Each submission's ``content`` is run once per AssignmentTestCase in a
+fresh ``python -I`` subprocess with a private temporary directory, a new
+session and rlimits on CPU time, address space, file size, open files
+and processes. stdout is compared with the expected output, ignoring
+trailing whitespace, and the passed points are scaled to the
+assignment's max_score, capped at the 100 that Submission.score allows
+(grades are saved with bulk_update, which runs no validators). The
+child's process group is killed after every run, so programs can't leave
+background children behind.
+
+Student code must not run with the application's rights: it could read
+settings.py (SECRET_KEY) and the database. Two settings isolate it:
+
+- AUTOGRADER_USER: a user name or uid the child switches to before exec.
+  The grader must then run as root (or with CAP_SETUID). Give that user
+  no read access to BASE_DIR, e.g. by making the project tree 0750.
+- AUTOGRADER_SANDBOX: a command prefix the program runs under, "bwrap"
+  for the built-in bubblewrap profile (no network, read-only /usr and the
+  Python install, only the work directory writable, BASE_DIR not mounted),
+  or an argv list for nsjail or another wrapper. "{workdir}", "{python}"
+  and "{prefix}" (the Python installation) in the list are replaced per
+  run.
+
+The sandbox user must be able to execute the interpreter. When the
+grader's own Python lives somewhere that user can't reach (a home
+directory), point AUTOGRADER_PYTHON at a system interpreter.
+
+With neither set the rlimits only contain runaway programs and the
+grader logs a warning the first time it runs; that is fine for trusted
+code in development only.
+
+Submissions are graded in a process pool, one submission per task, and the
+results are written back with bulk_update in batches. Each saved grade is
+recorded in the event log as a GRADE event with no user and
+``autograded: true``.
+"""
+import logging
+import os
+import pwd
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+
+from . import events
+from .gradestats import previous_grades
+from .models import AssignmentTestCase, Submission
+from .signals import grades_changed
+
+OUTPUT_LIMIT = 1 << 20
+FEEDBACK_OUTPUT_CHARS = 200
+# Submission.score's MaxValueValidator.
+SCORE_LIMIT = 100
+# The interpreter itself, not a virtualenv link that may live in BASE_DIR;
+# -I -S means the program needs nothing from the virtualenv.
+PYTHON = os.path.realpath(sys.executable)
+
+SANDBOXES = {
+    "bwrap": [
+        "bwrap",
+        "--unshare-all",
+        "--die-with-parent",
+        "--new-session",
+        "--ro-bind", "/usr", "/usr",
+        "--ro-bind-try", "/bin", "/bin",
+        "--ro-bind-try", "/lib", "/lib",
+        "--ro-bind-try", "/lib64", "/lib64",
+        "--ro-bind", "{prefix}", "{prefix}",
+        "--proc", "/proc",
+        "--dev", "/dev",
+        "--tmpfs", "/tmp",
+        "--bind", "{workdir}", "{workdir}",
+        "--chdir", "{workdir}",
+    ],
+}  # fmt: skip
+
+logger = logging.getLogger(__name__)
+_warned = False
+
+
+def _user(value):
+    # (uid, gid) for AUTOGRADER_USER, given as a name or a uid.
+    if value is None:
+        return None
+    if isinstance(value, int) or value.isdigit():
+        entry = pwd.getpwuid(int(value))
+    else:
+        entry = pwd.getpwnam(value)
+    return entry.pw_uid, entry.pw_gid
+
+
+def limits_from_settings():
+    global _warned
+    sandbox = getattr(settings, "AUTOGRADER_SANDBOX", None)
+    if isinstance(sandbox, str):
+        sandbox = SANDBOXES[sandbox]
+    user = _user(getattr(settings, "AUTOGRADER_USER", None))
+    if not sandbox and not user and not _warned:
+        _warned = True
+        logger.warning(
+            "Autograder runs submissions as the application user; set "
+            "AUTOGRADER_USER or AUTOGRADER_SANDBOX for untrusted code."
+        )
+    return {
+        "cpu_seconds": getattr(settings, "AUTOGRADER_TIME_LIMIT", 2),
+        "memory_mb": getattr(settings, "AUTOGRADER_MEMORY_LIMIT_MB", 256),
+        "processes": getattr(settings, "AUTOGRADER_MAX_PROCESSES", 16),
+        "user": user,
+        "sandbox": sandbox,
+        "python": getattr(settings, "AUTOGRADER_PYTHON", None) or PYTHON,
+    }
+
+
+def _restrict(cpu_seconds, memory_mb, processes, user):
+    # Runs in the child between fork and exec.
+    os.setsid()
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    memory = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (OUTPUT_LIMIT, OUTPUT_LIMIT))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    # Counted per real uid, so it is tightest with AUTOGRADER_USER.
+    resource.setrlimit(resource.RLIMIT_NPROC, (processes, processes))
+    if user:
+        uid, gid = user
+        os.setgroups([])
+        os.setgid(gid)
+        os.setuid(uid)
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_program(
+    code,
+    stdin,
+    cpu_seconds,
+    memory_mb,
+    processes=16,
+    user=None,
+    sandbox=None,
+    python=PYTHON,
+):
+    """Run ``code`` with ``stdin``; return (status, stdout, stderr).
+
+    status is one of "ok", "error" (non-zero exit), "timeout" or "limit".
+    ``user`` is a (uid, gid) to run as and ``sandbox`` a command prefix,
+    see the module docstring.
+    """
+    with tempfile.TemporaryDirectory(prefix="autograde-") as workdir:
+        source = os.path.join(workdir, "main.py")
+        with open(source, "w") as f:
+            f.write(code)
+        if user:
+            os.chown(workdir, *user)
+            os.chown(source, *user)
+        command = [python, "-I", "-S", source]
+        if sandbox:
+            prefix = os.path.dirname(os.path.dirname(os.path.realpath(python)))
+            values = {"workdir": workdir, "python": python, "prefix": prefix}
+            command = [part.format(**values) for part in sandbox] + command
+        stdout_path = os.path.join(workdir, "stdout")
+        stderr_path = os.path.join(workdir, "stderr")
+        with open(stdout_path, "wb") as out, open(stderr_path, "wb") as err:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=out,
+                stderr=err,
+                cwd=workdir,
+                env={"PATH": "/usr/bin:/bin", "PYTHONIOENCODING": "utf-8"},
+                preexec_fn=partial(_restrict, cpu_seconds, memory_mb, processes, user),
+            )
+            try:
+                process.communicate(stdin.encode(), timeout=cpu_seconds * 2 + 1)
+                status = "ok" if process.returncode == 0 else "error"
+                if process.returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+                    status = "timeout"
+                elif process.returncode == -signal.SIGXFSZ:
+                    status = "limit"
+            except subprocess.TimeoutExpired:
+                _kill_group(process.pid)
+                process.wait()
+                status = "timeout"
+            finally:
+                # Children left running in the background die with the run.
+                _kill_group(process.pid)
+        with open(stdout_path, "rb") as out, open(stderr_path, "rb") as err:
+            stdout = out.read(OUTPUT_LIMIT).decode("utf-8", "replace")
+            stderr = err.read(OUTPUT_LIMIT).decode("utf-8", "replace")
+    return status, stdout, stderr
+
+
+def _normalise(output):
+    return "\n".join(line.rstrip() for line in output.strip().splitlines())
+
+
+def grade_job(job):
+    """Grade one submission. Runs in a pool worker, so no ORM access here.
+
+    ``job`` is (submission_id, code, max_score, cases, limits) where cases is
+    a list of (name, stdin, expected_output, points).
+    """
+    submission_id, code, max_score, cases, limits = job
+    earned = total = 0
+    lines = []
+    for name, stdin, expected, points in cases:
+        total += points
+        status, stdout, stderr = run_program(code, stdin, **limits)
+        if status == "ok" and _normalise(stdout) == _normalise(expected):
+            earned += points
+            lines.append(f"PASS {name} ({points}/{points})")
+            continue
+        if status == "ok":
+            detail = f"wrong output: {stdout.strip()[:FEEDBACK_OUTPUT_CHARS]!r}"
+        elif status == "error":
+            last_line = stderr.strip().splitlines()[-1:] or ["non-zero exit"]
+            detail = last_line[0][:FEEDBACK_OUTPUT_CHARS]
+        elif status == "timeout":
+            detail = "time limit exceeded"
+        else:
+            detail = "output limit exceeded"
+        lines.append(f"FAIL {name} (0/{points}): {detail}")
+    score = min(round(max_score * earned / total), SCORE_LIMIT) if total else 0
+    lines.append(f"Autograded: {earned}/{total} test points.")
+    return submission_id, score, "\n".join(lines)
+
+
+def _jobs(submissions, limits):
+    cases_by_assignment = {}
+    for case in AssignmentTestCase.objects.filter(
+        assignment_id__in=submissions.values("assignment_id")
+    ).order_by("assignment_id", "order", "pk"):
+        cases_by_assignment.setdefault(case.assignment_id, []).append(
+            (case.name, case.stdin, case.expected_output, case.points)
+        )
+    rows = submissions.exclude(content="").values_list(
+        "pk", "assignment_id", "content", "assignment__max_score"
+    )
+    for pk, assignment_id, content, max_score in rows.iterator(chunk_size=500):
+        cases = cases_by_assignment.get(assignment_id)
+        if cases:
+            yield pk, content, max_score, cases, limits
+
+
+def _save_grades(submissions):
+    # bulk_update sends no signals, so update the grade aggregates here.
+    with transaction.atomic():
+        previous = previous_grades([submission.pk for submission in submissions])
+        Submission.objects.bulk_update(submissions, ["score", "feedback", "graded"])
+        grades_changed(
+            [
+                (*previous[submission.pk], submission.score)
+                for submission in submissions
+                if submission.pk in previous
+            ],
+            submission_ids=[submission.pk for submission in submissions],
+        )
+    _record_grades(submissions)
+    return len(submissions)
+
+
+def _record_grades(submissions):
+    scores = {submission.pk: submission.score for submission in submissions}
+    rows = Submission.objects.filter(pk__in=scores).values_list(
+        "pk", "assignment_id", "assignment__lesson__course_id", "student__user_id"
+    )
+    for pk, assignment_id, course_id, student_id in rows:
+        events.record(
+            events.GRADE,
+            None,
+            course=course_id,
+            assignment=assignment_id,
+            submission=pk,
+            student=student_id,
+            score=scores[pk],
+            autograded=True,
+        )
+
+
+def autograde(submissions, workers=None, batch_size=200):
+    """Grade ``submissions`` (a queryset) in parallel; return how many.
+
+    Submissions without text content or whose assignment has no test cases
+    are skipped.
+    """
+    workers = (
+        workers or getattr(settings, "AUTOGRADER_WORKERS", None) or os.cpu_count()
+    )
+    jobs = list(_jobs(submissions, limits_from_settings()))
+    if not jobs:
+        return 0
+
+    graded, pending = 0, []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for submission_id, score, feedback in executor.map(grade_job, jobs):
+            pending.append(
+                Submission(
+                    pk=submission_id, score=score, feedback=feedback, graded=True
+                )
+            )
+            if len(pending) >= batch_size:
+                graded += _save_grades(pending)
+                pending = []
+    if pending:
+        graded += _save_grades(pending)
+    return graded
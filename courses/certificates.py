@@ -0,0 +1,194 @@
+"""
+Completion certificates as PNG images.
+
+A certificate is fully described by its content: the student's name, the
+course, the instructor and the completion date (the student's last lesson
+completion in the course, or the enrollment date). The content is hashed
+with a keyed HMAC, and the image is stored under
+MEDIA_ROOT/certificates/<2 hex>/<digest>.png. Because the hash is keyed,
+the file names can't be guessed from public data even where MEDIA_ROOT is
+served directly.
+
+Content-addressing gives the cache and the deduplication for free. An
+unchanged enrollment maps to a file that already exists, so it is never
+rendered again. Identical content is rendered once per batch. A renamed
+student or course gets a new file on the next request. Bump
+TEMPLATE_VERSION when the layout changes so old images stop matching.
+
+Rendering is CPU-bound Pillow work. generate_certificates() therefore
+sends the missing images to a process pool. Each worker writes its file
+to a temporary name and renames it into place, so readers never see half
+a PNG. The download view renders a single missing certificate in-process.
+"""
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from PIL import Image, ImageDraw, ImageFont
+
+from .models import Enrollment, LessonProgress
+
+TEMPLATE_VERSION = 1
+SIZE = (1600, 1130)
+INK = (33, 37, 41)
+MUTED = (108, 117, 125)
+ACCENT = (13, 110, 253)
+
+
+def certificate_dir():
+    return Path(settings.MEDIA_ROOT) / "certificates"
+
+
+def completed_enrollments(enrollments=None):
+    """Completed enrollments with what certificate_content() needs."""
+    if enrollments is None:
+        enrollments = Enrollment.objects.all()
+    last_lesson = (
+        LessonProgress.objects.filter(
+            student=OuterRef("student_id"),
+            lesson__course=OuterRef("course_id"),
+            completed=True,
+        )
+        .values("student")
+        .annotate(last=Max("completed_date"))
+        .values("last")
+    )
+    return (
+        enrollments.filter(completed=True)
+        .select_related("student__user", "course__instructor__user")
+        .annotate(completed_on=Subquery(last_lesson))
+    )
+
+
+def _display_name(user):
+    return user.get_full_name() or user.username
+
+
+def certificate_content(enrollment):
+    completed_on = getattr(enrollment, "completed_on", None) or enrollment.enrolled_date
+    completed_on = timezone.localdate(completed_on)
+    return {
+        "version": TEMPLATE_VERSION,
+        "student": _display_name(enrollment.student.user),
+        "course": enrollment.course.title,
+        "instructor": _display_name(enrollment.course.instructor.user),
+        "date": completed_on.strftime("%B %d, %Y").replace(" 0", " "),
+    }
+
+
+def content_digest(content):
+    payload = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return salted_hmac(
+        "courses.certificates", payload, algorithm="sha256"
+    ).hexdigest()
+
+
+def certificate_path(digest):
+    return certificate_dir() / digest[:2] / f"{digest}.png"
+
+
+def _font(size):
+    path = getattr(settings, "CERTIFICATE_FONT", None)
+    if path:
+        return ImageFont.truetype(str(path), size)
+    return ImageFont.load_default(size)
+
+
+def _centered(draw, y, text, size, fill, max_width):
+    # Shrink long names and titles until they fit between the borders.
+    while True:
+        font = _font(size)
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        if right - left <= max_width or size <= 16:
+            break
+        size -= 4
+    draw.text(((SIZE[0] - (right - left)) / 2 - left, y), text, font=font, fill=fill)
+
+
+def render_certificate(content):
+    """PNG bytes for a certificate_content() dict."""
+    width, height = SIZE
+    image = Image.new("RGB", SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((30, 30, width - 31, height - 31), outline=ACCENT, width=10)
+    draw.rectangle((60, 60, width - 61, height - 61), outline=MUTED, width=2)
+    text_width = width - 240
+
+    _centered(draw, 170, "Certificate of Completion", 84, ACCENT, text_width)
+    _centered(draw, 340, "This certifies that", 36, MUTED, text_width)
+    _centered(draw, 420, content["student"], 96, INK, text_width)
+    draw.line((width / 2 - 400, 545, width / 2 + 400, 545), fill=MUTED, width=2)
+    _centered(draw, 590, "has successfully completed", 36, MUTED, text_width)
+    _centered(draw, 660, content["course"], 64, INK, text_width)
+    _centered(draw, 840, f"Instructor: {content['instructor']}", 34, INK, text_width)
+    _centered(draw, 900, content["date"], 34, MUTED, text_width)
+
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _render_job(job):
+    # Runs in a pool worker; only the digest goes back to the parent.
+    digest, content, path = job
+    _write(Path(path), render_certificate(content))
+    return digest
+
+
+def certificate_file(enrollment):
+    """Path of the enrollment's certificate, rendering it if not cached."""
+    content = certificate_content(enrollment)
+    path = certificate_path(content_digest(content))
+    if not path.exists():
+        _write(path, render_certificate(content))
+    return path
+
+
+def generate_certificates(enrollments=None, workers=None, force=False):
+    """Render missing certificates in parallel; return (enrollments, rendered).
+
+    ``enrollments`` is a queryset, filtered to completed ones. With
+    ``force``, cached images are rendered again.
+    """
+    jobs = {}
+    count = 0
+    for enrollment in completed_enrollments(enrollments).iterator(chunk_size=1000):
+        count += 1
+        content = certificate_content(enrollment)
+        digest = content_digest(content)
+        if digest in jobs:
+            continue
+        path = certificate_path(digest)
+        if force or not path.exists():
+            jobs[digest] = (digest, content, str(path))
+    if not jobs:
+        return count, 0
+
+    workers = (
+        workers or getattr(settings, "CERTIFICATE_WORKERS", None) or os.cpu_count()
+    )
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rendered = sum(
+            1 for _ in executor.map(_render_job, jobs.values(), chunksize=chunksize)
+        )
+    return count, rendered
@@ -0,0 +1,310 @@
+"""
+Course cloning and version snapshots.
+
+clone_course copies a course with its tags, lessons, assignments and test
+cases in one transaction. The originals are read with values() rather than
+as model instances, and every table gets one bulk_create, so the query
+count does not depend on the course size. Media files (course image, lesson
+videos and PDFs) are shared by reference: the copy stores the same storage
+name and no bytes are duplicated.
+
+snapshot_course freezes a course's content into a CourseVersion. Every
+enrollment is pinned to a snapshot taken when it is created
+(enroll_student), and the lesson and assignment pages show a pinned
+student that version instead of the live rows. A running cohort therefore
+keeps seeing the content it started with while the instructor edits the
+live course. Enrollments that predate versioning are pinned to a snapshot
+of the unedited course just before its first edit (pin_enrollments, from
+the signals). Versions are never updated in place; an unchanged course
+reuses its latest version instead of creating a duplicate.
+
+Taking a snapshot reads and hashes the whole course, which is too much
+work for every enrollment. The version an enrollment gets is therefore kept
+in the INVALIDATION_CACHE cache under course_version:<course id>, and the
+signals publish that key on the invalidation bus whenever the content
+changes (forget_version). A snapshot is marked pending in the cache
+before it reads anything. It is cached afterwards only if the mark is
+still there, i.e. no edit evicted it in between. Another worker sees an
+edit at its next bus poll, so an enrollment there can be pinned to the
+previous version for up to INVALIDATION_POLL_INTERVAL seconds.
+
+Media files are stored by name, so a version shows the current file of a
+lesson if the file itself is replaced under the same name.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+
+from .invalidation import bus
+from .models import (
+    Assignment,
+    AssignmentTestCase,
+    Course,
+    CourseVersion,
+    Enrollment,
+    Lesson,
+)
+
+BATCH_SIZE = 500
+
+LESSON_FIELDS = (
+    "title",
+    "description",
+    "video_url",
+    "video_file",
+    "pdf_file",
+    "order",
+)
+ASSIGNMENT_FIELDS = ("title", "description", "due_date", "max_score", "weight")
+TEST_CASE_FIELDS = ("name", "stdin", "expected_output", "points", "order")
+
+# Seconds a course's current version is remembered; edits evict it sooner.
+VERSION_CACHE_TIMEOUT = 3600
+
+
+def copy_rows(model, rows, parent_field, parent_ids, fields, shift=None):
+    """bulk_create copies of ``rows`` (values() dicts with "pk" and
+    "parent"); return {old pk: new pk}."""
+    objects = []
+    for row in rows:
+        data = {field: row[field] for field in fields}
+        if shift and "due_date" in data:
+            data["due_date"] += shift
+        objects.append(model(**{parent_field: parent_ids[row["parent"]]}, **data))
+    created = model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    if objects and created[0].pk is None:
+        # Backends that cannot return ids from bulk inserts: ids are
+        # assigned in insertion order.
+        new_ids = list(
+            model.objects.filter(
+                **{f"{parent_field}__in": set(parent_ids.values())}
+            )
+            .order_by("-pk")
+            .values_list("pk", flat=True)[: len(objects)]
+        )[::-1]
+    else:
+        new_ids = [obj.pk for obj in created]
+    return {row["pk"]: new_id for row, new_id in zip(rows, new_ids)}
+
+
+def clone_course(course, title=None, instructor=None, shift=None, published=False):
+    """Copy ``course`` and its content; return the new Course.
+
+    ``shift`` (a timedelta) moves every assignment due date, e.g. by one
+    term. The copy is unpublished unless ``published`` is true.
+    """
+    with transaction.atomic():
+        clone = Course.objects.create(
+            title=title or f"{course.title} (copy)",
+            description=course.description,
+            instructor=instructor or course.instructor,
+            category_id=course.category_id,
+            price=course.price,
+            image=course.image.name if course.image else None,
+            published=published,
+        )
+        # Through tags.set() so the m2m signals update the catalog indexes.
+        clone.tags.set(course.tags.values_list("pk", flat=True))
+
+        lessons = list(
+            Lesson.objects.filter(course=course)
+            .order_by("pk")
+            .values("pk", "course", *LESSON_FIELDS)
+        )
+        for row in lessons:
+            row["parent"] = row["course"]
+        lesson_ids = copy_rows(
+            Lesson, lessons, "course_id", {course.pk: clone.pk}, LESSON_FIELDS
+        )
+
+        assignments = list(
+            Assignment.objects.filter(lesson__course=course)
+            .order_by("pk")
+            .values("pk", "lesson", *ASSIGNMENT_FIELDS)
+        )
+        for row in assignments:
+            row["parent"] = row["lesson"]
+        assignment_ids = copy_rows(
+            Assignment,
+            assignments,
+            "lesson_id",
+            lesson_ids,
+            ASSIGNMENT_FIELDS,
+            shift=shift,
+        )
+
+        cases = list(
+            AssignmentTestCase.objects.filter(assignment__lesson__course=course)
+            .order_by("pk")
+            .values("pk", "assignment", *TEST_CASE_FIELDS)
+        )
+        for row in cases:
+            row["parent"] = row["assignment"]
+        copy_rows(
+            AssignmentTestCase,
+            cases,
+            "assignment_id",
+            assignment_ids,
+            TEST_CASE_FIELDS,
+        )
+    return clone
+
+
+def course_content(course):
+    """JSON-serialisable dict of everything a cohort sees in ``course``."""
+    assignments = {}
+    for row in (
+        Assignment.objects.filter(lesson__course=course)
+        .order_by("due_date", "pk")
+        .values("pk", "lesson", *ASSIGNMENT_FIELDS)
+    ):
+        assignments.setdefault(row.pop("lesson"), []).append(
+            {"id": row.pop("pk"), **row}
+        )
+    lessons = []
+    for row in Lesson.objects.filter(course=course).values("pk", *LESSON_FIELDS):
+        pk = row.pop("pk")
+        lessons.append({"id": pk, **row, "assignments": assignments.get(pk, [])})
+    return {
+        "title": course.title,
+        "description": course.description,
+        "price": course.price,
+        "category": course.category.name,
+        "tags": sorted(course.tags.values_list("name", flat=True)),
+        "image": course.image.name if course.image else "",
+        "lessons": lessons,
+    }
+
+
+def snapshot_course(course):
+    """Return (version, created) for the current content of ``course``."""
+    content = course_content(course)
+    # Round-trip through JSON so the stored content and the hash agree.
+    encoded = json.dumps(content, cls=DjangoJSONEncoder, sort_keys=True)
+    content_hash = hashlib.sha256(encoded.encode()).hexdigest()
+    # The insert is tried with the next number and retried when a concurrent
+    # snapshot took it, rather than reading under a lock first: on SQLite a
+    # transaction that reads before it writes fails with "database is
+    # locked" instead of waiting for the other writer.
+    while True:
+        latest = (
+            CourseVersion.objects.filter(course=course)
+            .only("pk", "number", "content_hash")
+            .first()
+        )
+        if latest is not None and latest.content_hash == content_hash:
+            return latest, False
+        try:
+            with transaction.atomic():
+                version = CourseVersion.objects.create(
+                    course=course,
+                    number=latest.number + 1 if latest else 1,
+                    content=json.loads(encoded),
+                    content_hash=content_hash,
+                )
+        except IntegrityError:
+            continue
+        return version, True
+
+
+def _version_key(course_id):
+    return f"course_version:{course_id}"
+
+
+def forget_version(*course_ids):
+    """Drop the cached current version of the courses in every process."""
+    bus.publish(*(_version_key(course_id) for course_id in course_ids))
+
+
+def enrollment_version_id(course):
+    """Id of the version a new enrollment is pinned to: the content as it
+    is now."""
+    alias = getattr(settings, "INVALIDATION_CACHE", "default")
+    if not alias:
+        return snapshot_course(course)[0].pk
+    cache = caches[alias]
+    key = _version_key(course.pk)
+    cached = cache.get(key)
+    if isinstance(cached, int):
+        return cached
+    # Fails when another snapshot is pending; then only that one is cached.
+    token = uuid.uuid4().hex
+    cache.add(key, token, VERSION_CACHE_TIMEOUT)
+    version_id = snapshot_course(course)[0].pk
+    if cache.get(key) == token:
+        cache.set(key, version_id, VERSION_CACHE_TIMEOUT)
+    return version_id
+
+
+def enroll_student(student, course):
+    """Return (enrollment, created), pinning a new one to the current content.
+
+    The version is looked up before get_or_create opens its transaction, so
+    that transaction only writes.
+    """
+    enrollment = Enrollment.objects.filter(student=student, course=course).first()
+    if enrollment is not None:
+        return enrollment, False
+    return Enrollment.objects.get_or_create(
+        student=student,
+        course=course,
+        defaults={"version_id": enrollment_version_id(course)},
+    )
+
+
+def pin_enrollments(course_id):
+    """Pin the course's unversioned enrollments to its current content.
+
+    Called before an edit, so they keep the content they enrolled in.
+    """
+    unpinned = Enrollment.objects.filter(course_id=course_id, version__isnull=True)
+    if unpinned.exists():
+        course = Course.objects.select_related("category").get(pk=course_id)
+        unpinned.update(version=snapshot_course(course)[0])
+
+
+def _from_content(model, row, **related):
+    # Unsaved instance with a snapshot row's values, for the templates.
+    values = {
+        name: model._meta.get_field(name).to_python(value)
+        for name, value in row.items()
+        if name not in ("id", "assignments")
+    }
+    return model(pk=row["id"], **related, **values)
+
+
+def pinned_lessons(version, course):
+    """The lessons of ``version`` as unsaved Lesson instances, in order."""
+    return [
+        _from_content(Lesson, row, course=course) for row in version.content["lessons"]
+    ]
+
+
+def pinned_lesson(version, pk, course):
+    """Lesson ``pk`` as ``version`` has it: (lesson, assignments, position,
+    lesson count), or None if the lesson is not part of the version."""
+    rows = version.content["lessons"]
+    for position, row in enumerate(rows, 1):
+        if row["id"] == pk:
+            pinned = _from_content(Lesson, row, course=course)
+            assignments = [
+                _from_content(Assignment, assignment, lesson=pinned)
+                for assignment in row["assignments"]
+            ]
+            return pinned, assignments, position, len(rows)
+    return None
+
+
+def pinned_assignment(version, pk, course):
+    """Assignment ``pk`` as ``version`` has it, or None if not part of it."""
+    for row in version.content["lessons"]:
+        for assignment_row in row["assignments"]:
+            if assignment_row["id"] == pk:
+                lesson = _from_content(Lesson, row, course=course)
+                return _from_content(Assignment, assignment_row, lesson=lesson)
+    return None
@@ -0,0 +1,133 @@
+"""
+Conditional GET and cache headers for the public catalog pages.
+
+Course.updated_date is bumped whenever a course's lessons, reviews or tags
+change (see signals.py) and when rebuild_recommendations changes its
+"Students also enrolled in" list, so it doubles as the last-modified time of
+everything rendered on the catalog pages. A course page also shows its
+recommended courses, so their newest updated_date counts as well.
+
+Anonymous visitors get a page that only depends on the URL, so it is marked
+``public`` and carries Last-Modified; shared caches and CDNs may serve it for
+CATALOG_CACHE_MAX_AGE seconds. Logged-in users see their own navigation,
+enrollment and CSRF token, so their responses are ``private, no-cache`` and
+the ETag mixes in the user, the CSRF token and (for course pages) their
+enrollment. Either way the origin answers repeat requests with a 304 without
+rendering the template.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import Course, CourseRecommendation, Enrollment
+from .reference import reference_data
+
+
+def course_list_state(request):
+    state = Course.objects.filter(published=True).aggregate(
+        last_modified=Max("updated_date"), count=Count("pk")
+    )
+    # The filter dropdowns list every category, tag and instructor.
+    reference = reference_data.get().version
+    return state["last_modified"], [state["count"], reference]
+
+
+def course_detail_state(request, pk):
+    recommended = (
+        CourseRecommendation.objects.filter(course=OuterRef("pk"))
+        .values("course")
+        .annotate(last=Max("recommended__updated_date"))
+        .values("last")
+    )
+    row = (
+        Course.objects.filter(pk=pk, published=True)
+        .annotate(students=Count("enrollments"), recommended=Subquery(recommended))
+        .values_list("updated_date", "students", "recommended")
+        .first()
+    )
+    if row is None:
+        return None
+    last_modified, students, recommended = row
+    if recommended is not None:
+        last_modified = max(last_modified, recommended)
+    parts = [students]
+    if request.user.is_authenticated and request.user.role == "student":
+        parts.extend(
+            Enrollment.objects.filter(
+                course_id=pk, student__user=request.user
+            ).values_list("pk", "progress", "completed", "version_id")
+        )
+    return last_modified, parts
+
+
+def _has_pending_messages(request):
+    return len(messages.get_messages(request)) > 0
+
+
+def catalog_cache(state_func):
+    """Add ETag/Last-Modified handling and Cache-Control to a catalog view.
+
+    ``state_func(request, *args, **kwargs)`` returns ``(last_modified, parts)``
+    describing the rendered content, or None if the object does not exist.
+    """
+
+    def get_state(request, *args, **kwargs):
+        if not hasattr(request, "_catalog_state"):
+            if request.method not in ("GET", "HEAD") or _has_pending_messages(
+                request
+            ):
+                # A page carrying one-off messages must always be rendered.
+                request._catalog_state = None
+            else:
+                request._catalog_state = state_func(request, *args, **kwargs)
+        return request._catalog_state
+
+    def etag(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        if state is None:
+            return None
+        last_modified, parts = state
+        key = [request.get_full_path(), str(last_modified), *parts]
+        if request.user.is_authenticated:
+            key += [
+                request.user.pk,
+                request.user.role,
+                request.META.get("CSRF_COOKIE", ""),
+            ]
+        return hashlib.md5(repr(key).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        if state is None or request.user.is_authenticated:
+            return None
+        return state[0]
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag, last_modified_func=last_modified
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            if request.user.is_authenticated or request._catalog_state is None:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response,
+                    public=True,
+                    max_age=getattr(settings, "CATALOG_CACHE_MAX_AGE", 60),
+                )
+            patch_vary_headers(response, ["Cookie"])
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,143 @@
+"""
+Weighted course grades.
+
+Each (course, student) pair has a CourseGrade row with two running sums
+over the student's graded assignments:
+
+    earned         = sum(weight * score / max_score)
+    graded_weight  = sum(weight)
+
+Grading a submission changes both sums by that assignment's share, so
+apply_changes() turns a batch of (student, assignment, old score, new
+score) changes into at most one UPDATE ... SET earned = earned + x per
+affected row. It never reads the student's other submissions. A gradebook
+is then a plain read of CourseGrade, ordered and paginated in SQL.
+
+When an assignment's weight or max_score changes, every student's share
+of it changes. recompute_course() then rebuilds the course's rows from one
+grouped aggregate over its graded submissions. Deleting an assignment needs
+no recompute: its submissions are deleted first and each delete subtracts
+its share. Float sums drift slightly over many updates; a recompute (the
+recompute_course_grades command) resets them.
+"""
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Sum
+from django.db.models.functions import Cast, NullIf
+
+from .models import Assignment, CourseGrade, Submission
+
+
+def _share(score, weight, max_score):
+    return weight * score / max_score
+
+
+def apply_changes(changes, create=True):
+    """Fold (student id, assignment id, old score, new score) changes in.
+
+    A score of None means "not graded". With ``create`` false, missing
+    CourseGrade rows are not created (deletes may be part of deleting the
+    course or the student).
+    """
+    changes = [change for change in changes if change[2] != change[3]]
+    if not changes:
+        return
+    assignments = {
+        pk: (course_id, weight, max_score)
+        for pk, course_id, weight, max_score in Assignment.objects.filter(
+            pk__in={assignment_id for _, assignment_id, _, _ in changes}
+        ).values_list("pk", "lesson__course_id", "weight", "max_score")
+    }
+    deltas = {}
+    for student_id, assignment_id, old, new in changes:
+        if assignment_id not in assignments:
+            continue
+        course_id, weight, max_score = assignments[assignment_id]
+        if not max_score:
+            continue
+        earned, graded_weight = deltas.get((course_id, student_id), (0.0, 0))
+        if old is not None:
+            earned -= _share(old, weight, max_score)
+            graded_weight -= weight
+        if new is not None:
+            earned += _share(new, weight, max_score)
+            graded_weight += weight
+        deltas[course_id, student_id] = (earned, graded_weight)
+    if not deltas:
+        return
+    with transaction.atomic():
+        if create:
+            CourseGrade.objects.bulk_create(
+                [
+                    CourseGrade(course_id=course_id, student_id=student_id)
+                    for course_id, student_id in deltas
+                ],
+                ignore_conflicts=True,
+            )
+        for (course_id, student_id), (earned, graded_weight) in deltas.items():
+            CourseGrade.objects.filter(
+                course_id=course_id, student_id=student_id
+            ).update(
+                earned=F("earned") + earned,
+                graded_weight=F("graded_weight") + graded_weight,
+            )
+
+
+def recompute_course(course_id):
+    """Rebuild a course's grades set-wise; return the number of students."""
+    totals = (
+        Submission.objects.filter(
+            assignment__lesson__course_id=course_id,
+            assignment__max_score__gt=0,
+            graded=True,
+            score__isnull=False,
+        )
+        .values("student_id")
+        .annotate(
+            earned=Sum(
+                Cast("score", FloatField())
+                * F("assignment__weight")
+                / F("assignment__max_score"),
+                output_field=FloatField(),
+            ),
+            graded_weight=Sum("assignment__weight"),
+        )
+        .order_by()
+    )
+    grades = [
+        CourseGrade(
+            course_id=course_id,
+            student_id=row["student_id"],
+            earned=row["earned"],
+            graded_weight=row["graded_weight"],
+        )
+        for row in totals
+    ]
+    with transaction.atomic():
+        CourseGrade.objects.filter(course_id=course_id).delete()
+        CourseGrade.objects.bulk_create(grades, batch_size=1000)
+    return len(grades)
+
+
+def course_weight(course):
+    """Total weight of all assignments in ``course``."""
+    return (
+        Assignment.objects.filter(lesson__course=course).aggregate(
+            total=Sum("weight")
+        )["total"]
+        or 0
+    )
+
+
+def gradebook(course):
+    """CourseGrade rows of ``course`` with ``grade`` (percent), best first."""
+    return (
+        CourseGrade.objects.filter(course=course)
+        .select_related("student__user")
+        .annotate(
+            grade=ExpressionWrapper(
+                100 * F("earned") / NullIf(Cast("graded_weight", FloatField()), 0),
+                output_field=FloatField(),
+            )
+        )
+        .order_by(F("grade").desc(nulls_last=True), "student__user__username")
+    )
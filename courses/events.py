@@ -0,0 +1,319 @@
+"""
+Append-only learning event log.
+
+Views call record() for enrollments, lesson views, submissions, grades and
+reviews. Events go into an in-memory buffer and are written out in batches:
+when the buffer reaches EVENT_LOG_BATCH_SIZE, or EVENT_LOG_FLUSH_INTERVAL
+seconds after the first unflushed event, whichever comes first. Nothing
+touches the disk or the database on the request path otherwise.
+
+Storage is one directory per UTC day under EVENT_LOG_DIR::
+
+    2024-05-01/segment-<pid>-<n>.jsonl   appended to by one process
+    2024-05-01/sealed-<pid>-<n>.jsonl    a segment taken over by compact_day
+    2024-05-01/compacted.jsonl.gz        produced by compact_day
+
+Every line is one JSON object with at least ``ts`` (ISO 8601 UTC, fixed
+width, so string order is time order), ``type`` and ``user``. Each process
+appends to its own segments, so writers never interleave. compact_day
+merges a finished day's segments into one sorted, gzipped file.
+
+A worker can still append to a day's segment after midnight (a late
+flush) or be in the middle of a write when compaction starts. So each
+batch is written under a shared flock, and the writer checks that the
+descriptor it locked is still the file at the segment's path. compact_day
+first seals a segment: it renames it to sealed-* and then takes the
+exclusive lock, which waits for a write already under way. A writer that
+comes later finds the path gone and starts a new segment under the old
+name, which the next compaction picks up. A sealed file whose last line is
+incomplete (a writer died mid-write) is left in place; its complete lines
+are still read.
+
+read_events walks days in order and merges the files of each day lazily
+with heapq.merge. Memory use depends on the number of files per day, not on
+the number of events, so a month can be scanned as a stream.
+"""
+import atexit
+import fcntl
+import gzip
+import heapq
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+
+ENROLL = "enroll"
+LESSON_VIEW = "lesson_view"
+SUBMISSION = "submission"
+GRADE = "grade"
+REVIEW = "review"
+EVENT_TYPES = (ENROLL, LESSON_VIEW, SUBMISSION, GRADE, REVIEW)
+
+COMPACTED = "compacted.jsonl.gz"
+SEGMENT_PREFIX = "segment-"
+SEALED_PREFIX = "sealed-"
+# Segments are rolled over after this many bytes.
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _now():
+    return datetime.now(dt_timezone.utc).isoformat(timespec="microseconds")
+
+
+class EventLog:
+    def __init__(self, directory=None, batch_size=None, flush_interval=None):
+        self._directory = directory
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._segments = {}
+        self._sequence = 0
+        self._pid = None
+
+    @property
+    def directory(self):
+        return str(self._directory or settings.EVENT_LOG_DIR)
+
+    @property
+    def batch_size(self):
+        return self._batch_size or settings.EVENT_LOG_BATCH_SIZE
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval or settings.EVENT_LOG_FLUSH_INTERVAL
+
+    def record(self, event_type, user, **data):
+        """Buffer one event. ``user`` is a User, a user id or None."""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type {event_type!r}.")
+        if not settings.EVENT_LOG_ENABLED:
+            return
+        event = {
+            "ts": _now(),
+            "type": event_type,
+            "user": getattr(user, "pk", user),
+            **data,
+        }
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write buffered events out; return how many were written."""
+        with self._lock:
+            events, self._buffer = self._buffer, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not events:
+            return 0
+        days = {}
+        for event in events:
+            days.setdefault(event["ts"][:10], []).append(event)
+        with self._write_lock:
+            for day, day_events in days.items():
+                self._append(day, day_events)
+        return len(events)
+
+    def _append(self, day, events):
+        data = "".join(
+            json.dumps(event, separators=(",", ":"), default=str) + "\n"
+            for event in events
+        ).encode()
+        if self._pid != os.getpid():
+            # Forked workers must not share their parent's segments.
+            self._pid, self._segments, self._sequence = os.getpid(), {}, 0
+        path = self._segments.get(day)
+        if path is None or (
+            os.path.exists(path) and os.path.getsize(path) >= SEGMENT_MAX_BYTES
+        ):
+            os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+            self._sequence += 1
+            path = os.path.join(
+                self.directory,
+                day,
+                f"{SEGMENT_PREFIX}{self._pid}-{int(time.time())}"
+                f"-{self._sequence}.jsonl",
+            )
+            self._segments = {
+                segment_day: segment
+                for segment_day, segment in self._segments.items()
+                if segment_day >= day
+            }
+            self._segments[day] = path
+        _write_segment(path, data)
+
+
+def _same_file(fd, path):
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(fd)
+    return (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino)
+
+
+def _write_segment(path, data):
+    # One write per batch on an O_APPEND descriptor, under a shared lock so
+    # compact_day can wait for it. If the segment was sealed between open()
+    # and the lock, the batch goes into a fresh file at the same path.
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            if _same_file(fd, path):
+                os.write(fd, data)
+                return
+        finally:
+            os.close(fd)
+
+
+event_log = EventLog()
+atexit.register(event_log.flush)
+
+
+def record(event_type, user, **data):
+    event_log.record(event_type, user, **data)
+
+
+def _day_files(day_dir):
+    try:
+        names = sorted(os.listdir(day_dir))
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(day_dir, name)
+        for name in names
+        if name == COMPACTED
+        or (
+            name.startswith((SEGMENT_PREFIX, SEALED_PREFIX))
+            and name.endswith(".jsonl")
+        )
+    ]
+
+
+def _read_file(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                # A batch still being written; it is read next time.
+                break
+            yield json.loads(line)
+
+
+def _ts_key(event):
+    return event["ts"]
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc).date()
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def _day_range(start, end):
+    day = _as_date(start)
+    end = _as_date(end) if end is not None else datetime.now(dt_timezone.utc).date()
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def read_events(start, end=None, types=None, directory=None, **filters):
+    """Yield events from ``start`` to ``end`` (dates, inclusive) in time order.
+
+    ``types`` limits the event types; other keyword arguments match event
+    fields exactly, e.g. ``course=3`` or ``user=12``. Events still in a
+    worker's buffer are not included.
+    """
+    directory = str(directory or settings.EVENT_LOG_DIR)
+    types = set(types) if types else None
+    for day in _day_range(start, end):
+        files = _day_files(os.path.join(directory, day.isoformat()))
+        for event in heapq.merge(*map(_read_file, files), key=_ts_key):
+            if types is not None and event["type"] not in types:
+                continue
+            if any(event.get(key) != value for key, value in filters.items()):
+                continue
+            yield event
+
+
+def event_days(directory=None):
+    """Sorted dates that have an event directory."""
+    directory = str(directory or settings.EVENT_LOG_DIR)
+    days = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        try:
+            days.append(date.fromisoformat(name))
+        except ValueError:
+            continue
+    return sorted(days)
+
+
+def _seal(path):
+    """Rename a segment away from its writer; return the new path once no
+    write to it is in progress."""
+    head, name = os.path.split(path)
+    sealed = os.path.join(head, SEALED_PREFIX + name[len(SEGMENT_PREFIX) :])
+    os.rename(path, sealed)
+    with open(sealed, "rb") as f:
+        # Waits for a writer that locked the file before the rename.
+        fcntl.flock(f, fcntl.LOCK_EX)
+    return sealed
+
+
+def _ends_complete(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def compact_day(day, directory=None):
+    """Merge a day's files into one sorted gzip file.
+
+    Returns the number of events in it, or None if there was nothing to
+    compact. Segments are sealed first, so a late flush into the same day
+    lands in a new segment and is kept for next time.
+    """
+    directory = str(directory or settings.EVENT_LOG_DIR)
+    day_dir = os.path.join(directory, _as_date(day).isoformat())
+    target = os.path.join(day_dir, COMPACTED)
+    sealed = []
+    for path in _day_files(day_dir):
+        name = os.path.basename(path)
+        if name.startswith(SEGMENT_PREFIX):
+            sealed.append(_seal(path))
+        elif name.startswith(SEALED_PREFIX):
+            # Left by a compaction that was interrupted.
+            sealed.append(path)
+    sealed = [path for path in sealed if _ends_complete(path)]
+    if not sealed:
+        return None
+    files = ([target] if os.path.exists(target) else []) + sealed
+    count = 0
+    with gzip.open(target + ".tmp", "wt", encoding="utf-8") as out:
+        for event in heapq.merge(*map(_read_file, files), key=_ts_key):
+            out.write(json.dumps(event, separators=(",", ":")) + "\n")
+            count += 1
+    os.replace(target + ".tmp", target)
+    for path in sealed:
+        os.remove(path)
+    return count
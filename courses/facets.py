@@ -0,0 +1,235 @@
+"""
+In-memory facet index for the published course catalog.
+
+Every facet value (a category, tag or instructor) maps to a bitset of the
+ids of published courses carrying it; the bitsets are plain Python ints
+with bit ``course.pk`` set. Prices are kept as a sorted list so a range
+becomes a bisect. A catalog query is then a handful of AND/OR operations on
+ints, and each facet count is the popcount of one intersection. No query
+hits the database except to fetch the final page of courses.
+
+The index is built lazily per process and refreshed incrementally from the
+signals in signals.py. As a safety net against changes made by other
+processes, it is rebuilt after FACET_INDEX_TTL seconds. Facet labels are
+not part of the index; they come from the shared reference data cache
+(reference.py), which tracks changes across processes.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from .models import Course
+from .reference import reference_data
+
+FACETS = ("category", "tag", "instructor")
+# ReferenceData attribute holding each facet's labels.
+LABELS = {"category": "categories", "tag": "tags", "instructor": "instructors"}
+
+
+_popcount = getattr(int, "bit_count", None) or (lambda bits: bin(bits).count("1"))
+
+
+def _ids(bits):
+    """Positions of the set bits, i.e. the course ids in a bitset."""
+    return [pk for pk, bit in enumerate(reversed(bin(bits)[2:])) if bit == "1"]
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.built_at = 0.0
+        self.all_bits = 0
+        self.postings = {facet: defaultdict(int) for facet in FACETS}
+        # course id -> (category id, tag ids, instructor id, price)
+        self.courses = {}
+        # (price, course id), sorted
+        self.prices = []
+
+    # Building -----------------------------------------------------------
+
+    def build(self):
+        index = FacetIndex()
+        rows = Course.objects.filter(published=True).values_list(
+            "pk", "category_id", "instructor_id", "price"
+        )
+        tags = defaultdict(set)
+        for course_id, tag_id in Course.tags.through.objects.filter(
+            course__published=True
+        ).values_list("course_id", "tag_id"):
+            tags[course_id].add(tag_id)
+        for pk, category_id, instructor_id, price in rows:
+            index._add(pk, category_id, frozenset(tags[pk]), instructor_id, price)
+        index.built_at = time.monotonic()
+        with self._lock:
+            self.__dict__.update(
+                {k: v for k, v in index.__dict__.items() if k != "_lock"}
+            )
+
+    def _add(self, pk, category_id, tag_ids, instructor_id, price):
+        bit = 1 << pk
+        self.all_bits |= bit
+        self.postings["category"][category_id] |= bit
+        self.postings["instructor"][instructor_id] |= bit
+        for tag_id in tag_ids:
+            self.postings["tag"][tag_id] |= bit
+        bisect.insort(self.prices, (price, pk))
+        self.courses[pk] = (category_id, tag_ids, instructor_id, price)
+
+    def _remove(self, pk):
+        entry = self.courses.pop(pk, None)
+        if entry is None:
+            return
+        category_id, tag_ids, instructor_id, price = entry
+        mask = ~(1 << pk)
+        self.all_bits &= mask
+        self.postings["category"][category_id] &= mask
+        self.postings["instructor"][instructor_id] &= mask
+        for tag_id in tag_ids:
+            self.postings["tag"][tag_id] &= mask
+        position = bisect.bisect_left(self.prices, (price, pk))
+        if position < len(self.prices) and self.prices[position] == (price, pk):
+            del self.prices[position]
+
+    # Incremental updates (called from signals) --------------------------
+
+    def refresh_course(self, pk):
+        if not self.built_at:
+            return
+        row = (
+            Course.objects.filter(pk=pk, published=True)
+            .values_list("category_id", "instructor_id", "price")
+            .first()
+        )
+        tag_ids = (
+            frozenset(
+                Course.tags.through.objects.filter(course_id=pk).values_list(
+                    "tag_id", flat=True
+                )
+            )
+            if row
+            else frozenset()
+        )
+        with self._lock:
+            self._remove(pk)
+            if row:
+                category_id, instructor_id, price = row
+                self._add(pk, category_id, tag_ids, instructor_id, price)
+
+    # Querying -----------------------------------------------------------
+
+    def ensure_fresh(self):
+        ttl = getattr(settings, "FACET_INDEX_TTL", 300)
+        if not self.built_at or time.monotonic() - self.built_at > ttl:
+            self.build()
+
+    def _price_bits(self, min_price, max_price):
+        if min_price is None and max_price is None:
+            return None
+        lo = (
+            0 if min_price is None else bisect.bisect_left(self.prices, (min_price,))
+        )
+        hi = (
+            len(self.prices)
+            if max_price is None
+            else bisect.bisect_right(self.prices, (max_price, float("inf")))
+        )
+        bits = 0
+        for _, pk in self.prices[lo:hi]:
+            bits |= 1 << pk
+        return bits
+
+    def search(
+        self,
+        categories=(),
+        tags=(),
+        instructors=(),
+        tag_mode="or",
+        min_price=None,
+        max_price=None,
+    ):
+        """Return (matching course ids, facet counts).
+
+        Values within a facet are ORed, except tags with ``tag_mode="and"``;
+        different facets are ANDed. Counts follow the usual multi-select
+        rule: a facet's counts apply every filter except its own, so the
+        user can see what widening that facet would add. With AND tags the
+        tag counts do include the tag filter, showing what narrowing gives.
+        """
+        self.ensure_fresh()
+        reference = reference_data.get()
+        with self._lock:
+            filters = {}
+            if categories:
+                filters["category"] = self._union("category", categories)
+            if instructors:
+                filters["instructor"] = self._union("instructor", instructors)
+            if tags:
+                if tag_mode == "and":
+                    bits = self.all_bits
+                    for tag_id in tags:
+                        bits &= self.postings["tag"].get(tag_id, 0)
+                else:
+                    bits = self._union("tag", tags)
+                filters["tag"] = bits
+            price_bits = self._price_bits(min_price, max_price)
+
+            base = self.all_bits if price_bits is None else self.all_bits & price_bits
+            result = base
+            for bits in filters.values():
+                result &= bits
+
+            counts = {}
+            for facet in FACETS:
+                labels = getattr(reference, LABELS[facet])
+                facet_base = base
+                for name, bits in filters.items():
+                    if name != facet or (facet == "tag" and tag_mode == "and"):
+                        facet_base &= bits
+                counts[facet] = {
+                    value: _popcount(facet_base & bits)
+                    for value, bits in self.postings[facet].items()
+                    if value in labels
+                }
+            return _ids(result), counts
+
+    def _union(self, facet, values):
+        bits = 0
+        for value in values:
+            bits |= self.postings[facet].get(value, 0)
+        return bits
+
+    def options(self, facet, counts, selected=()):
+        """(id, label, count, selected) tuples for rendering a facet."""
+        labels = getattr(reference_data.get(), LABELS[facet])
+        return [
+            (value, label, counts.get(value, 0), value in selected)
+            for value, label in labels.items()
+        ]
+
+
+def parse_ids(values):
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def parse_price(value):
+    if not value:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        return None
+    # NaN and Infinity parse but can't be compared with prices.
+    return price if price.is_finite() else None
+
+
+catalog_index = FacetIndex()
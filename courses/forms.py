@@ -8,6 +8,7 @@ from .models import (
     Course,
     Lesson,
     Assignment,
+    AssignmentTestCase,
     Submission,
     Review,
 )
@@ -54,12 +55,15 @@ class LessonForm(forms.ModelForm):
         widgets = {
             "description": forms.Textarea(attrs={"rows": 3}),
         }
+        help_texts = {
+            "order": "Leave at 0 to add the lesson after the existing ones.",
+        }
 
 
 class AssignmentForm(forms.ModelForm):
     class Meta:
         model = Assignment
-        fields = ["title", "description", "due_date", "max_score"]
+        fields = ["title", "description", "due_date", "max_score", "weight"]
         widgets = {
             "description": forms.Textarea(attrs={"rows": 4}),
             "due_date": forms.DateTimeInput(attrs={"type": "datetime-local"}),
@@ -99,3 +103,23 @@ class GradeSubmissionForm(forms.ModelForm):
         widgets = {
             "feedback": forms.Textarea(attrs={"rows": 4}),
         }
+
+
+class AssignmentTestCaseForm(forms.ModelForm):
+    class Meta:
+        model = AssignmentTestCase
+        fields = ["name", "stdin", "expected_output", "points", "order"]
+        widgets = {
+            "stdin": forms.Textarea(attrs={"rows": 3}),
+            "expected_output": forms.Textarea(attrs={"rows": 3}),
+        }
+
+
+class CloneCourseForm(forms.Form):
+    title = forms.CharField(max_length=200)
+    shift_days = forms.IntegerField(
+        initial=0,
+        label="Shift due dates by (days)",
+        help_text="Moves every assignment due date, e.g. 112 for the next term.",
+    )
+    published = forms.BooleanField(required=False)
@@ -0,0 +1,270 @@
+"""
+Incremental grade statistics per assignment.
+
+Every assignment has one AssignmentGradeStats row holding the count, sum
+and sum of squares of its graded scores, plus a histogram with one cell per
+integer score. Scores are whole points, so the histogram is exact: mean,
+standard deviation, percentiles and a student's rank all come from that row
+and never from a scan of the submissions.
+
+Rows are changed by apply_changes() with (assignment, old score, new
+score) triples, where None means "not graded". A regrade therefore moves
+one count between cells. Signals in signals.py feed single saves and
+deletes. The autograder's bulk_update sends no signals, so it calls
+previous_grades()/apply_changes() itself. rebuild_stats() recomputes
+everything with one grouped query; the rebuild_grade_stats command
+backfills existing data with it.
+"""
+import math
+from bisect import bisect_right
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Assignment, AssignmentGradeStats, Submission
+
+# Bars shown per histogram, each covering an equal share of max_score.
+HISTOGRAM_BINS = 10
+
+
+class GradeStats:
+    """Read-only statistics for one assignment."""
+
+    def __init__(self, max_score, count=0, total=0, total_squares=0, histogram=()):
+        self.max_score = max_score
+        self.count = count
+        self.total = total
+        self.total_squares = total_squares
+        self.histogram = list(histogram)
+
+    @classmethod
+    def from_row(cls, row, max_score):
+        if row is None:
+            return cls(max_score)
+        return cls(
+            max_score, row.count, row.total, row.total_squares, row.histogram
+        )
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return math.sqrt(max(0.0, self.total_squares / self.count - mean * mean))
+
+    @property
+    def mean_percent(self):
+        if not self.count or not self.max_score:
+            return None
+        return 100 * self.total / (self.count * self.max_score)
+
+    def percentile(self, fraction):
+        """Score at ``fraction`` (0-1) of the distribution, nearest rank."""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for score, count in enumerate(self.histogram):
+            seen += count
+            if seen >= target:
+                return score
+        return len(self.histogram) - 1
+
+    @property
+    def median(self):
+        return self.percentile(0.5)
+
+    def below(self, score):
+        return sum(self.histogram[: max(0, min(score, len(self.histogram)))])
+
+    def at(self, score):
+        return self.histogram[score] if 0 <= score < len(self.histogram) else 0
+
+    def rank(self, score):
+        """1 for the best score; ties share a rank."""
+        return self.count - self.below(score) - self.at(score) + 1
+
+    def percentile_rank(self, score):
+        """Share (0-100) of graded submissions below ``score``, ties halved."""
+        if not self.count:
+            return None
+        return 100 * (self.below(score) + self.at(score) / 2) / self.count
+
+    def bins(self, bins=HISTOGRAM_BINS):
+        """[(low, high, count)] over 0..max_score; high is inclusive."""
+        top = max(self.max_score, len(self.histogram) - 1, 1)
+        bins = min(bins, top + 1)
+        edges = [i * (top + 1) // bins for i in range(bins + 1)]
+        counts = [0] * bins
+        for score, count in enumerate(self.histogram):
+            if count:
+                counts[bisect_right(edges, score) - 1] += count
+        return [(edges[i], edges[i + 1] - 1, counts[i]) for i in range(bins)]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "max_score": self.max_score,
+            "mean": self.mean,
+            "stddev": self.stddev,
+            "median": self.median,
+            "p25": self.percentile(0.25),
+            "p75": self.percentile(0.75),
+            "p90": self.percentile(0.9),
+            "histogram": [
+                {"low": low, "high": high, "count": count}
+                for low, high, count in self.bins()
+            ],
+        }
+
+
+def _apply(row, old, new):
+    histogram = row.histogram
+    if old is not None:
+        row.count -= 1
+        row.total -= old
+        row.total_squares -= old * old
+        if old < len(histogram):
+            histogram[old] = max(0, histogram[old] - 1)
+    if new is not None:
+        row.count += 1
+        row.total += new
+        row.total_squares += new * new
+        if new >= len(histogram):
+            histogram.extend([0] * (new + 1 - len(histogram)))
+        histogram[new] += 1
+
+
+def apply_changes(changes, create=True):
+    """Fold (assignment id, old score, new score) triples into the stats.
+
+    With ``create`` false, assignments without a stats row are left alone
+    (used for deletes, which may be part of deleting the assignment).
+    """
+    by_assignment = {}
+    for assignment_id, old, new in changes:
+        if old != new:
+            by_assignment.setdefault(assignment_id, []).append((old, new))
+    if not by_assignment:
+        return
+    with transaction.atomic():
+        if create:
+            AssignmentGradeStats.objects.bulk_create(
+                [
+                    AssignmentGradeStats(assignment_id=pk)
+                    for pk in Assignment.objects.filter(
+                        pk__in=by_assignment
+                    ).values_list("pk", flat=True)
+                ],
+                ignore_conflicts=True,
+            )
+        rows = list(
+            AssignmentGradeStats.objects.select_for_update().filter(
+                assignment_id__in=by_assignment
+            )
+        )
+        now = timezone.now()
+        for row in rows:
+            for old, new in by_assignment[row.assignment_id]:
+                _apply(row, old, new)
+            row.updated_date = now
+        AssignmentGradeStats.objects.bulk_update(
+            rows, ["count", "total", "total_squares", "histogram", "updated_date"]
+        )
+
+
+def previous_grades(submission_ids):
+    """{submission id: (student id, assignment id, score or None)}."""
+    return {
+        pk: (student_id, assignment_id, score if graded else None)
+        for pk, student_id, assignment_id, graded, score in Submission.objects.filter(
+            pk__in=submission_ids
+        ).values_list("pk", "student_id", "assignment_id", "graded", "score")
+    }
+
+
+def rebuild_stats(assignments=None):
+    """Recompute stats from the submissions; return the number of rows."""
+    if assignments is None:
+        assignments = Assignment.objects.all()
+    rows = {}
+    counts = (
+        Submission.objects.filter(
+            assignment__in=assignments, graded=True, score__isnull=False
+        )
+        .values_list("assignment_id", "score")
+        .annotate(n=Count("pk"))
+        .order_by()
+    )
+    for assignment_id, score, n in counts:
+        row = rows.get(assignment_id)
+        if row is None:
+            row = rows[assignment_id] = AssignmentGradeStats(
+                assignment_id=assignment_id, histogram=[]
+            )
+        row.count += n
+        row.total += n * score
+        row.total_squares += n * score * score
+        if score >= len(row.histogram):
+            row.histogram.extend([0] * (score + 1 - len(row.histogram)))
+        row.histogram[score] += n
+    with transaction.atomic():
+        AssignmentGradeStats.objects.filter(assignment__in=assignments).delete()
+        AssignmentGradeStats.objects.bulk_create(rows.values(), batch_size=500)
+    return len(rows)
+
+
+def stats_for(assignments):
+    """{assignment id: GradeStats} for assignment instances, one query."""
+    assignments = list(assignments)
+    rows = AssignmentGradeStats.objects.in_bulk(
+        [assignment.pk for assignment in assignments]
+    )
+    return {
+        assignment.pk: GradeStats.from_row(
+            rows.get(assignment.pk), assignment.max_score
+        )
+        for assignment in assignments
+    }
+
+
+def course_stats(course):
+    """(assignments with a ``stats`` attribute, course summary dict).
+
+    The summary combines assignments by percentage of max_score: the mean
+    of all graded percentages and a histogram in HISTOGRAM_BINS steps.
+    """
+    assignments = list(
+        Assignment.objects.filter(lesson__course=course)
+        .select_related("lesson")
+        .order_by("lesson__order", "due_date", "pk")
+    )
+    stats = stats_for(assignments)
+    count = 0
+    percent_total = 0.0
+    bins = [0] * HISTOGRAM_BINS
+    for assignment in assignments:
+        assignment.stats = stats[assignment.pk]
+        max_score = assignment.max_score or 1
+        for score, n in enumerate(assignment.stats.histogram):
+            if not n:
+                continue
+            percent = 100 * score / max_score
+            count += n
+            percent_total += n * percent
+            bins[min(int(percent * HISTOGRAM_BINS // 100), HISTOGRAM_BINS - 1)] += n
+    step = 100 // HISTOGRAM_BINS
+    summary = {
+        "count": count,
+        "mean_percent": percent_total / count if count else None,
+        "bins": [
+            (i * step, 100 if i == HISTOGRAM_BINS - 1 else (i + 1) * step - 1, n)
+            for i, n in enumerate(bins)
+        ],
+    }
+    return assignments, summary
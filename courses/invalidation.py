@@ -0,0 +1,173 @@
+"""
+Cross-worker cache invalidation over the database.
+
+Each gunicorn worker keeps its own in-memory state: the catalog facet and
+autocomplete indexes and anything stored in the locmem Django cache. A
+change made in one worker used to reach the others only when their copy
+expired. Without Redis the one thing every worker on the box shares is the
+database, so the bus is a table.
+
+When the surrounding transaction commits, publish("course:12") evicts
+the key in this process and inserts one InvalidationEvent row. Evicting
+any earlier would let a request refill the cache from the pre-commit
+rows in between and keep them. Nothing is published for a rolled-back
+change. Every process polls the table at most every
+INVALIDATION_POLL_INTERVAL seconds, from InvalidationBusMiddleware at
+the start of a request. A poll is a single primary-key range query for
+rows newer than the last one it saw, so an idle bus costs one indexed
+query per worker per interval. For each new key the worker deletes it
+from the INVALIDATION_CACHE Django cache and calls the handlers
+subscribed to its prefix (the part before the colon) with the rest.
+Events a process published itself are skipped, because it evicted them
+on commit.
+
+Ids are assigned at insert time but become visible at commit, so on a
+database with concurrent writers a lower id can appear after a higher one
+was read. A poll therefore re-reads the last LOOKBACK ids and remembers
+which it already handled. SQLite serialises writers, so there it never
+matters.
+
+A process starts reading at the newest event at its first poll: it has
+just built its state from the database, so older events are already
+reflected. Events older than INVALIDATION_RETENTION seconds are deleted
+now and then by publishers. A worker that sleeps through the whole
+retention window misses those events, and its indexes catch up on their
+own TTL rebuild, so keep the retention well above any idle period that
+matters.
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import InvalidationEvent
+
+# Ids below the last one read that are read again, for late commits.
+LOOKBACK = 100
+# Most events one poll reads; a larger backlog is worked off over requests.
+BATCH_SIZE = 1000
+# Fraction of publishes that also delete expired events.
+PRUNE_CHANCE = 0.01
+
+
+class InvalidationBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers = {}
+        self._pid = None
+        self._origin = None
+        self._first_id = None
+        self._last_id = None
+        self._handled = deque(maxlen=LOOKBACK * 2)
+        self._polled_at = 0.0
+
+    @property
+    def origin(self):
+        # Per process: workers forked from a preloaded master must not share it.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._origin = f"{self._pid}-{uuid.uuid4().hex[:12]}"
+            self._first_id = self._last_id = None
+            self._handled.clear()
+        return self._origin
+
+    def subscribe(self, prefix, handler=None):
+        """Call ``handler(rest)`` for every remote key ``<prefix>:<rest>``.
+
+        Can be used as a decorator.
+        """
+        if handler is None:
+            return lambda handler: self.subscribe(prefix, handler)
+        self._handlers.setdefault(prefix, []).append(handler)
+        return handler
+
+    def publish(self, *keys):
+        """Evict ``keys`` here and in every other process after commit."""
+        if not keys:
+            return
+        origin = self.origin
+        transaction.on_commit(lambda: self._insert(keys, origin))
+
+    def _insert(self, keys, origin):
+        self._evict(keys)
+        InvalidationEvent.objects.bulk_create(
+            InvalidationEvent(key=key, origin=origin) for key in keys
+        )
+        if random.random() < PRUNE_CHANCE:
+            self.prune()
+
+    def prune(self):
+        retention = getattr(settings, "INVALIDATION_RETENTION", 86400)
+        cutoff = timezone.now() - timedelta(seconds=retention)
+        return InvalidationEvent.objects.filter(created_date__lt=cutoff).delete()[0]
+
+    def poll(self, force=False):
+        """Apply events published by other processes; return how many."""
+        interval = getattr(settings, "INVALIDATION_POLL_INTERVAL", 1)
+        if not force and time.monotonic() - self._polled_at < interval:
+            return 0
+        if not self._lock.acquire(blocking=force):
+            # Another thread of this process is polling right now.
+            return 0
+        try:
+            self._polled_at = time.monotonic()
+            origin = self.origin
+            if self._last_id is None:
+                self._first_id = self._last_id = (
+                    InvalidationEvent.objects.aggregate(last=Max("id"))["last"] or 0
+                )
+                return 0
+            start = max(self._first_id, self._last_id - LOOKBACK)
+            rows = list(
+                InvalidationEvent.objects.filter(id__gt=start)
+                .order_by("id")
+                .values_list("id", "key", "origin")[:BATCH_SIZE]
+            )
+            keys = {}
+            for pk, key, publisher in rows:
+                if pk in self._handled:
+                    continue
+                self._handled.append(pk)
+                self._last_id = max(self._last_id, pk)
+                if publisher != origin:
+                    keys[key] = None
+            if keys:
+                self._apply(list(keys))
+            return len(keys)
+        finally:
+            self._lock.release()
+
+    def _evict(self, keys):
+        alias = getattr(settings, "INVALIDATION_CACHE", "default")
+        if alias:
+            caches[alias].delete_many(keys)
+
+    def _apply(self, keys):
+        self._evict(keys)
+        for key in keys:
+            prefix, _, rest = key.partition(":")
+            for handler in self._handlers.get(prefix, ()):
+                handler(rest)
+
+
+bus = InvalidationBus()
+
+
+class InvalidationBusMiddleware:
+    """Polls the bus before each request, at most once per interval."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        bus.poll()
+        return self.get_response(request)
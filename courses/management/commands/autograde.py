@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.autograder import autograde
+from courses.models import Submission
+
+
+class Command(BaseCommand):
+    help = "Run assignment test cases against code submissions in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--assignment", type=int, help="Only grade this assignment's submissions."
+        )
+        parser.add_argument(
+            "--regrade",
+            action="store_true",
+            help="Also re-grade submissions that already have a grade.",
+        )
+        parser.add_argument("--workers", type=int, help="Pool size (default: CPUs).")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        submissions = Submission.objects.all()
+        if options["assignment"]:
+            submissions = submissions.filter(assignment_id=options["assignment"])
+        if not options["regrade"]:
+            submissions = submissions.filter(graded=False)
+
+        start = time.perf_counter()
+        graded = autograde(
+            submissions, workers=options["workers"], batch_size=options["batch_size"]
+        )
+        elapsed = time.perf_counter() - start
+        rate = graded / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Graded {graded} submissions in {elapsed:.1f}s ({rate:.1f}/s)."
+            )
+        )
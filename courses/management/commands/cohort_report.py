@@ -0,0 +1,87 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+
+from courses.analytics import (
+    DEFAULT_WEEKS,
+    GROUPS,
+    PERIODS,
+    bucket_labels,
+    cohort_report,
+)
+
+
+class Command(BaseCommand):
+    help = "Print enrollment funnels, cohort retention and time to completion."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--group", choices=GROUPS, default="course")
+        parser.add_argument("--period", choices=PERIODS, default="week")
+        parser.add_argument("--weeks", type=int, default=DEFAULT_WEEKS)
+        parser.add_argument("--since", help="Only enrollments from this date on.")
+        parser.add_argument("--course", type=int)
+        parser.add_argument("--category", type=int)
+        parser.add_argument("--json", action="store_true", help="Output JSON.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = parse_date(options["since"])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError("--since must be a valid date (YYYY-MM-DD).")
+        try:
+            report = cohort_report(
+                group=options["group"],
+                period=options["period"],
+                weeks=options["weeks"],
+                since=since,
+                course=options["course"],
+                category=options["category"],
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options["json"]:
+            self.stdout.write(
+                json.dumps(report.as_dict(), cls=DjangoJSONEncoder, indent=1)
+            )
+            return
+
+        self.stdout.write(f"Funnels by {report.group}")
+        for funnel in report.funnels:
+            steps = "  ".join(
+                f"{step['step']} {step['count']} ({step['rate']}%)"
+                for step in funnel["steps"]
+            )
+            self.stdout.write(f"  {funnel['name'][:40]:40}  {steps}")
+
+        self.stdout.write(f"\nRetention by {report.period} cohort (% active in week N)")
+        self.stdout.write(
+            f"  {'cohort':10} {'size':>7} "
+            + " ".join(f"{f'w{week}':>5}" for week in range(report.weeks))
+        )
+        for row in report.retention:
+            rates = " ".join(
+                f"{rate:5.1f}" if rate is not None else "    -" for rate in row["rates"]
+            )
+            self.stdout.write(f"  {row['cohort']!s:10} {row['size']:7} {rates}")
+
+        self.stdout.write(f"\nDays to completion by {report.group}")
+        labels = bucket_labels()
+        for row in report.completion:
+            histogram = " ".join(
+                f"{label}:{count}" for label, count in zip(labels, row["histogram"])
+            )
+            self.stdout.write(
+                f"  {row['name'][:40]:40}  n={row['count']} "
+                f"median={row['median_days']} p90={row['p90_days']}  {histogram}"
+            )
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"{report.enrollments} enrollments in {report.elapsed:.2f}s."
+            )
+        )
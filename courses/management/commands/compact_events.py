@@ -0,0 +1,42 @@
+import time
+from datetime import date, datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.events import compact_day, event_days
+
+
+class Command(BaseCommand):
+    help = "Merge each finished day's event log segments into one sorted file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            help="Compact days before this date (YYYY-MM-DD). Defaults to today; "
+            "the current day is still being written to.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            before = (
+                date.fromisoformat(options["before"])
+                if options["before"]
+                else datetime.now(timezone.utc).date()
+            )
+        except ValueError:
+            raise CommandError("--before must be YYYY-MM-DD.")
+        start = time.perf_counter()
+        days = events = 0
+        for day in event_days():
+            if day >= before:
+                break
+            count = compact_day(day)
+            if count is not None:
+                days += 1
+                events += count
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compacted {days} days ({events} events) in {elapsed:.1f}s."
+            )
+        )
@@ -0,0 +1,37 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import Course
+from courses.packages import export_course
+
+
+class Command(BaseCommand):
+    help = "Write a course with its lessons, assignments and media to a zip package."
+
+    def add_arguments(self, parser):
+        parser.add_argument("course", type=int, help="Course id.")
+        parser.add_argument("path", help="Output .zip file, or - for stdout.")
+
+    def handle(self, *args, **options):
+        course = (
+            Course.objects.select_related("instructor__user", "category")
+            .filter(pk=options["course"])
+            .first()
+        )
+        if course is None:
+            raise CommandError(f"Course {options['course']} does not exist.")
+
+        start = time.perf_counter()
+        if options["path"] == "-":
+            size = export_course(course, sys.stdout.buffer)
+        else:
+            with open(options["path"], "wb") as f:
+                size = export_course(course, f)
+        elapsed = time.perf_counter() - start
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Exported {course.title} ({size / 1e6:.1f} MB) in {elapsed:.1f}s."
+            )
+        )
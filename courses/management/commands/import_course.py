@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import Instructor
+from courses.packages import PackageError, import_course
+
+
+class Command(BaseCommand):
+    help = "Create a course from a zip package written by export_course."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Package .zip file.")
+        parser.add_argument(
+            "--instructor",
+            help="Username of the owning instructor (default: the one in the package).",
+        )
+        parser.add_argument(
+            "--publish", action="store_true", help="Publish the imported course."
+        )
+
+    def handle(self, *args, **options):
+        instructor = None
+        if options["instructor"]:
+            instructor = Instructor.objects.filter(
+                user__username=options["instructor"]
+            ).first()
+            if instructor is None:
+                raise CommandError(f"No instructor {options['instructor']!r}.")
+
+        start = time.perf_counter()
+        try:
+            with open(options["path"], "rb") as f:
+                report = import_course(
+                    f, instructor=instructor, published=options["publish"]
+                )
+        except (OSError, PackageError) as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report.course.title} as course {report.course.pk} in "
+                f"{elapsed:.1f}s: {report.media_copied} media files copied "
+                f"({report.bytes_copied / 1e6:.1f} MB), "
+                f"{report.media_skipped} unchanged files skipped."
+            )
+        )
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.models import Submission
+from courses.similarity import index_submissions
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Compute MinHash signatures and LSH buckets for submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--assignment", type=int, help="Only index this assignment's submissions."
+        )
+
+    def handle(self, *args, **options):
+        submissions = Submission.objects.only("pk", "assignment_id", "content")
+        if options["assignment"]:
+            submissions = submissions.filter(assignment_id=options["assignment"])
+
+        start = time.perf_counter()
+        indexed, batch = 0, []
+        for submission in submissions.iterator(chunk_size=BATCH_SIZE):
+            batch.append(submission)
+            if len(batch) == BATCH_SIZE:
+                indexed += index_submissions(batch)
+                batch = []
+        if batch:
+            indexed += index_submissions(batch)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {indexed} submissions in {elapsed:.1f}s.")
+        )
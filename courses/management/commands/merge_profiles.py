@@ -0,0 +1,129 @@
+import json
+import statistics
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge sampled request profiles into collapsed stacks for flamegraph.pl "
+        "or speedscope."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "views",
+            nargs="*",
+            help="URL names to include, e.g. dashboard course_list (default: all).",
+        )
+        parser.add_argument(
+            "--output", default="-", help="Output file, or - for stdout."
+        )
+        parser.add_argument(
+            "--no-prefix",
+            action="store_true",
+            help="Do not add the URL name as the root frame of every stack.",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the merged profile files afterwards.",
+        )
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="Report PROFILING_MEMORY traces (peaks and allocation sites).",
+        )
+        parser.add_argument(
+            "--top", type=int, default=10, help="Allocation sites per view."
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(settings.PROFILING_DIR)
+        if options["views"]:
+            view_dirs = [directory / name for name in options["views"]]
+        else:
+            view_dirs = sorted(path for path in directory.glob("*") if path.is_dir())
+        if options["memory"]:
+            return self.memory_report(directory, view_dirs, options)
+
+        stacks = Counter()
+        merged = []
+        for view_dir in view_dirs:
+            requests, elapsed, samples = 0, 0.0, 0
+            for path in sorted(view_dir.glob("*.folded")):
+                merged.append(path)
+                with open(path) as f:
+                    for line in f:
+                        if line.startswith("# request "):
+                            requests += 1
+                            elapsed += float(line[10:])
+                            continue
+                        stack, _, count = line.rstrip("\n").rpartition(" ")
+                        if not stack or not count.isdigit():
+                            continue
+                        if not options["no_prefix"]:
+                            stack = f"{view_dir.name};{stack}"
+                        stacks[stack] += int(count)
+                        samples += int(count)
+            if requests:
+                self.stderr.write(
+                    f"{view_dir.name}: {requests} requests, "
+                    f"{elapsed / requests * 1000:.1f} ms mean, {samples} samples"
+                )
+        if not merged:
+            raise CommandError(f"No profiles found in {directory}.")
+
+        lines = (f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+        if options["output"] == "-":
+            for line in lines:
+                self.stdout.write(line, ending="")
+        else:
+            with open(options["output"], "w") as f:
+                f.writelines(lines)
+        if options["clear"]:
+            for path in merged:
+                path.unlink()
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Merged {len(merged)} files into {len(stacks)} distinct stacks."
+            )
+        )
+
+    def memory_report(self, directory, view_dirs, options):
+        merged = []
+        for view_dir in view_dirs:
+            peaks, elapsed, sites = [], [], {}
+            for path in sorted(view_dir.glob("*.memory.jsonl")):
+                merged.append(path)
+                with open(path) as f:
+                    for line in f:
+                        record = json.loads(line)
+                        peaks.append(record["peak"])
+                        elapsed.append(record["elapsed"])
+                        for site, via, size, count in record["sites"]:
+                            # Largest size seen per site across requests.
+                            if size > sites.get((site, via), (0, 0))[0]:
+                                sites[site, via] = (size, count)
+            if not peaks:
+                continue
+            self.stdout.write(
+                f"{view_dir.name}: {len(peaks)} requests, peak "
+                f"{statistics.median(peaks) / 2**20:.1f} MB median, "
+                f"{max(peaks) / 2**20:.1f} MB max, "
+                f"{statistics.mean(elapsed) * 1000:.0f} ms mean (traced)"
+            )
+            ranked = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)
+            for (site, via), (size, count) in ranked[: options["top"]]:
+                self.stdout.write(
+                    f"  {size / 2**20:>8.2f} MB {count:>9} blocks  {site}"
+                    + (f"  via {via}" if via and via != site else "")
+                )
+        if not merged:
+            raise CommandError(f"No memory profiles found in {directory}.")
+        if options["clear"]:
+            for path in merged:
+                path.unlink()
@@ -0,0 +1,66 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import User
+from courses.provisioning import DEFAULT_BATCH_SIZE, provision_users
+
+
+class Command(BaseCommand):
+    help = "Create users and their role profiles in bulk from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file, or - for stdin.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Input format (default: from the file extension, else csv).",
+        )
+        parser.add_argument(
+            "--role",
+            default="student",
+            choices=[role for role, _ in User.ROLE_CHOICES],
+            help="Role for rows without a role column.",
+        )
+        parser.add_argument(
+            "--sso",
+            action="store_true",
+            help="Give every account an unusable password (single sign-on).",
+        )
+        parser.add_argument(
+            "--workers", type=int, help="Hashing pool size (default: CPUs)."
+        )
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or (
+            "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+        )
+        try:
+            stream = (
+                sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+            )
+        except OSError as exc:
+            raise CommandError(exc)
+        with stream:
+            report = provision_users(
+                stream,
+                fmt=fmt,
+                default_role=options["role"],
+                sso=options["sso"],
+                workers=options["workers"],
+                batch_size=options["batch_size"],
+            )
+
+        for line, reason in report.skipped:
+            self.stdout.write(f"line {line}: skipped, {reason}")
+        for line, error in report.errors:
+            self.stderr.write(f"line {line}: {error}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report.created} users in {report.elapsed:.1f}s "
+                f"({report.rate:.0f}/s); {len(report.skipped)} skipped, "
+                f"{len(report.errors)} invalid."
+            )
+        )
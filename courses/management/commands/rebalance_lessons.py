@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.ordering import crowded_courses, rebalance
+
+
+class Command(BaseCommand):
+    help = "Respace lesson ordering keys in courses where they have run out of gaps."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course", type=int, help="Rebalance this course even if not crowded."
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        course_ids = (
+            [options["course"]] if options["course"] else list(crowded_courses())
+        )
+        updated = 0
+        for course_id in course_ids:
+            with transaction.atomic():
+                updated += rebalance(course_id)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebalanced {len(course_ids)} courses ({updated} lessons) "
+                f"in {elapsed:.1f}s."
+            )
+        )
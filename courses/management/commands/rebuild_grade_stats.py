@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.gradestats import rebuild_stats
+from courses.models import Assignment
+
+
+class Command(BaseCommand):
+    help = "Recompute per-assignment grade statistics from the graded submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course", type=int, help="Only rebuild this course's assignments."
+        )
+
+    def handle(self, *args, **options):
+        assignments = Assignment.objects.all()
+        if options["course"]:
+            assignments = assignments.filter(lesson__course_id=options["course"])
+
+        start = time.perf_counter()
+        rows = rebuild_stats(assignments)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt grade statistics for {rows} assignments in {elapsed:.1f}s."
+            )
+        )
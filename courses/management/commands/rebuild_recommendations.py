@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.recommendations import BATCH_SIZE, TOP_K, rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "students also enrolled in" neighbours of every course.'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=TOP_K)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = rebuild_recommendations(
+            top_k=options["top_k"], batch_size=options["batch_size"]
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored {written} recommendations in {elapsed:.1f}s."
+            )
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.coursegrades import recompute_course
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = "Rebuild weighted course grades from the graded submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, help="Only rebuild this course.")
+
+    def handle(self, *args, **options):
+        course_ids = Course.objects.values_list("pk", flat=True)
+        if options["course"]:
+            course_ids = course_ids.filter(pk=options["course"])
+
+        start = time.perf_counter()
+        courses = students = 0
+        for course_id in course_ids.iterator():
+            students += recompute_course(course_id)
+            courses += 1
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recomputed {students} grades in {courses} courses in {elapsed:.1f}s."
+            )
+        )
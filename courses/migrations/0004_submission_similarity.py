@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_course_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minhash', models.BinaryField()),
+                ('created_date', models.DateTimeField(auto_now=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.assignment')),
+                ('submission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='signature', to='courses.submission')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.assignment')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.submission')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['assignment', 'band', 'bucket'], name='similarity_bucket_idx')],
+            },
+        ),
+    ]
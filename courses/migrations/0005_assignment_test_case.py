@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_submission_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentTestCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('stdin', models.TextField(blank=True, help_text='Input fed to the program')),
+                ('expected_output', models.TextField(help_text='Expected standard output (compared ignoring trailing whitespace)')),
+                ('points', models.PositiveIntegerField(default=1)),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_cases', to='courses.assignment')),
+            ],
+            options={
+                'ordering': ['order', 'pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_assignment_test_case'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'order', 'created_date'], name='lesson_course_order_idx'),
+        ),
+    ]
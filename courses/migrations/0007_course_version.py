@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:44
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_lesson_course_order_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('content', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='courses.course')),
+            ],
+            options={
+                'ordering': ['course', '-number'],
+                'unique_together': {('course', 'number')},
+            },
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='enrollments', to='courses.courseversion'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_course_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentGradeStats',
+            fields=[
+                ('assignment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='grade_stats', serialize=False, to='courses.assignment')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('total_squares', models.BigIntegerField(default=0)),
+                ('histogram', models.JSONField(default=list)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Assignment grade stats',
+            },
+        ),
+    ]
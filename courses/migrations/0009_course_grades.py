@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_assignment_grade_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='weight',
+            field=models.PositiveIntegerField(default=1, help_text='Relative weight of this assignment in the course grade'),
+        ),
+        migrations.CreateModel(
+            name='CourseGrade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('earned', models.FloatField(default=0)),
+                ('graded_weight', models.PositiveIntegerField(default=0)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grades', to='courses.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_grades', to='courses.student')),
+            ],
+            options={
+                'unique_together': {('course', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_cache_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvalidationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200)),
+                ('origin', models.CharField(max_length=100)),
+                ('created_date', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
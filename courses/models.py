@@ -1,4 +1,5 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.urls import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -119,11 +120,19 @@ class Enrollment(models.Model):
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, related_name="enrollments"
     )
-    enrolled_date = models.DateTimeField(auto_now_add=True)
-    completed = models.BooleanField(default=False)
+    enrolled_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    completed = models.BooleanField(default=False, db_index=True)
     progress = models.PositiveIntegerField(
         default=0, validators=[MaxValueValidator(100)]
     )
+    # Content snapshot the student's cohort follows, if the course has one.
+    version = models.ForeignKey(
+        "CourseVersion",
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        related_name="enrollments",
+    )
 
     class Meta:
         unique_together = ["student", "course"]
@@ -141,11 +150,19 @@ class Lesson(models.Model):
     )
     video_file = models.FileField(upload_to="lesson_videos/", blank=True, null=True)
     pdf_file = models.FileField(upload_to="lesson_pdfs/", blank=True, null=True)
+    # Sort key with gaps between lessons, see ordering.py.
     order = models.PositiveIntegerField(default=0)
     created_date = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["order", "created_date"]
+        indexes = [
+            # Serves course.lessons.all() in Meta.ordering without a sort.
+            models.Index(
+                fields=["course", "order", "created_date"],
+                name="lesson_course_order_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.course.title} - {self.title}"
@@ -159,6 +176,9 @@ class Assignment(models.Model):
     description = models.TextField()
     due_date = models.DateTimeField()
     max_score = models.PositiveIntegerField(default=100)
+    weight = models.PositiveIntegerField(
+        default=1, help_text="Relative weight of this assignment in the course grade"
+    )
     created_date = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -174,12 +194,12 @@ class Submission(models.Model):
     )
     content = models.TextField(blank=True, help_text="Text/code submission")
     file = models.FileField(upload_to="submissions/", blank=True, null=True)
-    submitted_date = models.DateTimeField(auto_now_add=True)
+    submitted_date = models.DateTimeField(auto_now_add=True, db_index=True)
     score = models.PositiveIntegerField(
         null=True, blank=True, validators=[MaxValueValidator(100)]
     )
     feedback = models.TextField(blank=True)
-    graded = models.BooleanField(default=False)
+    graded = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         unique_together = ["assignment", "student"]
@@ -197,8 +217,8 @@ class Review(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(5)]
     )
     comment = models.TextField(blank=True)
-    created_date = models.DateTimeField(auto_now_add=True)
-    approved = models.BooleanField(default=True)
+    created_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    approved = models.BooleanField(default=True, db_index=True)
 
     class Meta:
         unique_together = ["course", "student"]
@@ -214,11 +234,199 @@ class LessonProgress(models.Model):
     lesson = models.ForeignKey(
         Lesson, on_delete=models.CASCADE, related_name="progress"
     )
-    completed = models.BooleanField(default=False)
-    completed_date = models.DateTimeField(null=True, blank=True)
+    completed = models.BooleanField(default=False, db_index=True)
+    completed_date = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         unique_together = ["student", "lesson"]
 
     def __str__(self):
         return f"{self.student.user.username} - {self.lesson.title}"
+
+
+class CourseRecommendation(models.Model):
+    """Precomputed "students also enrolled in" neighbour of a course."""
+
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="recommendations"
+    )
+    recommended = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="+"
+    )
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["course", "rank"]
+        unique_together = ["course", "rank"]
+
+    def __str__(self):
+        return f"{self.course_id} -> {self.recommended_id} ({self.score:.3f})"
+
+
+class SubmissionSignature(models.Model):
+    """MinHash signature of a submission's text, used for copy detection."""
+
+    submission = models.OneToOneField(
+        Submission, on_delete=models.CASCADE, related_name="signature"
+    )
+    assignment = models.ForeignKey(
+        Assignment, on_delete=models.CASCADE, related_name="+"
+    )
+    minhash = models.BinaryField()
+    created_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Signature for submission {self.submission_id}"
+
+
+class SimilarityBucket(models.Model):
+    """One LSH band of a submission's signature, bucketed per assignment."""
+
+    assignment = models.ForeignKey(
+        Assignment, on_delete=models.CASCADE, related_name="+"
+    )
+    submission = models.ForeignKey(
+        Submission, on_delete=models.CASCADE, related_name="+"
+    )
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["assignment", "band", "bucket"], name="similarity_bucket_idx"
+            )
+        ]
+
+
+class AssignmentTestCase(models.Model):
+    """Input/expected-output pair used to autograde code submissions."""
+
+    assignment = models.ForeignKey(
+        Assignment, on_delete=models.CASCADE, related_name="test_cases"
+    )
+    name = models.CharField(max_length=200)
+    stdin = models.TextField(blank=True, help_text="Input fed to the program")
+    expected_output = models.TextField(
+        help_text="Expected standard output (compared ignoring trailing whitespace)"
+    )
+    points = models.PositiveIntegerField(default=1)
+    order = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["order", "pk"]
+
+    def __str__(self):
+        return f"{self.assignment.title} - {self.name}"
+
+
+class CourseVersion(models.Model):
+    """Immutable snapshot of a course's lessons and assignments."""
+
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="versions"
+    )
+    number = models.PositiveIntegerField()
+    content = models.JSONField(encoder=DjangoJSONEncoder)
+    content_hash = models.CharField(max_length=64)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["course", "-number"]
+        unique_together = ["course", "number"]
+
+    def __str__(self):
+        return f"{self.course.title} v{self.number}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Course versions are immutable.")
+        super().save(*args, **kwargs)
+
+
+class AssignmentGradeStats(models.Model):
+    """Running aggregates of an assignment's graded scores.
+
+    Maintained by courses/gradestats.py as grades change, so statistics
+    never need a scan of the submissions. ``histogram[s]`` is the number of
+    graded submissions with score ``s``.
+    """
+
+    assignment = models.OneToOneField(
+        Assignment,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="grade_stats",
+    )
+    count = models.PositiveIntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    total_squares = models.BigIntegerField(default=0)
+    histogram = models.JSONField(default=list)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Assignment grade stats"
+
+    def __str__(self):
+        return f"Grade stats for assignment {self.assignment_id}"
+
+
+class CourseGrade(models.Model):
+    """A student's running weighted grade in a course.
+
+    ``earned`` is the sum of weight * score / max_score over the student's
+    graded assignments and ``graded_weight`` the sum of their weights, so
+    the grade so far is earned / graded_weight. Kept up to date by
+    courses/coursegrades.py.
+    """
+
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="grades"
+    )
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="course_grades"
+    )
+    earned = models.FloatField(default=0)
+    graded_weight = models.PositiveIntegerField(default=0)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ["course", "student"]
+
+    def __str__(self):
+        return f"{self.student_id} in {self.course_id}: {self.percent:.1f}%"
+
+    @property
+    def percent(self):
+        """Weighted percentage over the assignments graded so far."""
+        if not self.graded_weight:
+            return 0.0
+        return 100 * self.earned / self.graded_weight
+
+
+class CacheVersion(models.Model):
+    """A named counter that is bumped whenever some cached data changes.
+
+    Every process keeps its own copy of the data together with the version
+    it was loaded at and compares it with this row to detect staleness,
+    see courses/reference.py.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class InvalidationEvent(models.Model):
+    """A cache key published on the invalidation bus, see invalidation.py."""
+
+    key = models.CharField(max_length=200)
+    # Process that published the event; it has already evicted the key.
+    origin = models.CharField(max_length=100)
+    created_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.pk}: {self.key}"
@@ -0,0 +1,388 @@
+"""
+Course packages: a whole course as one zip archive, for moving courses
+between instances (e.g. staging to production).
+
+Layout::
+
+    media/<storage name>    course image, lesson videos and PDFs, stored as-is
+    manifest.json           course, category, tags, lessons, assignments,
+                            test cases and the sha256/size of every media file
+
+The archive is written as a stream: iter_course_package yields bytes while
+media files are read in storage-sized chunks, hashed and deflated-or-stored
+on the way through. Memory use is bounded by the chunk size no matter how
+large the videos are. The manifest comes last because it carries the hashes
+computed during the media pass.
+
+Import reads the manifest first and then each media entry straight from the
+zip into storage. Files already present under the same name with the same
+size and sha256 are skipped. A different file under that name is left
+alone and the imported one is saved next to it, since cloned courses share
+media by reference. Rows are inserted with batched bulk_create in one
+transaction. Storage is not transactional, so if the import fails the
+media files it saved are deleted again. The manifest is checked for every
+key the import reads before anything is written, and a malformed one is a
+PackageError.
+"""
+import hashlib
+import json
+import posixpath
+import zipfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .cloning import ASSIGNMENT_FIELDS, LESSON_FIELDS, TEST_CASE_FIELDS, copy_rows
+from .models import (
+    Assignment,
+    AssignmentTestCase,
+    Category,
+    Course,
+    Instructor,
+    Lesson,
+    Tag,
+)
+from .reference import reference_data
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+MEDIA_PREFIX = "media/"
+MEDIA_DIRS = ("course_images/", "lesson_videos/", "lesson_pdfs/")
+CHUNK_SIZE = 1024 * 1024
+# Already-compressed formats are stored rather than deflated again.
+STORED_EXTENSIONS = {
+    ".mp4",
+    ".mov",
+    ".webm",
+    ".mkv",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+}
+
+
+class PackageError(Exception):
+    pass
+
+
+class _StreamBuffer:
+    """Write-only file object that hands written bytes to a generator.
+
+    It has no tell()/seek(), so zipfile writes data descriptors instead of
+    seeking back to patch headers, which is what makes streaming possible.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def _media_names(course, lessons):
+    names = [course.image.name] if course.image else []
+    for lesson in lessons:
+        names.extend(
+            name for name in (lesson["video_file"], lesson["pdf_file"]) if name
+        )
+    return list(dict.fromkeys(names))
+
+
+def _compression(name):
+    extension = posixpath.splitext(name)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def course_manifest(course):
+    """Manifest dict for ``course`` without the media hashes."""
+    assignments = {}
+    cases = {}
+    for row in (
+        AssignmentTestCase.objects.filter(assignment__lesson__course=course)
+        .order_by("pk")
+        .values("assignment", *TEST_CASE_FIELDS)
+    ):
+        cases.setdefault(row.pop("assignment"), []).append(row)
+    for row in (
+        Assignment.objects.filter(lesson__course=course)
+        .order_by("pk")
+        .values("pk", "lesson", *ASSIGNMENT_FIELDS)
+    ):
+        lesson_id = row.pop("lesson")
+        # In full; DjangoJSONEncoder would cut it to milliseconds.
+        row["due_date"] = row["due_date"].isoformat()
+        row["test_cases"] = cases.get(row.pop("pk"), [])
+        assignments.setdefault(lesson_id, []).append(row)
+    lessons = []
+    for row in Lesson.objects.filter(course=course).order_by("pk").values(
+        "pk", *LESSON_FIELDS
+    ):
+        row["assignments"] = assignments.get(row.pop("pk"), [])
+        lessons.append(row)
+    return {
+        "format": FORMAT_VERSION,
+        "course": {
+            "title": course.title,
+            "description": course.description,
+            "price": course.price,
+            "image": course.image.name if course.image else "",
+            "instructor": course.instructor.user.username,
+        },
+        "category": {
+            "name": course.category.name,
+            "description": course.category.description,
+        },
+        "tags": sorted(course.tags.values_list("name", flat=True)),
+        "lessons": lessons,
+        "media": {},
+    }
+
+
+def iter_course_package(course, storage=default_storage):
+    """Yield the bytes of a zip archive of ``course``."""
+    manifest = course_manifest(course)
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in _media_names(course, manifest["lessons"]):
+            if not storage.exists(name):
+                continue
+            info = zipfile.ZipInfo(MEDIA_PREFIX + name)
+            info.compress_type = _compression(name)
+            digest, size = hashlib.sha256(), 0
+            with storage.open(name, "rb") as source, archive.open(
+                info, "w", force_zip64=True
+            ) as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    target.write(chunk)
+                    yield from buffer.drain()
+            manifest["media"][name] = {"sha256": digest.hexdigest(), "size": size}
+            yield from buffer.drain()
+        archive.writestr(
+            MANIFEST,
+            json.dumps(manifest, cls=DjangoJSONEncoder, indent=1),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+    yield from buffer.drain()
+
+
+def export_course(course, fileobj, storage=default_storage):
+    """Write a package of ``course`` to a binary file object."""
+    size = 0
+    for chunk in iter_course_package(course, storage):
+        fileobj.write(chunk)
+        size += len(chunk)
+    return size
+
+
+def _file_sha256(storage, name):
+    digest = hashlib.sha256()
+    with storage.open(name, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _check_media_name(name):
+    normalised = posixpath.normpath(name)
+    if normalised != name or not name.startswith(MEDIA_DIRS):
+        raise PackageError(f"Unexpected media path {name!r} in package.")
+
+
+class ImportReport:
+    def __init__(self):
+        self.course = None
+        self.media_copied = 0
+        self.media_skipped = 0
+        self.bytes_copied = 0
+
+
+def _require(data, keys, where, kind=dict):
+    where = f"Manifest {where}".rstrip()
+    if not isinstance(data, kind):
+        raise PackageError(f"{where} is not a {kind.__name__}.")
+    missing = [key for key in keys if key not in data]
+    if missing:
+        raise PackageError(f"{where} is missing {', '.join(missing)}.")
+
+
+def _check_manifest(manifest):
+    """Raise PackageError unless ``manifest`` has every key import reads."""
+    _require(manifest, ("course", "category", "tags", "lessons", "media"), "")
+    _require(
+        manifest["course"],
+        ("title", "description", "price", "image", "instructor"),
+        "course",
+    )
+    _require(manifest["category"], ("name", "description"), "category")
+    _require(manifest["tags"], (), "tags", list)
+    _require(manifest["media"], (), "media")
+    for name, meta in manifest["media"].items():
+        _require(meta, ("sha256", "size"), f"media {name!r}")
+    _require(manifest["lessons"], (), "lessons", list)
+    # Packages exported before weights existed have none.
+    assignment_fields = [field for field in ASSIGNMENT_FIELDS if field != "weight"]
+    for n, lesson in enumerate(manifest["lessons"], 1):
+        _require(lesson, (*LESSON_FIELDS, "assignments"), f"lesson {n}")
+        _require(lesson["assignments"], (), f"lesson {n} assignments", list)
+        for m, assignment in enumerate(lesson["assignments"], 1):
+            where = f"lesson {n} assignment {m}"
+            _require(assignment, (*assignment_fields, "test_cases"), where)
+            _require(assignment["test_cases"], (), f"{where} test cases", list)
+            for case in assignment["test_cases"]:
+                _require(case, TEST_CASE_FIELDS, f"{where} test case")
+
+
+def _import_media(archive, manifest, storage, report, saved):
+    """Copy media into storage, appending the names written to ``saved``;
+    return {package name: storage name}."""
+    names = {}
+    for name, meta in manifest["media"].items():
+        _check_media_name(name)
+        if storage.exists(name):
+            if (
+                storage.size(name) == meta["size"]
+                and _file_sha256(storage, name) == meta["sha256"]
+            ):
+                names[name] = name
+                report.media_skipped += 1
+                continue
+        try:
+            source = archive.open(MEDIA_PREFIX + name)
+        except KeyError:
+            raise PackageError(f"Package is missing media file {name!r}.")
+        with source:
+            names[name] = storage.save(
+                name, File(source, name=posixpath.basename(name))
+            )
+        saved.append(names[name])
+        report.media_copied += 1
+        report.bytes_copied += meta["size"]
+    return names
+
+
+@transaction.atomic
+def _create_course(manifest, media, instructor, published):
+    """Insert the rows of a checked manifest; return the new Course."""
+    category, _ = Category.objects.get_or_create(
+        name=manifest["category"]["name"],
+        defaults={"description": manifest["category"]["description"]},
+    )
+    data = manifest["course"]
+    course = Course.objects.create(
+        title=data["title"],
+        description=data["description"],
+        price=data["price"],
+        image=media.get(data["image"], data["image"]) or None,
+        instructor=instructor,
+        category=category,
+        published=published,
+    )
+
+    tag_names = manifest["tags"]
+    existing = set(
+        Tag.objects.filter(name__in=tag_names).values_list("name", flat=True)
+    )
+    new_tags = [Tag(name=name) for name in tag_names if name not in existing]
+    if new_tags:
+        # bulk_create sends no signals.
+        Tag.objects.bulk_create(new_tags, ignore_conflicts=True)
+        reference_data.invalidate()
+    # Through tags.set() so the m2m signals update the catalog indexes.
+    course.tags.set(Tag.objects.filter(name__in=tag_names))
+
+    lessons, assignments, cases = [], [], []
+    for lesson_index, lesson in enumerate(manifest["lessons"]):
+        for field in ("video_file", "pdf_file"):
+            lesson[field] = media.get(lesson[field], lesson[field])
+        lessons.append({"pk": lesson_index, "parent": 0, **lesson})
+        for assignment in lesson["assignments"]:
+            assignment_index = len(assignments)
+            assignments.append(
+                {
+                    "pk": assignment_index,
+                    "parent": lesson_index,
+                    # Packages exported before weights existed.
+                    "weight": 1,
+                    **assignment,
+                    "due_date": parse_datetime(assignment["due_date"]),
+                }
+            )
+            for case in assignment["test_cases"]:
+                cases.append({"pk": len(cases), "parent": assignment_index, **case})
+    lesson_ids = copy_rows(Lesson, lessons, "course_id", {0: course.pk}, LESSON_FIELDS)
+    assignment_ids = copy_rows(
+        Assignment, assignments, "lesson_id", lesson_ids, ASSIGNMENT_FIELDS
+    )
+    copy_rows(
+        AssignmentTestCase,
+        cases,
+        "assignment_id",
+        assignment_ids,
+        TEST_CASE_FIELDS,
+    )
+    return course
+
+
+def import_course(
+    fileobj, instructor=None, storage=default_storage, published=False
+):
+    """Create a course from a package; return an ImportReport.
+
+    ``fileobj`` must be seekable (a file on disk or an uploaded file). The
+    course goes to ``instructor``, or to the instructor with the username
+    recorded in the package. Media saved by a failed import is deleted
+    again, but not when a transaction around this call rolls back later.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise PackageError("Not a zip archive.")
+    report = ImportReport()
+    saved = []
+    try:
+        with archive:
+            try:
+                manifest = json.load(archive.open(MANIFEST))
+            except KeyError:
+                raise PackageError("Package has no manifest.json.")
+            except ValueError:
+                raise PackageError("manifest.json is not valid JSON.")
+            _require(manifest, ("format",), "")
+            if manifest.get("format") != FORMAT_VERSION:
+                raise PackageError(
+                    f"Unsupported package format {manifest.get('format')!r}."
+                )
+            _check_manifest(manifest)
+            if instructor is None:
+                username = manifest["course"]["instructor"]
+                instructor = Instructor.objects.filter(
+                    user__username=username
+                ).first()
+                if instructor is None:
+                    raise PackageError(
+                        f"No instructor {username!r} here; choose one explicitly."
+                    )
+            media = _import_media(archive, manifest, storage, report, saved)
+
+        report.course = _create_course(manifest, media, instructor, published)
+    except BaseException:
+        for name in saved:
+            storage.delete(name)
+        raise
+    return report
@@ -0,0 +1,309 @@
+"""
+Bulk user provisioning from CSV or JSON Lines.
+
+Records are streamed in batches of ``batch_size``. For each batch:
+
+1. rows are validated and checked for duplicate usernames/emails, both
+   within the file and against existing users (one query per batch),
+2. passwords are hashed in a process pool; SSO imports and rows without a
+   password get an unusable password instead,
+3. users and their Student/Instructor/Employee profiles are inserted with
+   bulk_create inside one transaction.
+
+Hashing dominates the cost (PBKDF2 is slow by design), so the pool is what
+makes 50k-account imports practical; the database work is a few queries per
+batch.
+
+Recognised columns: username (required), email, password, role (student,
+instructor or employee; defaults to ``default_role``), first_name,
+last_name, and the profile fields bio, phone, date_of_birth (students),
+expertise, years_experience (instructors), department, position
+(employees).
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_date
+
+from .autocomplete import autocomplete_index
+from .models import Employee, Instructor, Student, User
+from .reference import reference_data
+
+ROLES = dict(User.ROLE_CHOICES)
+PROFILE_MODELS = {"student": Student, "instructor": Instructor, "employee": Employee}
+PROFILE_FIELDS = {
+    "student": ("bio", "phone", "date_of_birth"),
+    "instructor": ("bio", "expertise", "years_experience"),
+    "employee": ("department", "position"),
+}
+TEXT_FIELDS = (
+    "username",
+    "email",
+    "password",
+    "role",
+    "first_name",
+    "last_name",
+    "bio",
+    "phone",
+    "expertise",
+    "department",
+    "position",
+    "date_of_birth",
+)
+DEFAULT_BATCH_SIZE = 1000
+
+
+class ProvisioningReport:
+    def __init__(self):
+        self.created = 0
+        self.skipped = []
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "skipped": [
+                {"line": line, "reason": reason} for line, reason in self.skipped
+            ],
+            "errors": [{"line": line, "error": error} for line, error in self.errors],
+            "seconds": round(self.elapsed, 3),
+            "users_per_second": round(self.rate, 1),
+        }
+
+
+def read_records(stream, fmt):
+    """Yield (line number, dict) from a text stream of CSV or JSON Lines."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_num, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unknown format {fmt!r}; expected csv or jsonl.")
+
+
+def _hash_passwords(passwords):
+    # Runs in a pool worker.
+    return [make_password(password) for password in passwords]
+
+
+def _clean(record, default_role):
+    if record is None:
+        raise ValidationError("Not a JSON object.")
+    record = {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in record.items()
+        if key
+    }
+    for field in TEXT_FIELDS:
+        # JSON Lines can carry numbers, lists or objects here.
+        if record.get(field) is not None and not isinstance(record[field], str):
+            raise ValidationError(f"{field} must be a string.")
+    username = record.get("username") or ""
+    if not username:
+        raise ValidationError("username is required.")
+    User.username_validator(username)
+    email = User.objects.normalize_email(record.get("email") or "")
+    if email:
+        validate_email(email)
+    role = record.get("role") or default_role
+    if role not in ROLES:
+        raise ValidationError(f"Unknown role {role!r}.")
+
+    profile = {}
+    for field in PROFILE_FIELDS[role]:
+        value = record.get(field)
+        if value in (None, ""):
+            continue
+        if field == "years_experience":
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValidationError("years_experience must be an integer.")
+        elif field == "date_of_birth":
+            try:
+                # None for a malformed string, ValueError for an impossible
+                # date such as 2000-02-30.
+                value = parse_date(value)
+            except ValueError:
+                value = None
+            if value is None:
+                raise ValidationError("date_of_birth must be YYYY-MM-DD.")
+        profile[field] = value
+
+    user = User(
+        username=username,
+        email=email,
+        first_name=record.get("first_name") or "",
+        last_name=record.get("last_name") or "",
+        role=role,
+    )
+    return user, record.get("password") or "", profile
+
+
+class Provisioner:
+    def __init__(self, default_role="student", sso=False, workers=None):
+        self.default_role = default_role
+        self.sso = sso
+        self.workers = workers or os.cpu_count()
+        self.usernames = set()
+        self.emails = set()
+        self.instructor_ids = []
+
+    def run(self, records, batch_size=DEFAULT_BATCH_SIZE):
+        """Provision ``records`` (an iterable of (line, dict)); return a report."""
+        report = ProvisioningReport()
+        start = time.perf_counter()
+        records = iter(records)
+        executor = None if self.sso else ProcessPoolExecutor(self.workers)
+        try:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                self._batch(batch, report, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        # bulk_create sends no signals, so tell the in-memory catalog indexes
+        # about the new instructors here.
+        if self.instructor_ids:
+            reference_data.invalidate()
+            for instructor in Instructor.objects.filter(
+                pk__in=self.instructor_ids
+            ).select_related("user"):
+                user = instructor.user
+                autocomplete_index.refresh_item(
+                    "instructor", instructor.pk, user.get_full_name() or user.username
+                )
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def _batch(self, batch, report, executor):
+        rows = []
+        for line, record in batch:
+            try:
+                user, password, profile = _clean(record, self.default_role)
+            except ValidationError as exc:
+                report.errors.append((line, " ".join(exc.messages)))
+                continue
+            rows.append((line, user, password, profile))
+
+        rows = self._drop_duplicates(rows, report)
+        if not rows:
+            return
+
+        to_hash = [] if self.sso else [pw for _, _, pw, _ in rows if pw]
+        hashes = iter(self._hash(to_hash, executor))
+        for _, user, password, _ in rows:
+            if password and not self.sso:
+                user.password = next(hashes)
+            else:
+                user.set_unusable_password()
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([user for _, user, _, _ in rows])
+            if any(user.pk is None for user in users):
+                # Backends that cannot return ids from bulk inserts.
+                ids = dict(
+                    User.objects.filter(
+                        username__in=[user.username for user in users]
+                    ).values_list("username", "pk")
+                )
+                for user in users:
+                    user.pk = ids[user.username]
+            for role, model in PROFILE_MODELS.items():
+                profiles = model.objects.bulk_create(
+                    model(user=user, **profile)
+                    for _, user, _, profile in rows
+                    if user.role == role
+                )
+                if role == "instructor":
+                    self.instructor_ids.extend(
+                        profile.pk for profile in profiles if profile.pk
+                    )
+        report.created += len(rows)
+
+    def _drop_duplicates(self, rows, report):
+        usernames = [user.username for _, user, _, _ in rows]
+        emails = [user.email.lower() for _, user, _, _ in rows if user.email]
+        # Emails are compared case-insensitively on both sides.
+        existing = (
+            User.objects.annotate(email_lower=Lower("email"))
+            .filter(Q(username__in=usernames) | Q(email_lower__in=emails))
+            .values_list("username", "email")
+        )
+        taken_usernames = {username for username, _ in existing}
+        taken_emails = {email.lower() for _, email in existing if email}
+
+        kept = []
+        for row in rows:
+            line, user, _, _ = row
+            username, email = user.username, user.email.lower()
+            if username in taken_usernames:
+                report.skipped.append((line, f"username {user.username} exists"))
+            elif username in self.usernames:
+                report.skipped.append((line, f"duplicate username {user.username}"))
+            elif email and email in taken_emails:
+                report.skipped.append((line, f"email {user.email} exists"))
+            elif email and email in self.emails:
+                report.skipped.append((line, f"duplicate email {user.email}"))
+            else:
+                self.usernames.add(username)
+                if email:
+                    self.emails.add(email)
+                kept.append(row)
+        return kept
+
+    def _hash(self, passwords, executor):
+        if not passwords:
+            return []
+        chunk = max(1, -(-len(passwords) // (self.workers * 4)))
+        chunks = [passwords[i : i + chunk] for i in range(0, len(passwords), chunk)]
+        return [
+            hashed
+            for hashed_chunk in executor.map(_hash_passwords, chunks)
+            for hashed in hashed_chunk
+        ]
+
+
+def provision_users(
+    stream,
+    fmt="csv",
+    default_role="student",
+    sso=False,
+    workers=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+):
+    """Create users and role profiles from a CSV or JSONL text stream."""
+    provisioner = Provisioner(default_role=default_role, sso=sso, workers=workers)
+    return provisioner.run(read_records(stream, fmt), batch_size=batch_size)
+
+
+def text_lines(binary, encoding="utf-8"):
+    """Decode an iterable of byte lines (an upload or request body)."""
+    for line in binary:
+        yield line.decode(encoding)
@@ -0,0 +1,163 @@
+"""
+"Students also enrolled in" recommendations.
+
+The rebuild streams the Enrollment table once, ordered by student, and keeps
+a sparse co-enrollment count per course pair in a dict. Pairs that share a
+tag are added as candidates too, so new courses without enrollments still
+get neighbours. Each candidate pair is scored as a blend of
+
+- cosine similarity of the two courses' enrollment sets,
+- Jaccard similarity of their tags, and
+- a bonus when they are in the same category,
+
+and the top-K neighbours of every published course are written to
+CourseRecommendation. course_detail then reads them with one indexed query.
+Courses whose neighbour list changed get their updated_date bumped, so
+their conditional GET state (conditional.py) changes with the block.
+"""
+import heapq
+import math
+from collections import defaultdict
+from itertools import combinations
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Course, CourseRecommendation, Enrollment
+
+TOP_K = 5
+BATCH_SIZE = 10000
+
+CO_ENROLLMENT_WEIGHT = 0.7
+TAG_WEIGHT = 0.2
+CATEGORY_WEIGHT = 0.1
+
+
+def count_co_enrollments(batch_size=BATCH_SIZE):
+    """Return (enrollments per course, co-enrollments per course pair).
+
+    Pairs are keyed (smaller id, larger id). The table is read in chunks of
+    ``batch_size`` rows, so memory is bounded by the number of distinct
+    pairs, not by the number of enrollments.
+    """
+    course_counts = defaultdict(int)
+    pair_counts = defaultdict(int)
+
+    def flush(courses):
+        for pair in combinations(sorted(courses), 2):
+            pair_counts[pair] += 1
+
+    rows = (
+        Enrollment.objects.order_by("student_id")
+        .values_list("student_id", "course_id")
+        .iterator(chunk_size=batch_size)
+    )
+    current_student, courses = None, []
+    for student_id, course_id in rows:
+        course_counts[course_id] += 1
+        if student_id != current_student:
+            flush(courses)
+            current_student, courses = student_id, []
+        courses.append(course_id)
+    flush(courses)
+    return course_counts, pair_counts
+
+
+def _course_features():
+    categories = {}
+    tags = defaultdict(set)
+    for pk, category_id in Course.objects.filter(published=True).values_list(
+        "pk", "category_id"
+    ):
+        categories[pk] = category_id
+    for course_id, tag_id in Course.tags.through.objects.filter(
+        course_id__in=categories
+    ).values_list("course_id", "tag_id"):
+        tags[course_id].add(tag_id)
+    return categories, tags
+
+
+def score_pairs(course_counts, pair_counts, categories, tags):
+    """Yield (course_a, course_b, score) for every candidate pair."""
+    candidates = set(pair_counts)
+    courses_by_tag = defaultdict(list)
+    for course_id, tag_ids in tags.items():
+        for tag_id in tag_ids:
+            courses_by_tag[tag_id].append(course_id)
+    for course_ids in courses_by_tag.values():
+        candidates.update(combinations(sorted(course_ids), 2))
+
+    for a, b in candidates:
+        if a not in categories or b not in categories:
+            continue
+        together = pair_counts.get((a, b), 0)
+        co = (
+            together / math.sqrt(course_counts[a] * course_counts[b])
+            if together
+            else 0.0
+        )
+        union = len(tags[a] | tags[b])
+        tag = len(tags[a] & tags[b]) / union if union else 0.0
+        category = 1.0 if categories[a] == categories[b] else 0.0
+        score = (
+            CO_ENROLLMENT_WEIGHT * co + TAG_WEIGHT * tag + CATEGORY_WEIGHT * category
+        )
+        if score > 0:
+            yield a, b, score
+
+
+def rebuild_recommendations(top_k=TOP_K, batch_size=BATCH_SIZE):
+    """Recompute and store the top-K neighbours of every published course.
+
+    Returns the number of CourseRecommendation rows written.
+    """
+    course_counts, pair_counts = count_co_enrollments(batch_size)
+    categories, tags = _course_features()
+
+    neighbours = defaultdict(list)
+    for a, b, score in score_pairs(course_counts, pair_counts, categories, tags):
+        for course, other in ((a, b), (b, a)):
+            heap = neighbours[course]
+            if len(heap) < top_k:
+                heapq.heappush(heap, (score, other))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, other))
+
+    rows = [
+        CourseRecommendation(
+            course_id=course_id, recommended_id=other, score=score, rank=rank
+        )
+        for course_id, heap in neighbours.items()
+        for rank, (score, other) in enumerate(sorted(heap, reverse=True))
+    ]
+    new = defaultdict(list)
+    for row in rows:
+        new[row.course_id].append(row.recommended_id)
+    with transaction.atomic():
+        old = defaultdict(list)
+        for course_id, recommended_id in CourseRecommendation.objects.order_by(
+            "course_id", "rank"
+        ).values_list("course_id", "recommended_id"):
+            old[course_id].append(recommended_id)
+        changed = [
+            course_id
+            for course_id in old.keys() | new.keys()
+            if old[course_id] != new[course_id]
+        ]
+        CourseRecommendation.objects.all().delete()
+        CourseRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+        for start in range(0, len(changed), batch_size):
+            Course.objects.filter(pk__in=changed[start : start + batch_size]).update(
+                updated_date=timezone.now()
+            )
+    return len(rows)
+
+
+def recommended_courses(course, limit=TOP_K):
+    """Published neighbours of ``course`` in rank order."""
+    return [
+        rec.recommended
+        for rec in CourseRecommendation.objects.filter(
+            course=course, recommended__published=True
+        ).select_related("recommended__instructor__user")[:limit]
+    ]
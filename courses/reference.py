@@ -0,0 +1,105 @@
+"""
+Process-local cache of catalog reference data: categories, tags and
+instructor names.
+
+These tables are read on every catalog request (filter dropdowns, facet
+labels, the course list ETag) and change a few times a day. Each process
+keeps one immutable ReferenceData snapshot. Freshness is tracked by the
+"reference" row of CacheVersion, a counter bumped by the signals in
+signals.py whenever one of the tables changes. A process re-reads that
+one row at most every REFERENCE_DATA_CHECK_INTERVAL seconds and reloads
+the snapshot only when the number moved. In steady state a request makes
+no reference-data queries, and a change made in one worker reaches the
+others within the interval.
+
+The version is read before the data. A change committed between the two
+reads therefore leaves a snapshot that is newer than its version, and it
+is reloaded once more on the next check rather than kept stale.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import CacheVersion, Category, Instructor, Tag
+
+REFERENCE = "reference"
+
+
+def cache_version(name):
+    return (
+        CacheVersion.objects.filter(name=name).values_list("version", flat=True).first()
+        or 0
+    )
+
+
+def bump_cache_version(name):
+    if not CacheVersion.objects.filter(name=name).update(version=F("version") + 1):
+        _, created = CacheVersion.objects.get_or_create(
+            name=name, defaults={"version": 1}
+        )
+        if not created:
+            # Another process created the row in between.
+            CacheVersion.objects.filter(name=name).update(version=F("version") + 1)
+
+
+class ReferenceData:
+    """One snapshot; dicts map pk to label and iterate in label order."""
+
+    __slots__ = ("version", "categories", "tags", "instructors")
+
+    def __init__(self, version, categories, tags, instructors):
+        self.version = version
+        self.categories = categories
+        self.tags = tags
+        self.instructors = instructors
+
+    @classmethod
+    def load(cls, version):
+        def by_label(pairs):
+            return dict(sorted(pairs, key=lambda pair: (pair[1].lower(), pair[0])))
+
+        return cls(
+            version,
+            by_label(Category.objects.values_list("pk", "name")),
+            by_label(Tag.objects.values_list("pk", "name")),
+            by_label(
+                (pk, f"{first} {last}".strip() or username)
+                for pk, first, last, username in Instructor.objects.values_list(
+                    "pk", "user__first_name", "user__last_name", "user__username"
+                )
+            ),
+        )
+
+
+class ReferenceCache:
+    def __init__(self, name=REFERENCE):
+        self.name = name
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+
+    def get(self):
+        """The current ReferenceData, reloaded if another process changed it."""
+        interval = getattr(settings, "REFERENCE_DATA_CHECK_INTERVAL", 1)
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < interval:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() - self._checked_at >= interval:
+                version = cache_version(self.name)
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._snapshot = ReferenceData.load(version)
+                self._checked_at = time.monotonic()
+        return snapshot
+
+    def invalidate(self):
+        """Mark the data changed for every process, this one immediately."""
+        bump_cache_version(self.name)
+        with self._lock:
+            self._snapshot = None
+
+
+reference_data = ReferenceCache()
@@ -0,0 +1,283 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .autocomplete import autocomplete_index
+from .cloning import forget_version, pin_enrollments
+from .facets import catalog_index
+from .invalidation import bus
+from .reference import reference_data
+from . import coursegrades, gradestats
+from .models import (
+    Assignment,
+    Category,
+    Course,
+    Enrollment,
+    Instructor,
+    Lesson,
+    Review,
+    Submission,
+    Tag,
+    User,
+)
+from .similarity import schedule_index
+
+
+def touch_course(course_id):
+    """Bump Course.updated_date so catalog ETags/Last-Modified change."""
+    Course.objects.filter(pk=course_id).update(updated_date=timezone.now())
+
+
+@receiver(pre_save, sender=Course)
+@receiver(pre_save, sender=Lesson)
+@receiver(pre_save, sender=Assignment)
+@receiver(pre_delete, sender=Lesson)
+@receiver(pre_delete, sender=Assignment)
+def course_content_editing(sender, instance, origin=None, **kwargs):
+    # Cohorts enrolled before versioning keep the content as it was.
+    if sender is Course:
+        if not instance._state.adding:
+            pin_enrollments(instance.pk)
+    elif origin is None or getattr(origin, "model", type(origin)) in (
+        Lesson,
+        Assignment,
+    ):
+        # Not when a course deletion cascades: its versions go with it.
+        course_id = (
+            instance.course_id if sender is Lesson else instance.lesson.course_id
+        )
+        pin_enrollments(course_id)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def course_content_changed(sender, instance, **kwargs):
+    touch_course(instance.course_id)
+    if sender is Lesson:
+        bus.publish(f"lesson:{instance.pk}", f"lessons:{instance.course_id}")
+        forget_version(instance.course_id)
+    else:
+        bus.publish(f"review:{instance.pk}", f"reviews:{instance.course_id}")
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    catalog_index.refresh_course(instance.pk)
+    autocomplete_index.refresh_course(instance.pk)
+    bus.publish(f"course:{instance.pk}")
+    forget_version(instance.pk)
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def assignment_changed(sender, instance, origin=None, **kwargs):
+    # Not when a lesson or course deletion cascades: the lesson signals
+    # cover it and the lesson row may already be gone.
+    if origin is None or getattr(origin, "model", type(origin)) is Assignment:
+        forget_version(instance.lesson.course_id)
+
+
+# Other workers refresh their indexes when a course or its enrollments change.
+@bus.subscribe("course")
+def remote_course_changed(pk):
+    catalog_index.refresh_course(int(pk))
+    autocomplete_index.refresh_course(int(pk))
+
+
+@bus.subscribe("enrollments")
+def remote_enrollments_changed(course_id):
+    autocomplete_index.refresh_course(int(course_id))
+
+
+@receiver(m2m_changed, sender=Course.tags.through)
+def course_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("pre_add", "pre_remove", "pre_clear"):
+            pin_enrollments(instance.pk)
+        if action.startswith("post_"):
+            touch_course(instance.pk)
+            catalog_index.refresh_course(instance.pk)
+            autocomplete_index.refresh_course(instance.pk)
+            bus.publish(f"course:{instance.pk}")
+            forget_version(instance.pk)
+        return
+    # Changed from the Tag side: instance is the Tag, pk_set holds course ids.
+    if action == "pre_clear":
+        instance._cleared_course_ids = list(
+            instance.courses.values_list("pk", flat=True)
+        )
+        return
+    if action == "post_clear":
+        course_ids = instance.__dict__.pop("_cleared_course_ids", [])
+    elif action in ("post_add", "post_remove"):
+        course_ids = list(pk_set)
+    else:
+        return
+    Course.objects.filter(pk__in=course_ids).update(updated_date=timezone.now())
+    for course_id in course_ids:
+        catalog_index.refresh_course(course_id)
+        autocomplete_index.refresh_course(course_id)
+    bus.publish(*(f"course:{course_id}" for course_id in course_ids))
+    forget_version(*course_ids)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Instructor)
+@receiver(post_delete, sender=Instructor)
+def reference_data_changed(sender, **kwargs):
+    reference_data.invalidate()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def label_saved(sender, instance, **kwargs):
+    kind = "category" if sender is Category else "tag"
+    autocomplete_index.refresh_item(kind, instance.pk, instance.name)
+    # Course versions include category and tag names.
+    forget_version(*instance.courses.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Instructor)
+def label_deleted(sender, instance, **kwargs):
+    kind = {Category: "category", Tag: "tag", Instructor: "instructor"}[sender]
+    autocomplete_index.refresh_item(kind, instance.pk)
+
+
+@receiver(post_save, sender=Instructor)
+def instructor_saved(sender, instance, **kwargs):
+    user = instance.user
+    autocomplete_index.refresh_item(
+        "instructor", instance.pk, user.get_full_name() or user.username
+    )
+
+
+# User fields that instructor labels are made of.
+NAME_FIELDS = {"first_name", "last_name", "username"}
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Instructor facet labels and suggestions show the instructor's name.
+    # Logins save only last_login, which must not invalidate every worker.
+    if instance.role == "instructor" and (
+        update_fields is None or NAME_FIELDS & set(update_fields)
+    ):
+        reference_data.invalidate()
+        label = instance.get_full_name() or instance.username
+        for pk in Instructor.objects.filter(user=instance).values_list(
+            "pk", flat=True
+        ):
+            autocomplete_index.refresh_item("instructor", pk, label)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_created(sender, instance, created, **kwargs):
+    # Progress updates re-save enrollments; only new ones change rankings.
+    if created:
+        autocomplete_index.enrollments_changed(instance.course_id, 1)
+        bus.publish(f"enrollment:{instance.pk}", f"enrollments:{instance.course_id}")
+    else:
+        bus.publish(f"enrollment:{instance.pk}")
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    autocomplete_index.enrollments_changed(instance.course_id, -1)
+    bus.publish(f"enrollment:{instance.pk}", f"enrollments:{instance.course_id}")
+
+
+@receiver(post_save, sender=Submission)
+def submission_created(sender, instance, created, **kwargs):
+    # Submissions are not edited by students, so only new ones need a
+    # similarity signature; grading saves are ignored.
+    if created:
+        schedule_index(instance.pk)
+
+
+def _grade(submission):
+    return submission.score if submission.graded else None
+
+
+def grades_changed(changes, create=True, submission_ids=()):
+    """Update grade statistics and course grades for (student id,
+    assignment id, old score, new score) changes, and publish the changed
+    submissions and their assignments on the invalidation bus."""
+    gradestats.apply_changes(
+        [(assignment_id, old, new) for _, assignment_id, old, new in changes],
+        create=create,
+    )
+    coursegrades.apply_changes(changes, create=create)
+    bus.publish(
+        *(f"submission:{pk}" for pk in submission_ids),
+        *{f"submissions:{assignment_id}": None for _, assignment_id, _, _ in changes},
+    )
+
+
+@receiver(pre_save, sender=Submission)
+def submission_grade_before(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._previous_grade = None
+    else:
+        previous = gradestats.previous_grades([instance.pk]).get(instance.pk)
+        instance._previous_grade = previous[2] if previous else None
+
+
+@receiver(post_save, sender=Submission)
+def submission_graded(sender, instance, **kwargs):
+    previous = instance.__dict__.pop("_previous_grade", None)
+    grades_changed(
+        [(instance.student_id, instance.assignment_id, previous, _grade(instance))],
+        submission_ids=[instance.pk],
+    )
+
+
+@receiver(post_delete, sender=Submission)
+def submission_deleted(sender, instance, **kwargs):
+    # create=False: when the assignment, course or student is being deleted
+    # the aggregate rows may already be gone and must not be recreated.
+    grades_changed(
+        [(instance.student_id, instance.assignment_id, _grade(instance), None)],
+        create=False,
+        submission_ids=[instance.pk],
+    )
+
+
+@receiver(pre_save, sender=Assignment)
+def assignment_weight_before(sender, instance, **kwargs):
+    instance._previous_weighting = (
+        None
+        if instance._state.adding
+        else Assignment.objects.filter(pk=instance.pk)
+        .values_list("weight", "max_score", "lesson__course_id")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Assignment)
+def assignment_weight_changed(sender, instance, **kwargs):
+    previous = instance.__dict__.pop("_previous_weighting", None)
+    if previous is None:
+        return
+    weight, max_score, course_id = previous
+    if (weight, max_score) != (instance.weight, instance.max_score) or (
+        course_id != instance.lesson.course_id
+    ):
+        # Every student's share of this assignment changed.
+        coursegrades.recompute_course(instance.lesson.course_id)
+        if course_id != instance.lesson.course_id:
+            coursegrades.recompute_course(course_id)
+            forget_version(course_id)
@@ -0,0 +1,229 @@
+"""
+Near-duplicate detection for text/code submissions.
+
+Each submission is reduced to word 5-shingles, and the shingle set to a
+MinHash signature of NUM_PERM values. The signature is built with one
+permutation hashing: one pass puts each shingle's 64-bit hash into one of
+NUM_PERM bins and keeps the minimum per bin. Empty bins borrow from the next
+filled bin. This costs O(shingles) per submission instead of
+O(shingles * NUM_PERM). The signature is cut into BANDS bands
+of ROWS values. Every band is hashed into a SimilarityBucket row scoped to
+the assignment. Two submissions only become a candidate pair when they share
+at least one bucket, so a report never compares every pair in a cohort. The
+candidates are then checked with the Jaccard estimate from their full
+signatures.
+
+With 16 bands of 4 rows, pairs above ~0.5 similarity are very likely to
+collide and pairs below ~0.3 rarely do.
+
+A bucket shared by many submissions usually means starter code handed in
+mostly unchanged, and expanding it into pairs is quadratic. Buckets with
+more than SIMILARITY_MAX_BUCKET_SIZE members are skipped; submissions that
+really are copies of each other still meet in their other, smaller
+buckets unless the whole band signature is boilerplate.
+"""
+import hashlib
+import logging
+import re
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+
+from .models import SimilarityBucket, Submission, SubmissionSignature
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_MAX_BUCKET_SIZE = 50
+
+_MAX_HASH = (1 << 32) - 1
+_EMPTY = _MAX_HASH + 1
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="similarity")
+
+
+def _hash64(text):
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Return the set of 64-bit hashes of word n-grams in ``text``."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < size:
+        tokens = tokens and [" ".join(tokens)]
+        size = 1
+    return {
+        _hash64(" ".join(tokens[i : i + size]))
+        for i in range(len(tokens) - size + 1)
+    }
+
+
+def minhash(shingle_set):
+    """MinHash signature of a shingle set as a list of NUM_PERM ints."""
+    if not shingle_set:
+        return None
+    bins = [_EMPTY] * NUM_PERM
+    for value in shingle_set:
+        index = value % NUM_PERM
+        value = (value // NUM_PERM) & _MAX_HASH
+        if value < bins[index]:
+            bins[index] = value
+    signature = list(bins)
+    for index, value in enumerate(bins):
+        if value == _EMPTY:
+            # Densify: take the next filled bin, so that two sets with the
+            # same filled bins still agree on the empty ones.
+            step = 1
+            while bins[(index + step) % NUM_PERM] == _EMPTY:
+                step += 1
+            signature[index] = bins[(index + step) % NUM_PERM]
+    return signature
+
+
+def band_buckets(signature):
+    """Yield (band, bucket) for each LSH band of ``signature``."""
+    for band in range(BANDS):
+        chunk = array("I", signature[band * ROWS : (band + 1) * ROWS]).tobytes()
+        bucket = int.from_bytes(
+            hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True
+        )
+        yield band, bucket
+
+
+def estimated_similarity(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _decode(blob):
+    return array("I", bytes(blob)).tolist()
+
+
+def index_submissions(submissions):
+    """Compute and store signatures and LSH buckets for a batch.
+
+    Returns the number of submissions that had text to index.
+    """
+    signatures, buckets = [], []
+    for submission in submissions:
+        signature = minhash(shingles(submission.content or ""))
+        if signature is None:
+            continue
+        signatures.append(
+            SubmissionSignature(
+                submission_id=submission.pk,
+                assignment_id=submission.assignment_id,
+                minhash=array("I", signature).tobytes(),
+            )
+        )
+        buckets.extend(
+            SimilarityBucket(
+                assignment_id=submission.assignment_id,
+                submission_id=submission.pk,
+                band=band,
+                bucket=bucket,
+            )
+            for band, bucket in band_buckets(signature)
+        )
+    ids = [submission.pk for submission in submissions]
+    with transaction.atomic():
+        SimilarityBucket.objects.filter(submission_id__in=ids).delete()
+        SubmissionSignature.objects.filter(submission_id__in=ids).delete()
+        SubmissionSignature.objects.bulk_create(signatures)
+        SimilarityBucket.objects.bulk_create(buckets, batch_size=2000)
+    return len(signatures)
+
+
+def index_submission(submission):
+    """Compute and store the signature and LSH buckets for one submission."""
+    return index_submissions([submission]) == 1
+
+
+def _index_in_background(submission_id):
+    close_old_connections()
+    try:
+        submission = Submission.objects.filter(pk=submission_id).first()
+        if submission is not None:
+            index_submission(submission)
+    except Exception:
+        logger.exception("Could not index submission %s", submission_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_index(submission_id):
+    """Index a submission once the current transaction commits.
+
+    The work runs on a background thread unless
+    SIMILARITY_INDEX_IN_BACKGROUND is False (handy for scripts and tests).
+    """
+    if getattr(settings, "SIMILARITY_INDEX_IN_BACKGROUND", True):
+        transaction.on_commit(
+            lambda: _executor.submit(_index_in_background, submission_id)
+        )
+    else:
+        transaction.on_commit(lambda: _index_in_background(submission_id))
+
+
+def suspicious_pairs(assignment, threshold=DEFAULT_THRESHOLD):
+    """Return [(similarity, submission_a, submission_b)] above ``threshold``.
+
+    Only buckets holding more than one submission, and at most
+    SIMILARITY_MAX_BUCKET_SIZE, are read, so the cost grows with the number
+    of near-duplicates rather than with the cohort size.
+    """
+    max_size = getattr(settings, "SIMILARITY_MAX_BUCKET_SIZE", DEFAULT_MAX_BUCKET_SIZE)
+    shared = (
+        SimilarityBucket.objects.filter(assignment=assignment)
+        .values("band", "bucket")
+        .annotate(members=Count("pk"))
+        .filter(members__gt=1, members__lte=max_size)
+    )
+    buckets = defaultdict(list)
+    for band, bucket, submission_id in SimilarityBucket.objects.filter(
+        assignment=assignment, bucket__in=shared.values("bucket")
+    ).values_list("band", "bucket", "submission_id"):
+        buckets[band, bucket].append(submission_id)
+
+    candidates = set()
+    for members in buckets.values():
+        # bucket__in above matches the bucket value in any band, so the
+        # sizes are checked again per (band, bucket).
+        if 1 < len(members) <= max_size:
+            candidates.update(combinations(sorted(members), 2))
+    if not candidates:
+        return []
+
+    ids = {pk for pair in candidates for pk in pair}
+    signatures = {
+        submission_id: _decode(blob)
+        for submission_id, blob in SubmissionSignature.objects.filter(
+            submission_id__in=ids
+        ).values_list("submission_id", "minhash")
+    }
+    scored = []
+    for a, b in candidates:
+        if a in signatures and b in signatures:
+            similarity = estimated_similarity(signatures[a], signatures[b])
+            if similarity >= threshold:
+                scored.append((similarity, a, b))
+    if not scored:
+        return []
+
+    submissions = Submission.objects.select_related("student__user").in_bulk(
+        {pk for _, a, b in scored for pk in (a, b)}
+    )
+    scored.sort(reverse=True)
+    return [(score, submissions[a], submissions[b]) for score, a, b in scored]
@@ -0,0 +1,1226 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics,
+    autograder,
+    cloning,
+    coursegrades,
+    events,
+    gradestats,
+    ordering,
+    packages,
+)
+from .autocomplete import autocomplete_index
+from .facets import catalog_index
+from .invalidation import bus
+from .models import (
+    Assignment,
+    AssignmentGradeStats,
+    AssignmentTestCase,
+    Category,
+    Course,
+    CourseGrade,
+    CourseVersion,
+    Enrollment,
+    Instructor,
+    Lesson,
+    LessonProgress,
+    Student,
+    Submission,
+    Tag,
+    User,
+)
+from .provisioning import provision_users
+from .recommendations import rebuild_recommendations
+from .reference import REFERENCE, bump_cache_version, cache_version, reference_data
+from .similarity import index_submissions, suspicious_pairs
+
+
+@override_settings(
+    EVENT_LOG_ENABLED=False,
+    INVALIDATION_POLL_INTERVAL=3600,
+    SIMILARITY_INDEX_IN_BACKGROUND=False,
+)
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("teacher", password="pw", role="instructor")
+        cls.instructor = Instructor.objects.create(user=user)
+        cls.instructor_user = user
+        cls.category = Category.objects.create(name="Programming")
+        cls.tags = [Tag.objects.create(name=f"tag{i}") for i in range(3)]
+        user = User.objects.create_user("learner", password="pw", role="student")
+        cls.student = Student.objects.create(user=user)
+        cls.student_user = user
+
+    def setUp(self):
+        # Keep the per-request bus poll and the autocomplete build out of the
+        # counts below.
+        bus.poll(force=True)
+        autocomplete_index.built_at = 0
+        # Cached course versions would outlive the rolled-back rows.
+        cache.clear()
+
+    def add_courses(self, count):
+        """Published courses, each with tags, lessons, an assignment, the
+        student's enrollment and a graded submission."""
+        for i in range(count):
+            course = Course.objects.create(
+                title=f"Course {i}",
+                description="About it",
+                instructor=self.instructor,
+                category=self.category,
+                price=10,
+                published=True,
+            )
+            course.tags.set(self.tags)
+            lessons = [
+                Lesson.objects.create(course=course, title=f"Lesson {n}", order=n)
+                for n in range(2)
+            ]
+            assignment = Assignment.objects.create(
+                lesson=lessons[0],
+                title="Exercise",
+                description="Do it",
+                due_date=timezone.now(),
+            )
+            Enrollment.objects.create(student=self.student, course=course)
+            Submission.objects.create(
+                assignment=assignment,
+                student=self.student,
+                content="print(1)",
+                score=80,
+                graded=True,
+            )
+
+    def get(self, name, *args, **params):
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+
+class ApiQueryCountTests(ApiTestCase):
+    """Query counts must not depend on how many rows a page holds."""
+
+    # One query for the session, one for the user.
+    AUTH = 2
+
+    def assertListQueries(self, expected, name, login=True, **params):
+        if login:
+            self.client.force_login(self.student_user)
+        self.add_courses(2)
+        with self.assertNumQueries(expected + (self.AUTH if login else 0)):
+            small = self.get(name, **params)["results"]
+        self.add_courses(5)
+        with self.assertNumQueries(expected + (self.AUTH if login else 0)):
+            large = self.get(name, **params)["results"]
+        self.assertGreater(len(large), len(small))
+
+    def assertDetailQueries(self, expected, name, pk, user=None, **params):
+        self.client.force_login(user or self.student_user)
+        with self.assertNumQueries(expected + self.AUTH):
+            self.get(name, pk, **params)
+
+    def test_course_list(self):
+        self.assertListQueries(
+            3,
+            "api_course_list",
+            login=False,
+            include="category,instructor,tags,lessons",
+        )
+
+    def test_course_detail(self):
+        self.add_courses(1)
+        course = Course.objects.get()
+        self.assertDetailQueries(
+            3,
+            "api_course_detail",
+            course.pk,
+            include="category,instructor,tags,lessons",
+        )
+
+    def test_lesson_list(self):
+        self.assertListQueries(2, "api_lesson_list", include="course,assignments")
+
+    def test_lesson_detail(self):
+        self.add_courses(1)
+        lesson = Lesson.objects.first()
+        self.assertDetailQueries(
+            2, "api_lesson_detail", lesson.pk, include="course,assignments"
+        )
+
+    def test_enrollment_list(self):
+        self.assertListQueries(1, "api_enrollment_list", include="course,student")
+
+    def test_submission_list(self):
+        self.assertListQueries(1, "api_submission_list", include="assignment,student")
+
+    def test_submission_detail(self):
+        self.add_courses(1)
+        submission = Submission.objects.get()
+        self.assertDetailQueries(
+            1,
+            "api_submission_detail",
+            submission.pk,
+            user=self.instructor_user,
+            include="assignment,student",
+        )
+
+    def test_grade_list(self):
+        self.assertListQueries(1, "api_grade_list", include="assignment")
+
+    def test_autocomplete_is_served_from_memory(self):
+        self.add_courses(2)
+        self.get("api_autocomplete", q="cou")
+        with self.assertNumQueries(0):
+            results = self.get("api_autocomplete", q="cou")["results"]
+        self.assertTrue(results)
+
+
+class ApiValidationTests(ApiTestCase):
+    def test_non_numeric_filters_are_rejected(self):
+        self.client.force_login(self.student_user)
+        for name, param in (
+            ("api_lesson_list", "course"),
+            ("api_submission_list", "assignment"),
+        ):
+            for value in ("abc", "1.5", "-1", "²", str(2**64)):
+                response = self.client.get(reverse(name), {param: value})
+                self.assertEqual(response.status_code, 400, (name, value))
+                self.assertIn(param, response.json()["error"])
+
+    def test_non_numeric_ids_in_bodies_are_rejected(self):
+        self.client.force_login(self.student_user)
+        for name, field in (
+            ("api_enrollment_list", "course"),
+            ("api_submission_list", "assignment"),
+        ):
+            for value in ("abc", None, True, [1], {"id": 1}, 1.5):
+                response = self.client.post(
+                    reverse(name),
+                    json.dumps({field: value}),
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 400, (name, value))
+
+    def test_lesson_create_rejects_non_numeric_course(self):
+        self.client.force_login(self.instructor_user)
+        response = self.client.post(
+            reverse("api_lesson_list"),
+            json.dumps({"course": "abc", "title": "Intro"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_move_lesson_rejects_non_id_after(self):
+        self.add_courses(1)
+        self.client.force_login(self.instructor_user)
+        first, second = Lesson.objects.order_by("order")
+        url = reverse("api_move_lesson", args=[second.pk])
+        for value in (True, False, "abc", 1.5, [first.pk]):
+            response = self.client.post(
+                url, json.dumps({"after": value}), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400, value)
+            self.assertEqual(
+                response.json()["error"], "after must be an integer id.", value
+            )
+        response = self.client.post(
+            url, json.dumps({"after": None}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Lesson.objects.order_by("order")), [second, first])
+
+    def test_numeric_strings_still_filter(self):
+        self.add_courses(2)
+        self.client.force_login(self.student_user)
+        course = Course.objects.first()
+        results = self.get("api_lesson_list", course=str(course.pk))["results"]
+        self.assertEqual({lesson["course_id"] for lesson in results}, {course.pk})
+
+
+class ApiGradeTests(ApiTestCase):
+    def test_grading_records_a_grade_event(self):
+        self.add_courses(1)
+        submission = Submission.objects.get()
+        self.client.force_login(self.instructor_user)
+        with mock.patch.object(events, "record") as record:
+            response = self.client.post(
+                reverse("api_grade_submission", args=[submission.pk]),
+                json.dumps({"score": 95, "feedback": "Good"}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        record.assert_called_once_with(
+            events.GRADE,
+            self.instructor_user,
+            course=submission.assignment.lesson.course_id,
+            assignment=submission.assignment_id,
+            submission=submission.pk,
+            student=self.student_user.pk,
+            score=95,
+        )
+
+
+@override_settings(
+    EVENT_LOG_ENABLED=False,
+    INVALIDATION_POLL_INTERVAL=3600,
+    SIMILARITY_INDEX_IN_BACKGROUND=False,
+)
+class CourseVersionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_courses(1)
+        self.course = Course.objects.get()
+
+    def new_student(self, username):
+        user = User.objects.create_user(username, password="pw", role="student")
+        return Student.objects.create(user=user)
+
+    def test_clone_copies_content_and_shifts_due_dates(self):
+        assignment = Assignment.objects.get()
+        AssignmentTestCase.objects.create(
+            assignment=assignment, name="adds", stdin="1 2", expected_output="3"
+        )
+        clone = cloning.clone_course(self.course, shift=timedelta(days=7))
+
+        self.assertEqual(clone.title, "Course 0 (copy)")
+        self.assertFalse(clone.published)
+        self.assertEqual(set(clone.tags.all()), set(self.tags))
+        self.assertEqual(
+            list(clone.lessons.values_list("title", "order")),
+            [("Lesson 0", 0), ("Lesson 1", 1)],
+        )
+        copy = Assignment.objects.get(lesson__course=clone)
+        self.assertEqual(copy.lesson.title, "Lesson 0")
+        self.assertEqual(copy.due_date, assignment.due_date + timedelta(days=7))
+        self.assertEqual(
+            list(copy.test_cases.values_list("name", "stdin", "expected_output")),
+            [("adds", "1 2", "3")],
+        )
+        # The original is left as it was.
+        self.assertEqual(assignment.test_cases.count(), 1)
+        self.assertEqual(
+            Assignment.objects.get(pk=assignment.pk).due_date, assignment.due_date
+        )
+
+    def test_unchanged_course_reuses_its_version(self):
+        with mock.patch.object(
+            cloning, "snapshot_course", wraps=cloning.snapshot_course
+        ) as snapshot:
+            first, _ = cloning.enroll_student(self.new_student("a"), self.course)
+            second, _ = cloning.enroll_student(self.new_student("b"), self.course)
+            self.assertEqual(snapshot.call_count, 1)
+            self.assertEqual(first.version_id, second.version_id)
+
+            lesson = Lesson.objects.get(title="Lesson 1")
+            lesson.title = "Lesson 1, revised"
+            with self.captureOnCommitCallbacks(execute=True):
+                lesson.save()
+            third, _ = cloning.enroll_student(self.new_student("c"), self.course)
+        self.assertNotEqual(third.version_id, first.version_id)
+        self.assertEqual(CourseVersion.objects.filter(course=self.course).count(), 2)
+
+    def test_pinned_student_sees_the_content_they_enrolled_in(self):
+        self.client.login(username="learner", password="pw")
+        Enrollment.objects.filter(student=self.student).delete()
+        self.client.get(reverse("enroll_course", args=[self.course.pk]))
+        lesson = Lesson.objects.get(title="Lesson 1")
+        lesson.title = "Lesson 1, revised"
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.save()
+
+        url = reverse("lesson_detail", args=[lesson.pk])
+        response = self.client.get(url)
+        self.assertContains(response, "Lesson 1")
+        self.assertNotContains(response, "revised")
+
+        newcomer = self.new_student("newcomer")
+        cloning.enroll_student(newcomer, self.course)
+        self.client.force_login(newcomer.user)
+        self.assertContains(self.client.get(url), "Lesson 1, revised")
+
+
+class CoursePackageTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_courses(1)
+        self.course = Course.objects.get()
+        self.source = self.storage()
+        name = self.source.save("lesson_pdfs/notes.pdf", ContentFile(b"%PDF notes"))
+        Lesson.objects.filter(title="Lesson 0").update(pdf_file=name)
+        AssignmentTestCase.objects.create(
+            assignment=Assignment.objects.get(),
+            name="adds",
+            stdin="1 2",
+            expected_output="3",
+            points=2,
+        )
+        self.target = self.storage()
+
+    def storage(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return FileSystemStorage(location=directory.name)
+
+    def package(self, edit=None):
+        buffer = io.BytesIO()
+        packages.export_course(self.course, buffer, storage=self.source)
+        if edit is None:
+            return buffer
+        # Rewrite the archive with an edited manifest.
+        edited = io.BytesIO()
+        with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(
+            edited, "w"
+        ) as target:
+            for info in source.infolist():
+                data = source.read(info)
+                if info.filename == packages.MANIFEST:
+                    manifest = json.loads(data)
+                    edit(manifest)
+                    data = json.dumps(manifest)
+                target.writestr(info.filename, data)
+        return edited
+
+    def test_round_trip(self):
+        report = packages.import_course(self.package(), storage=self.target)
+        self.assertEqual(report.media_copied, 1)
+        imported = Course.objects.get(pk=report.course.pk)
+        self.assertNotEqual(imported.pk, self.course.pk)
+        self.assertEqual(
+            packages.course_manifest(imported), packages.course_manifest(self.course)
+        )
+        self.assertEqual(set(imported.tags.all()), set(self.tags))
+        with self.target.open("lesson_pdfs/notes.pdf") as f:
+            self.assertEqual(f.read(), b"%PDF notes")
+
+        # Importing again into the same storage reuses the identical file.
+        report = packages.import_course(self.package(), storage=self.target)
+        self.assertEqual((report.media_copied, report.media_skipped), (0, 1))
+
+    def test_missing_manifest_key_is_a_package_error(self):
+        def edit(manifest):
+            del manifest["lessons"][0]["assignments"][0]["title"]
+
+        with self.assertRaisesMessage(
+            packages.PackageError, "lesson 1 assignment 1 is missing title"
+        ):
+            packages.import_course(self.package(edit), storage=self.target)
+        self.assertEqual(Course.objects.count(), 1)
+        self.assertFalse(self.target.exists("lesson_pdfs/notes.pdf"))
+
+    def test_failed_import_deletes_the_media_it_saved(self):
+        with mock.patch.object(packages, "copy_rows", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                packages.import_course(self.package(), storage=self.target)
+        self.assertEqual(Course.objects.count(), 1)
+        self.assertFalse(self.target.exists("lesson_pdfs/notes.pdf"))
+
+
+class InvalidationBusTests(TestCase):
+    def test_eviction_waits_for_commit(self):
+        cache.set("course:1", "cached")
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                bus.publish("course:1")
+                # A concurrent request refills the key from pre-commit rows.
+                cache.set("course:1", "refilled")
+                self.assertEqual(cache.get("course:1"), "refilled")
+        self.assertIsNone(cache.get("course:1"))
+
+    def test_rolled_back_publish_keeps_the_key(self):
+        cache.set("course:2", "cached")
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    bus.publish("course:2")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(cache.get("course:2"), "cached")
+
+    def test_other_processes_evict_published_keys(self):
+        # Worker processes on a file-backed SQLite database; see the script.
+        script = os.path.join(settings.BASE_DIR, "scripts", "check_invalidation.py")
+        result = subprocess.run(
+            [sys.executable, script, "--workers=2", "--courses=3", "--interval=0.05"],
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("evicted 3/3, reindexed 3/3, rolled-back key kept", result.stdout)
+
+
+class CourseDetailConditionalTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("teacher", password="pw", role="instructor")
+        instructor = Instructor.objects.create(user=user)
+        category = Category.objects.create(name="Programming")
+        self.courses = [
+            Course.objects.create(
+                title=f"Course {i}",
+                description="",
+                instructor=instructor,
+                category=category,
+                price=10,
+                published=True,
+            )
+            for i in range(3)
+        ]
+        self.students = []
+        for i in range(2):
+            user = User.objects.create_user(f"s{i}", password="pw", role="student")
+            self.students.append(Student.objects.create(user=user))
+
+    def enroll(self, student, course):
+        Enrollment.objects.create(student=student, course=course)
+
+    def test_rebuilt_recommendations_change_the_validators(self):
+        first, second, third = self.courses
+        self.enroll(self.students[0], first)
+        self.enroll(self.students[0], second)
+        rebuild_recommendations()
+        url = reverse("course_detail", args=[first.pk])
+        response = self.client.get(url)
+        self.assertContains(response, second.title)
+        etag, modified = response["ETag"], response["Last-Modified"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+        # Enrollments outside this course only change its recommendations.
+        Enrollment.objects.filter(course=second).delete()
+        self.enroll(self.students[1], first)
+        Enrollment.objects.filter(student=self.students[1]).delete()
+        self.enroll(self.students[0], third)
+        rebuild_recommendations()
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=modified
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, third.title)
+
+    def test_renamed_recommendation_changes_the_etag(self):
+        first, second, _ = self.courses
+        self.enroll(self.students[0], first)
+        self.enroll(self.students[0], second)
+        rebuild_recommendations()
+        url = reverse("course_detail", args=[first.pk])
+        etag = self.client.get(url)["ETag"]
+        second.title = "Renamed course"
+        second.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Renamed course")
+
+
+@override_settings(EVENT_LOG_ENABLED=True)
+class EventCompactionTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.log = events.EventLog(self.directory.name, batch_size=1000)
+
+    def write(self, *users):
+        for user in users:
+            self.log.record(events.ENROLL, user, course=1)
+        self.log.flush()
+
+    def users(self, day):
+        found = events.read_events(day, day, directory=self.directory.name)
+        return [event["user"] for event in found]
+
+    def test_late_flush_after_compaction_is_kept(self):
+        self.write(1, 2)
+        day = events.event_days(self.directory.name)[0]
+        self.assertEqual(events.compact_day(day, self.directory.name), 2)
+        # The writer still has the day's segment path cached.
+        self.write(3)
+        self.assertEqual(self.users(day), [1, 2, 3])
+        self.assertEqual(events.compact_day(day, self.directory.name), 3)
+        self.assertEqual(self.users(day), [1, 2, 3])
+
+    def test_flush_during_compaction_is_kept(self):
+        self.write(1, 2)
+        day = events.event_days(self.directory.name)[0]
+        read_file = events._read_file
+
+        def read_and_flush(path):
+            yield from read_file(path)
+            self.write(3)
+
+        with mock.patch.object(events, "_read_file", read_and_flush):
+            events.compact_day(day, self.directory.name)
+        self.assertEqual(sorted(self.users(day)), [1, 2, 3])
+
+    def test_torn_segment_is_not_compacted(self):
+        self.write(1, 2)
+        day = events.event_days(self.directory.name)[0]
+        (path,) = self.log._segments.values()
+        with open(path, "a") as f:
+            f.write('{"ts":"')
+        self.assertIsNone(events.compact_day(day, self.directory.name))
+        day_dir = os.path.dirname(path)
+        self.assertEqual(
+            [name[: len(events.SEALED_PREFIX)] for name in os.listdir(day_dir)],
+            [events.SEALED_PREFIX],
+        )
+        self.assertEqual(self.users(day), [1, 2])
+
+
+class AutograderEventTests(ApiTestCase):
+    def test_saved_grades_are_recorded(self):
+        self.add_courses(1)
+        submission = Submission.objects.get()
+        submission.score = 70
+        with mock.patch.object(events, "record") as record:
+            autograder._save_grades([submission])
+        record.assert_called_once_with(
+            events.GRADE,
+            None,
+            course=submission.assignment.lesson.course_id,
+            assignment=submission.assignment_id,
+            submission=submission.pk,
+            student=self.student_user.pk,
+            score=70,
+            autograded=True,
+        )
+
+    def test_scores_are_scaled_and_capped(self):
+        self.add_courses(1)
+        submission = Submission.objects.get()
+        submission.content = "print(int(input()) * 2)"
+        submission.save()
+        assignment = submission.assignment
+        for n, (stdin, expected) in enumerate((("1", "2"), ("2", "5"), ("3", "6"))):
+            AssignmentTestCase.objects.create(
+                assignment=assignment,
+                name=f"case {n}",
+                stdin=stdin,
+                expected_output=expected,
+            )
+        for max_score, expected in ((30, 20), (300, 100)):
+            Assignment.objects.filter(pk=assignment.pk).update(max_score=max_score)
+            graded = autograder.autograde(Submission.objects.all(), workers=1)
+            self.assertEqual(graded, 1)
+            submission.refresh_from_db()
+            self.assertEqual(submission.score, expected)
+            submission.full_clean()
+
+
+class GradeStatsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_courses(1)
+        self.assignment = Assignment.objects.get()
+        self.students = [self.student]
+        for i in range(4):
+            user = User.objects.create_user(f"s{i}", role="student")
+            self.students.append(Student.objects.create(user=user))
+
+    def submit(self, student, score=None):
+        return Submission.objects.create(
+            assignment=self.assignment,
+            student=student,
+            content="print(1)",
+            score=score,
+            graded=score is not None,
+        )
+
+    def stats(self):
+        row = AssignmentGradeStats.objects.filter(assignment=self.assignment).first()
+        if row is None:
+            return 0, 0, 0, []
+        histogram = list(row.histogram)
+        while histogram and not histogram[-1]:
+            histogram.pop()
+        return row.count, row.total, row.total_squares, histogram
+
+    def assertMatchesRebuild(self):
+        incremental = self.stats()
+        gradestats.rebuild_stats(Assignment.objects.filter(pk=self.assignment.pk))
+        self.assertEqual(incremental, self.stats())
+
+    def test_incremental_stats_match_a_rebuild(self):
+        # Created: graded, ungraded and a zero score.
+        submissions = [
+            self.submit(self.students[1], 95),
+            self.submit(self.students[2]),
+            self.submit(self.students[3], 0),
+            self.submit(self.students[4], 80),
+        ]
+        self.assertEqual(self.stats()[:3], (4, 255, 80 * 80 + 95 * 95 + 80 * 80))
+        self.assertMatchesRebuild()
+
+        # Updated: regraded, graded later and ungraded again.
+        first, ungraded, zero, _ = submissions
+        first.score = 60
+        first.save()
+        ungraded.score, ungraded.graded = 100, True
+        ungraded.save()
+        zero.graded = False
+        zero.save()
+        self.assertMatchesRebuild()
+
+        # Graded through the autograder's bulk_update path.
+        first.score = 70
+        autograder._save_grades([first])
+        self.assertMatchesRebuild()
+
+        # Deleted.
+        ungraded.delete()
+        Submission.objects.filter(student=self.student).delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.stats()[:3], (2, 150, 70 * 70 + 80 * 80))
+
+
+class LessonOrderingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = Course.objects.create(
+            title="Ordered",
+            description="",
+            instructor=self.instructor,
+            category=self.category,
+        )
+        self.lessons = []
+        for title in "abcd":
+            self.lessons.append(
+                Lesson.objects.create(
+                    course=self.course,
+                    title=title,
+                    order=ordering.next_order(self.course),
+                )
+            )
+
+    def titles(self):
+        return "".join(self.course.lessons.values_list("title", flat=True))
+
+    def test_new_lessons_are_appended_with_gaps(self):
+        gap = ordering.ORDER_GAP
+        self.assertEqual(
+            [lesson.order for lesson in self.lessons], [gap, 2 * gap, 3 * gap, 4 * gap]
+        )
+
+    def test_move_updates_only_the_moved_lesson(self):
+        a, b, c, d = self.lessons
+        with self.assertRaises(ValueError):
+            ordering.move_lesson(a, a)
+        self.assertEqual(ordering.move_lesson(d, None), ordering.ORDER_GAP // 2)
+        self.assertEqual(self.titles(), "dabc")
+        ordering.move_lesson(a, c)
+        self.assertEqual(self.titles(), "dbca")
+        self.assertEqual(
+            [ordering.lesson_position(lesson) for lesson in self.lessons], [4, 2, 3, 1]
+        )
+        b.refresh_from_db()
+        self.assertEqual(b.order, 2 * ordering.ORDER_GAP)
+
+    def test_a_full_gap_is_rebalanced(self):
+        a = self.lessons[0]
+        expected = list("abcd")
+        with mock.patch.object(
+            ordering, "rebalance", wraps=ordering.rebalance
+        ) as rebalance:
+            # Keep moving the last lesson directly after "a".
+            for _ in range(16):
+                last = self.course.lessons.last()
+                ordering.move_lesson(last, a)
+                expected.remove(last.title)
+                expected.insert(1, last.title)
+                self.assertEqual(self.titles(), "".join(expected))
+        self.assertTrue(rebalance.called)
+        orders = list(self.course.lessons.values_list("order", flat=True))
+        self.assertEqual(len(set(orders)), len(orders))
+
+    def test_crowded_courses_are_found_and_rebalanced(self):
+        for order, lesson in enumerate(self.lessons, 1):
+            Lesson.objects.filter(pk=lesson.pk).update(order=order)
+        self.assertIn(self.course.pk, list(ordering.crowded_courses()))
+        self.assertEqual(ordering.rebalance(self.course.pk), 4)
+        self.assertEqual(self.titles(), "abcd")
+        self.assertNotIn(self.course.pk, list(ordering.crowded_courses()))
+        self.assertEqual(ordering.rebalance(self.course.pk), 0)
+
+
+class GradeDistributionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_courses(1)
+        self.assignment = Assignment.objects.get()
+        # With add_courses' 80: 40, 60, 60, 80, 80, 100.
+        for i, score in enumerate((40, 60, 60, 80, 100)):
+            user = User.objects.create_user(f"s{i}", role="student")
+            Submission.objects.create(
+                assignment=self.assignment,
+                student=Student.objects.create(user=user),
+                content="print(1)",
+                score=score,
+                graded=True,
+            )
+
+    def test_assignment_distribution(self):
+        stats = gradestats.stats_for([self.assignment])[self.assignment.pk]
+        self.assertEqual(stats.count, 6)
+        self.assertEqual(stats.mean, 70)
+        self.assertAlmostEqual(stats.stddev, (1100 / 3) ** 0.5)
+        self.assertEqual(
+            [stats.percentile(p) for p in (0.25, 0.5, 0.75, 0.9)], [60, 60, 80, 100]
+        )
+        self.assertEqual([stats.rank(s) for s in (100, 80, 60, 40)], [1, 2, 4, 6])
+        self.assertAlmostEqual(stats.percentile_rank(80), 100 * 4 / 6)
+        bins = stats.bins()
+        self.assertEqual(len(bins), 10)
+        self.assertEqual((bins[0][0], bins[-1][1]), (0, 100))
+        self.assertEqual(
+            [count for _, _, count in bins], [0, 0, 0, 0, 1, 0, 2, 0, 2, 1]
+        )
+
+    def test_course_summary_combines_percentages(self):
+        half = Assignment.objects.create(
+            lesson=self.assignment.lesson,
+            title="Quiz",
+            description="",
+            due_date=timezone.now(),
+            max_score=50,
+        )
+        Submission.objects.create(
+            assignment=half, student=self.student, score=25, graded=True
+        )
+        assignments, summary = gradestats.course_stats(Course.objects.get())
+        self.assertEqual([a.stats.count for a in assignments], [6, 1])
+        self.assertEqual(summary["count"], 7)
+        self.assertAlmostEqual(summary["mean_percent"], (420 + 50) / 7)
+        self.assertEqual(
+            [n for _, _, n in summary["bins"]], [0, 0, 0, 0, 1, 1, 2, 0, 2, 1]
+        )
+        self.assertEqual(summary["bins"][-1][:2], (90, 100))
+
+
+class CourseGradeTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_courses(1)
+        self.course = Course.objects.get()
+        # add_courses graded the first assignment 80/100 with weight 1.
+        self.first = Assignment.objects.get()
+        self.second = Assignment.objects.create(
+            lesson=self.first.lesson,
+            title="Project",
+            description="",
+            due_date=timezone.now(),
+            max_score=50,
+            weight=3,
+        )
+        self.submission = Submission.objects.create(
+            assignment=self.second,
+            student=self.student,
+            content="print(2)",
+            score=40,
+            graded=True,
+        )
+
+    def grade(self):
+        row = CourseGrade.objects.get(course=self.course, student=self.student)
+        return row.earned, row.graded_weight
+
+    def assertGrade(self, earned, graded_weight):
+        cached = self.grade()
+        self.assertAlmostEqual(cached[0], earned)
+        self.assertEqual(cached[1], graded_weight)
+        # The running sums agree with a rebuild from the submissions.
+        coursegrades.recompute_course(self.course.pk)
+        self.assertAlmostEqual(self.grade()[0], cached[0])
+        self.assertEqual(self.grade()[1], cached[1])
+
+    def test_cached_grade_follows_changes(self):
+        self.assertGrade(0.8 + 3 * 0.8, 4)
+
+        self.submission.score = 25
+        self.submission.save()
+        self.assertGrade(0.8 + 3 * 0.5, 4)
+
+        self.second.weight = 1
+        self.second.save()
+        self.assertGrade(0.8 + 0.5, 2)
+        self.second.max_score = 25
+        self.second.save()
+        self.assertGrade(0.8 + 1.0, 2)
+
+        self.submission.delete()
+        self.assertGrade(0.8, 1)
+
+
+class WeightedCourseGradeTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_courses(1)
+        self.course = Course.objects.get()
+        # add_courses graded the learner 80/100 on an assignment of weight 1.
+        first = Assignment.objects.get()
+        second = Assignment.objects.create(
+            lesson=first.lesson,
+            title="Project",
+            description="",
+            due_date=timezone.now(),
+            max_score=50,
+            weight=3,
+        )
+        self.others = []
+        for username, scores in (("b", (50, 40)), ("c", (None, None))):
+            user = User.objects.create_user(username, role="student")
+            student = Student.objects.create(user=user)
+            self.others.append(student)
+            for assignment, score in zip((first, second), scores):
+                Submission.objects.create(
+                    assignment=assignment,
+                    student=student,
+                    score=score,
+                    graded=score is not None,
+                )
+
+    def test_gradebook_weights_scores_by_assignment(self):
+        self.assertEqual(coursegrades.course_weight(self.course), 4)
+        rows = list(coursegrades.gradebook(self.course))
+        # Students without graded work have no row.
+        self.assertEqual([row.student.user.username for row in rows], ["learner", "b"])
+        # learner: 80% on weight 1; b: (0.5 * 1 + 0.8 * 3) / 4.
+        self.assertAlmostEqual(rows[0].grade, 80)
+        self.assertAlmostEqual(rows[1].grade, 72.5)
+        self.assertEqual([row.graded_weight for row in rows], [1, 4])
+
+    def test_gradebook_page_shows_grade_so_far_and_overall(self):
+        self.client.force_login(self.instructor_user)
+        response = self.client.get(reverse("course_gradebook", args=[self.course.pk]))
+        self.assertContains(response, "Total assignment weight 4.")
+        # learner: 80.0% so far, 20.0% of the whole course.
+        self.assertContains(response, "<td>80.0%</td>", html=True)
+        self.assertContains(response, "<td>20.0%</td>", html=True)
+        self.assertContains(response, "<td>72.5%</td>", html=True, count=2)
+
+
+@override_settings(REFERENCE_DATA_CHECK_INTERVAL=3600)
+class ReferenceDataCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        reference_data._snapshot = None
+
+    def test_snapshot_is_reused_until_a_change(self):
+        data = reference_data.get()
+        self.assertEqual(list(data.categories.values()), ["Programming"])
+        self.assertEqual(list(data.instructors.values()), ["teacher"])
+        with self.assertNumQueries(0):
+            self.assertIs(reference_data.get(), data)
+
+        # A change in this process is visible straight away.
+        Tag.objects.create(name="Algorithms")
+        self.assertEqual(
+            list(reference_data.get().tags.values()),
+            ["Algorithms", "tag0", "tag1", "tag2"],
+        )
+        self.instructor_user.first_name = "Ada"
+        self.instructor_user.save()
+        self.assertEqual(list(reference_data.get().instructors.values()), ["Ada"])
+
+    def test_logins_do_not_invalidate(self):
+        reference_data.get()
+        version = cache_version(REFERENCE)
+        self.instructor_user.last_login = timezone.now()
+        self.instructor_user.save(update_fields=["last_login"])
+        self.assertEqual(cache_version(REFERENCE), version)
+        with self.assertNumQueries(0):
+            reference_data.get()
+
+    def test_other_process_changes_are_seen_after_the_interval(self):
+        data = reference_data.get()
+        # Another worker renames the category and bumps the version.
+        Category.objects.filter(pk=self.category.pk).update(name="Coding")
+        bump_cache_version(REFERENCE)
+        self.assertIs(reference_data.get(), data)
+        with override_settings(REFERENCE_DATA_CHECK_INTERVAL=0):
+            self.assertEqual(
+                list(reference_data.get().categories.values()), ["Coding"]
+            )
+            # Checked again, but the version has not moved: no reload.
+            with self.assertNumQueries(1):
+                reference_data.get()
+
+
+@override_settings(
+    EVENT_LOG_ENABLED=False,
+    INVALIDATION_POLL_INTERVAL=3600,
+    SIMILARITY_INDEX_IN_BACKGROUND=False,
+)
+class CatalogPriceFilterTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("teacher", password="pw", role="instructor")
+        instructor = Instructor.objects.create(user=user)
+        category = Category.objects.create(name="Programming")
+        for price in (5, 20):
+            Course.objects.create(
+                title=f"Course {price}",
+                description="",
+                instructor=instructor,
+                category=category,
+                price=price,
+                published=True,
+            )
+        bus.poll(force=True)
+        catalog_index.built_at = 0
+
+    def test_non_finite_prices_are_ignored(self):
+        for value in ("NaN", "sNaN", "-nan", "Infinity", "-inf", "abc"):
+            response = self.client.get(reverse("course_list"), {"min_price": value})
+            self.assertEqual(response.status_code, 200, value)
+            self.assertEqual(len(response.context["courses"]), 2, value)
+            response = self.client.get(reverse("course_list"), {"max_price": value})
+            self.assertEqual(response.status_code, 200, value)
+
+
+@override_settings(
+    EVENT_LOG_ENABLED=False,
+    INVALIDATION_POLL_INTERVAL=3600,
+    SIMILARITY_INDEX_IN_BACKGROUND=False,
+)
+class ProvisioningTests(TestCase):
+    def provision(self, *records):
+        lines = [json.dumps(record) + "\n" for record in records]
+        return provision_users(iter(lines), fmt="jsonl", sso=True).as_dict()
+
+    def test_non_string_values_are_line_errors(self):
+        report = self.provision(
+            {"username": "a", "email": 5},
+            {"username": "b", "role": None, "first_name": ["x"]},
+            {"username": 7},
+            {"username": "c", "role": {"name": "student"}},
+            {"username": "d", "bio": 1, "role": "student"},
+            {"username": "e", "email": None},
+        )
+        self.assertEqual(report["created"], 1)
+        self.assertEqual([error["line"] for error in report["errors"]], [1, 2, 3, 4, 5])
+        self.assertTrue(User.objects.filter(username="e").exists())
+
+    def test_existing_email_matches_case_insensitively(self):
+        User.objects.create_user("first", email="Ada@Example.com")
+        report = self.provision({"username": "second", "email": "ada@example.COM"})
+        self.assertEqual(report["created"], 0)
+        self.assertEqual(len(report["skipped"]), 1)
+
+    def test_impossible_date_of_birth_is_a_line_error(self):
+        report = self.provision(
+            {"username": "a", "role": "student", "date_of_birth": "2000-02-30"},
+            {"username": "b", "role": "student", "date_of_birth": "2000-02-29"},
+        )
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["errors"][0]["line"], 1)
+        self.assertIn("date_of_birth", report["errors"][0]["error"])
+        self.assertEqual(
+            Student.objects.get(user__username="b").date_of_birth, date(2000, 2, 29)
+        )
+
+
+@override_settings(SIMILARITY_MAX_BUCKET_SIZE=5)
+class SuspiciousPairsTests(ApiTestCase):
+    def test_boilerplate_buckets_are_skipped(self):
+        self.add_courses(1)
+        assignment = Assignment.objects.get()
+        boilerplate = "def solve(numbers):\n    # your code here\n    return None\n"
+        copied = (
+            "def solve(numbers):\n    total = 0\n    for n in sorted(numbers):\n"
+            "        total += n * n if n % 2 else n\n    return total // 3\n"
+        )
+        contents = [boilerplate] * 8 + [copied] * 2
+        submissions = []
+        for i, content in enumerate(contents):
+            user = User.objects.create_user(f"student{i}", role="student")
+            submissions.append(
+                Submission.objects.create(
+                    assignment=assignment,
+                    student=Student.objects.create(user=user),
+                    content=content,
+                )
+            )
+        index_submissions(submissions)
+        pairs = suspicious_pairs(assignment)
+        self.assertEqual(
+            [(a.pk, b.pk) for _, a, b in pairs],
+            [(submissions[-2].pk, submissions[-1].pk)],
+        )
+
+
+class GenerateCertificatesCommandTests(TestCase):
+    def test_invalid_since_is_a_command_error(self):
+        for value in ("yesterday", "2024-02-30", "2024-13-01"):
+            with self.assertRaisesMessage(CommandError, "--since"):
+                call_command("generate_certificates", since=value, workers=1)
+
+
+@override_settings(
+    EVENT_LOG_ENABLED=False,
+    INVALIDATION_POLL_INTERVAL=3600,
+    SIMILARITY_INDEX_IN_BACKGROUND=False,
+)
+class CohortReportSinceTests(TestCase):
+    def test_invalid_since_is_a_bad_request(self):
+        user = User.objects.create_user("staff", password="pw", role="employee")
+        self.client.force_login(user)
+        for value in ("2024-02-30", "2024-13-01"):
+            response = self.client.get(reverse("cohort_report"), {"since": value})
+            self.assertEqual(response.status_code, 400, value)
+        response = self.client.get(reverse("cohort_report"), {"since": "2024-02-01"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_since_is_a_command_error(self):
+        for value in ("yesterday", "2024-02-30"):
+            with self.assertRaisesMessage(CommandError, "--since"):
+                call_command("cohort_report", since=value)
+
+
+def _utc(day, hour=0):
+    return datetime(2024, 1, 1, hour, tzinfo=dt_timezone.utc) + timezone.timedelta(
+        days=day - 1
+    )
+
+
+@override_settings(
+    EVENT_LOG_ENABLED=False,
+    INVALIDATION_POLL_INTERVAL=3600,
+    SIMILARITY_INDEX_IN_BACKGROUND=False,
+)
+class CohortReportTests(TestCase):
+    """A hand-checked fixture; 2024-01-01 is a Monday."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("teacher", role="instructor")
+        instructor = Instructor.objects.create(user=user)
+        category = Category.objects.create(name="Programming")
+        cls.category = category
+        cls.a, cls.b = [
+            Course.objects.create(
+                title=title,
+                description="",
+                instructor=instructor,
+                category=category,
+                price=10,
+                published=True,
+            )
+            for title in ("A", "B")
+        ]
+        a1, a2 = [
+            Lesson.objects.create(course=cls.a, title=f"A{n}", order=n)
+            for n in (1, 2)
+        ]
+        b1 = Lesson.objects.create(course=cls.b, title="B1", order=1)
+        exercise = Assignment.objects.create(
+            lesson=a1, title="Exercise", description="", due_date=_utc(30)
+        )
+        s1, s2, s3 = [
+            Student.objects.create(
+                user=User.objects.create_user(f"s{n}", role="student")
+            )
+            for n in (1, 2, 3)
+        ]
+        for student, course, day, completed in (
+            (s1, cls.a, 1, True),
+            (s2, cls.a, 3, False),
+            (s3, cls.a, 8, False),
+            (s1, cls.b, 2, True),
+        ):
+            enrollment = Enrollment.objects.create(
+                student=student, course=course, completed=completed
+            )
+            Enrollment.objects.filter(pk=enrollment.pk).update(
+                enrolled_date=_utc(day)
+            )
+        for student, lesson, day in (
+            (s1, a1, 3),
+            (s1, a2, 11),
+            (s2, a1, 25),
+            (s1, b1, 32),
+        ):
+            LessonProgress.objects.create(
+                student=student, lesson=lesson, completed=True, completed_date=_utc(day)
+            )
+        submission = Submission.objects.create(assignment=exercise, student=s1)
+        Submission.objects.filter(pk=submission.pk).update(submitted_date=_utc(2))
+
+    def test_funnels(self):
+        report = analytics.cohort_report()
+        self.assertEqual(report.enrollments, 4)
+        steps = {
+            funnel["name"]: [(step["count"], step["rate"]) for step in funnel["steps"]]
+            for funnel in report.funnels
+        }
+        self.assertEqual(
+            steps,
+            {
+                "A": [(3, 100.0), (2, 66.7), (1, 33.3), (1, 33.3)],
+                "B": [(1, 100.0), (1, 100.0), (0, 0.0), (1, 100.0)],
+            },
+        )
+
+    def test_weekly_retention(self):
+        report = analytics.cohort_report(weeks=6)
+        self.assertEqual(
+            report.retention,
+            [
+                {
+                    "cohort": date(2024, 1, 1),
+                    "size": 3,
+                    "rates": [33.3, 33.3, 0.0, 33.3, 33.3, 0.0],
+                },
+                {"cohort": date(2024, 1, 8), "size": 1, "rates": [0.0] * 6},
+            ],
+        )
+
+    def test_monthly_cohorts_by_category(self):
+        report = analytics.cohort_report(group="category", period="month", weeks=2)
+        self.assertEqual(
+            report.retention,
+            [{"cohort": date(2024, 1, 1), "size": 4, "rates": [25.0, 25.0]}],
+        )
+        (funnel,) = report.funnels
+        self.assertEqual(funnel["id"], self.category.pk)
+        self.assertEqual([step["count"] for step in funnel["steps"]], [4, 3, 1, 2])
+
+    def test_time_to_completion(self):
+        report = analytics.cohort_report()
+        rows = {row["name"]: row for row in report.completion}
+        self.assertEqual(rows["A"]["count"], 1)
+        self.assertEqual(rows["A"]["median_days"], 10.0)
+        self.assertEqual(rows["A"]["histogram"], [0, 1, 0, 0, 0, 0, 0])
+        self.assertEqual(rows["B"]["median_days"], 30.0)
+        self.assertEqual(rows["B"]["histogram"], [0, 0, 1, 0, 0, 0, 0])
+
+        (row,) = analytics.cohort_report(group="category").completion
+        self.assertEqual(
+            (row["count"], row["mean_days"], row["median_days"], row["p90_days"]),
+            (2, 20.0, 20.0, 28.0),
+        )
+
+    def test_filters(self):
+        report = analytics.cohort_report(course=self.b.pk)
+        self.assertEqual([funnel["name"] for funnel in report.funnels], ["B"])
+        report = analytics.cohort_report(since=date(2024, 1, 3))
+        self.assertEqual(report.enrollments, 2)
+        self.assertEqual(analytics.cohort_report(since=date(2025, 1, 1)).enrollments, 0)
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Authentication
@@ -18,6 +18,12 @@ urlpatterns = [
     path('courses/<int:pk>/enroll/', views.enroll_course, name='enroll_course'),
     path('courses/create/', views.create_course, name='create_course'),
     path('courses/manage/', views.manage_courses, name='manage_courses'),
+    path('courses/<int:pk>/clone/', views.clone_course, name='clone_course'),
+    path('courses/<int:pk>/export/', views.export_course, name='export_course'),
+    path('enrollments/<int:pk>/certificate/', views.certificate, name='certificate'),
+    path('courses/<int:pk>/versions/', views.course_versions, name='course_versions'),
+    path('courses/<int:pk>/versions/<int:number>/', views.course_version, name='course_version'),
+    path('courses/<int:pk>/versions/<int:number>/lessons/<int:lesson_pk>/', views.version_lesson, name='version_lesson'),
     
     # Lessons
     path('lessons/<int:pk>/', views.lesson_detail, name='lesson_detail'),
@@ -26,11 +32,30 @@ urlpatterns = [
     # Assignments
     path('assignments/<int:pk>/', views.assignment_detail, name='assignment_detail'),
     path('assignments/<int:pk>/submit/', views.submit_assignment, name='submit_assignment'),
+    path('assignments/<int:pk>/tests/', views.assignment_test_cases, name='assignment_test_cases'),
     path('lessons/<int:lesson_pk>/assignments/create/', views.create_assignment, name='create_assignment'),
     path('submissions/grade/', views.grade_submissions, name='grade_submissions'),
     path('submissions/<int:pk>/grade/', views.grade_submission, name='grade_submission'),
+    path('assignments/<int:pk>/similarity/', views.similarity_report, name='similarity_report'),
     path('grades/', views.my_grades, name='my_grades'),
+    path('courses/<int:pk>/grades/', views.course_grade_stats, name='course_grade_stats'),
+    path('courses/<int:pk>/gradebook/', views.course_gradebook, name='course_gradebook'),
+    path('reports/cohorts/', views.cohort_report, name='cohort_report'),
     
     # Reviews
     path('courses/<int:course_pk>/review/', views.create_review, name='create_review'),
+
+    # JSON API
+    path('api/courses/', api.course_list, name='api_course_list'),
+    path('api/courses/<int:pk>/', api.course_detail, name='api_course_detail'),
+    path('api/lessons/', api.lesson_list, name='api_lesson_list'),
+    path('api/lessons/<int:pk>/', api.lesson_detail, name='api_lesson_detail'),
+    path('api/lessons/<int:pk>/move/', api.move_lesson_view, name='api_move_lesson'),
+    path('api/enrollments/', api.enrollment_list, name='api_enrollment_list'),
+    path('api/submissions/', api.submission_list, name='api_submission_list'),
+    path('api/submissions/<int:pk>/', api.submission_detail, name='api_submission_detail'),
+    path('api/submissions/<int:pk>/grade/', api.grade_submission, name='api_grade_submission'),
+    path('api/grades/', api.grade_list, name='api_grade_list'),
+    path('api/autocomplete/', api.autocomplete, name='api_autocomplete'),
+    path('api/users/provision/', api.provision_users_view, name='api_provision_users'),
 ]
@@ -1,12 +1,18 @@
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count, Avg
-from django.http import JsonResponse
+from django.core.exceptions import BadRequest
+from django.core.paginator import Paginator
+from django.db.models import Q, Count, Avg, Sum
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from .models import (
     User,
+    CourseGrade,
     Student,
     Instructor,
     Employee,
@@ -16,9 +22,9 @@ from .models import (
     Assignment,
     Submission,
     Review,
-    Category,
     Tag,
     LessonProgress,
+    CourseVersion,
 )
 from .forms import (
     CustomUserCreationForm,
@@ -28,7 +34,29 @@ from .forms import (
     SubmissionForm,
     ReviewForm,
     GradeSubmissionForm,
+    AssignmentTestCaseForm,
+    CloneCourseForm,
+)
+from . import events
+from .analytics import GROUPS, PERIODS, bucket_labels, cohort_report as build_report
+from .certificates import certificate_file, completed_enrollments
+from .facets import catalog_index, parse_ids, parse_price
+from .coursegrades import course_weight, gradebook
+from .gradestats import course_stats, stats_for
+from .conditional import catalog_cache, course_list_state, course_detail_state
+from .cloning import (
+    clone_course as copy_course,
+    enroll_student,
+    pinned_assignment,
+    pinned_lesson,
+    pinned_lessons,
+    snapshot_course,
 )
+from .ordering import lesson_position, next_order
+from .packages import iter_course_package
+from .recommendations import recommended_courses
+from .reference import reference_data
+from .similarity import suspicious_pairs
 
 
 def register(request):
@@ -60,7 +88,7 @@ def dashboard(request):
     if user.role == "student":
         student = user.student_profile
         enrollments = Enrollment.objects.filter(student=student).select_related(
-            "course"
+            "course__instructor__user"
         )
         upcoming_assignments = Assignment.objects.filter(
             lesson__course__enrollments__student=student, due_date__gte=timezone.now()
@@ -114,38 +142,48 @@ def dashboard(request):
     return render(request, "courses/dashboard.html", context)
 
 
+@catalog_cache(course_list_state)
 def course_list(request):
-    courses = Course.objects.filter(published=True).select_related(
-        "instructor__user", "category"
+    # Multi-select filters; facet counts and matching ids come from the
+    # in-memory facet index, so the dropdown tables are not queried.
+    selected_categories = parse_ids(request.GET.getlist("category"))
+    selected_tags = parse_ids(request.GET.getlist("tag"))
+    selected_instructors = parse_ids(request.GET.getlist("instructor"))
+    tag_mode = "and" if request.GET.get("tag_mode") == "and" else "or"
+    min_price = parse_price(request.GET.get("min_price"))
+    max_price = parse_price(request.GET.get("max_price"))
+
+    course_ids, counts = catalog_index.search(
+        categories=selected_categories,
+        tags=selected_tags,
+        instructors=selected_instructors,
+        tag_mode=tag_mode,
+        min_price=min_price,
+        max_price=max_price,
+    )
+    courses = (
+        Course.objects.filter(pk__in=course_ids)
+        .select_related("instructor__user", "category")
+        .annotate(rating_avg=Avg("reviews__rating"), review_count=Count("reviews"))
     )
-    categories = Category.objects.all()
-    tags = Tag.objects.all()
-    instructors = Instructor.objects.all()
-
-    # Filtering
-    category_filter = request.GET.get("category")
-    tag_filter = request.GET.get("tag")
-    instructor_filter = request.GET.get("instructor")
-
-    if category_filter:
-        courses = courses.filter(category_id=category_filter)
-    if tag_filter:
-        courses = courses.filter(tags__id=tag_filter)
-    if instructor_filter:
-        courses = courses.filter(instructor_id=instructor_filter)
 
     context = {
         "courses": courses,
-        "categories": categories,
-        "tags": tags,
-        "instructors": instructors,
-        "selected_category": category_filter,
-        "selected_tag": tag_filter,
-        "selected_instructor": instructor_filter,
+        "categories": catalog_index.options(
+            "category", counts["category"], selected_categories
+        ),
+        "tags": catalog_index.options("tag", counts["tag"], selected_tags),
+        "instructors": catalog_index.options(
+            "instructor", counts["instructor"], selected_instructors
+        ),
+        "tag_mode": tag_mode,
+        "min_price": request.GET.get("min_price", ""),
+        "max_price": request.GET.get("max_price", ""),
     }
     return render(request, "courses/course_list.html", context)
 
 
+@catalog_cache(course_detail_state)
 def course_detail(request, pk):
     course = get_object_or_404(Course, pk=pk, published=True)
     lessons = course.lessons.all()
@@ -155,12 +193,20 @@ def course_detail(request, pk):
     enrollment = None
     if request.user.is_authenticated and request.user.role == "student":
         try:
-            enrollment = Enrollment.objects.get(
+            enrollment = Enrollment.objects.select_related("version").get(
                 student=request.user.student_profile, course=course
             )
             is_enrolled = True
         except Enrollment.DoesNotExist:
             pass
+    if enrollment is not None and enrollment.version is not None:
+        # The cohort's lessons; ones deleted since can't be opened any more.
+        existing = set(course.lessons.values_list("pk", flat=True))
+        lessons = [
+            lesson
+            for lesson in pinned_lessons(enrollment.version, course)
+            if lesson.pk in existing
+        ]
 
     context = {
         "course": course,
@@ -168,6 +214,7 @@ def course_detail(request, pk):
         "reviews": reviews,
         "is_enrolled": is_enrolled,
         "enrollment": enrollment,
+        "recommended_courses": recommended_courses(course),
     }
     return render(request, "courses/course_detail.html", context)
 
@@ -181,11 +228,10 @@ def enroll_course(request, pk):
     course = get_object_or_404(Course, pk=pk, published=True)
     student = request.user.student_profile
 
-    enrollment, created = Enrollment.objects.get_or_create(
-        student=student, course=course
-    )
+    enrollment, created = enroll_student(student, course)
 
     if created:
+        events.record(events.ENROLL, request.user, course=course.pk)
         messages.success(request, f"Successfully enrolled in {course.title}!")
     else:
         messages.info(request, f"You are already enrolled in {course.title}.")
@@ -195,12 +241,13 @@ def enroll_course(request, pk):
 
 @login_required
 def lesson_detail(request, pk):
-    lesson = get_object_or_404(Lesson, pk=pk)
+    lesson = get_object_or_404(Lesson.objects.select_related("course"), pk=pk)
+    pinned = None
 
     # Check if user is enrolled in the course
     if request.user.role == "student":
         try:
-            enrollment = Enrollment.objects.get(
+            enrollment = Enrollment.objects.select_related("version").get(
                 student=request.user.student_profile, course=lesson.course
             )
         except Enrollment.DoesNotExist:
@@ -209,6 +256,14 @@ def lesson_detail(request, pk):
             )
             return redirect("course_detail", pk=lesson.course.pk)
 
+        if enrollment.version is not None:
+            pinned = pinned_lesson(enrollment.version, lesson.pk, lesson.course)
+            if pinned is None:
+                messages.error(
+                    request, "This lesson is not part of your cohort's course version."
+                )
+                return redirect("course_detail", pk=lesson.course.pk)
+
         # Mark lesson as completed if not already
         progress, created = LessonProgress.objects.get_or_create(
             student=request.user.student_profile,
@@ -220,11 +275,23 @@ def lesson_detail(request, pk):
             progress.completed_date = timezone.now()
             progress.save()
 
-    assignments = lesson.assignments.all()
+    events.record(
+        events.LESSON_VIEW, request.user, course=lesson.course_id, lesson=lesson.pk
+    )
+    if pinned is not None:
+        created_date = lesson.created_date
+        lesson, assignments, position, lesson_count = pinned
+        lesson.created_date = created_date
+    else:
+        assignments = lesson.assignments.all()
+        position = lesson_position(lesson)
+        lesson_count = lesson.course.total_lessons
 
     context = {
         "lesson": lesson,
         "assignments": assignments,
+        "position": position,
+        "lesson_count": lesson_count,
     }
     return render(request, "courses/lesson_detail.html", context)
 
@@ -260,9 +327,163 @@ def manage_courses(request):
         messages.error(request, "Access denied.")
         return redirect("dashboard")
 
+    courses = courses.select_related("instructor__user", "category").annotate(
+        student_count=Count("enrollments")
+    )
     return render(request, "courses/manage_courses.html", {"courses": courses})
 
 
+def _can_manage_course(user, course):
+    if user.role == "employee":
+        return True
+    return user.role == "instructor" and course.instructor.user_id == user.pk
+
+
+@login_required
+def clone_course(request, pk):
+    course = get_object_or_404(Course.objects.select_related("instructor"), pk=pk)
+    if not _can_manage_course(request.user, course):
+        messages.error(request, "Access denied.")
+        return redirect("dashboard")
+
+    if request.method == "POST":
+        form = CloneCourseForm(request.POST)
+        if form.is_valid():
+            instructor = (
+                request.user.instructor_profile
+                if request.user.role == "instructor"
+                else course.instructor
+            )
+            clone = copy_course(
+                course,
+                title=form.cleaned_data["title"],
+                instructor=instructor,
+                shift=timedelta(days=form.cleaned_data["shift_days"]),
+                published=form.cleaned_data["published"],
+            )
+            messages.success(request, f"Created {clone.title}.")
+            return redirect("manage_courses")
+    else:
+        form = CloneCourseForm(initial={"title": f"{course.title} (copy)"})
+
+    return render(
+        request, "courses/clone_course.html", {"form": form, "course": course}
+    )
+
+
+@login_required
+def export_course(request, pk):
+    course = get_object_or_404(
+        Course.objects.select_related("instructor__user", "category"), pk=pk
+    )
+    if not _can_manage_course(request.user, course):
+        messages.error(request, "Access denied.")
+        return redirect("dashboard")
+
+    response = StreamingHttpResponse(
+        iter_course_package(course), content_type="application/zip"
+    )
+    response["Content-Disposition"] = f'attachment; filename="course-{course.pk}.zip"'
+    return response
+
+
+@login_required
+def certificate(request, pk):
+    enrollment = get_object_or_404(completed_enrollments(), pk=pk)
+    user = request.user
+    if enrollment.student.user_id != user.pk and not _can_manage_course(
+        user, enrollment.course
+    ):
+        messages.error(request, "Access denied.")
+        return redirect("dashboard")
+
+    # Served from the content-addressed cache; rendered only on first request.
+    return FileResponse(
+        open(certificate_file(enrollment), "rb"),
+        as_attachment="download" in request.GET,
+        filename=f"certificate-{enrollment.course.pk}.png",
+        content_type="image/png",
+    )
+
+
+@login_required
+def course_versions(request, pk):
+    course = get_object_or_404(Course.objects.select_related("instructor"), pk=pk)
+    if not _can_manage_course(request.user, course):
+        messages.error(request, "Access denied.")
+        return redirect("dashboard")
+
+    if request.method == "POST":
+        version, created = snapshot_course(course)
+        if created:
+            messages.success(request, f"Saved version {version.number}.")
+        else:
+            messages.info(
+                request, f"No changes since version {version.number}; nothing saved."
+            )
+        return redirect("course_versions", pk=pk)
+
+    versions = (
+        course.versions.defer("content")
+        .annotate(student_count=Count("enrollments"))
+        .order_by("-number")
+    )
+    return render(
+        request,
+        "courses/course_versions.html",
+        {"course": course, "versions": versions},
+    )
+
+
+def _can_view_version(user, version):
+    if user.role == "student":
+        return Enrollment.objects.filter(student__user=user, version=version).exists()
+    return _can_manage_course(user, version.course)
+
+
+@login_required
+def course_version(request, pk, number):
+    version = get_object_or_404(
+        CourseVersion.objects.select_related("course__instructor"),
+        course_id=pk,
+        number=number,
+    )
+    if not _can_view_version(request.user, version):
+        messages.error(request, "Access denied.")
+        return redirect("course_detail", pk=pk)
+
+    return render(
+        request,
+        "courses/course_version.html",
+        {"version": version, "content": version.content},
+    )
+
+
+@login_required
+def version_lesson(request, pk, number, lesson_pk):
+    version = get_object_or_404(
+        CourseVersion.objects.select_related("course__instructor"),
+        course_id=pk,
+        number=number,
+    )
+    if not _can_view_version(request.user, version):
+        messages.error(request, "Access denied.")
+        return redirect("course_detail", pk=pk)
+
+    pinned = pinned_lesson(version, lesson_pk, version.course)
+    if pinned is None:
+        raise Http404("No such lesson in this version.")
+    lesson, assignments, position, lesson_count = pinned
+    context = {
+        "lesson": lesson,
+        "assignments": assignments,
+        "position": position,
+        "lesson_count": lesson_count,
+        "version": version,
+    }
+    return render(request, "courses/lesson_detail.html", context)
+
+
 @login_required
 def create_lesson(request, course_pk):
     course = get_object_or_404(Course, pk=course_pk)
@@ -283,6 +504,8 @@ def create_lesson(request, course_pk):
         if form.is_valid():
             lesson = form.save(commit=False)
             lesson.course = course
+            if not lesson.order:
+                lesson.order = next_order(course)
             lesson.save()
             messages.success(request, "Lesson created successfully!")
             return redirect("course_detail", pk=course_pk)
@@ -327,10 +550,30 @@ def create_assignment(request, lesson_pk):
 
 @login_required
 def assignment_detail(request, pk):
-    assignment = get_object_or_404(Assignment, pk=pk)
+    assignment = get_object_or_404(
+        Assignment.objects.select_related("lesson__course"), pk=pk
+    )
 
     submission = None
     if request.user.role == "student":
+        version = (
+            CourseVersion.objects.filter(
+                enrollments__student__user=request.user,
+                course_id=assignment.lesson.course_id,
+            )
+            .only("content")
+            .first()
+        )
+        if version is not None:
+            pinned = pinned_assignment(version, assignment.pk, assignment.lesson.course)
+            if pinned is None:
+                messages.error(
+                    request,
+                    "This assignment is not part of your cohort's course version.",
+                )
+                return redirect("course_detail", pk=assignment.lesson.course_id)
+            pinned.created_date = assignment.created_date
+            assignment = pinned
         try:
             submission = Submission.objects.get(
                 assignment=assignment, student=request.user.student_profile
@@ -345,6 +588,41 @@ def assignment_detail(request, pk):
     return render(request, "courses/assignment_detail.html", context)
 
 
+@login_required
+def assignment_test_cases(request, pk):
+    assignment = get_object_or_404(
+        Assignment.objects.select_related("lesson__course"), pk=pk
+    )
+
+    if (
+        request.user.role != "instructor"
+        or assignment.lesson.course.instructor != request.user.instructor_profile
+    ):
+        messages.error(request, "Access denied.")
+        return redirect("assignment_detail", pk=pk)
+
+    if request.method == "POST":
+        form = AssignmentTestCaseForm(request.POST)
+        if form.is_valid():
+            test_case = form.save(commit=False)
+            test_case.assignment = assignment
+            test_case.save()
+            messages.success(request, "Test case added successfully!")
+            return redirect("assignment_test_cases", pk=pk)
+    else:
+        form = AssignmentTestCaseForm()
+
+    return render(
+        request,
+        "courses/assignment_test_cases.html",
+        {
+            "form": form,
+            "assignment": assignment,
+            "test_cases": assignment.test_cases.all(),
+        },
+    )
+
+
 @login_required
 def submit_assignment(request, pk):
     assignment = get_object_or_404(Assignment, pk=pk)
@@ -370,6 +648,13 @@ def submit_assignment(request, pk):
             submission.assignment = assignment
             submission.student = request.user.student_profile
             submission.save()
+            events.record(
+                events.SUBMISSION,
+                request.user,
+                course=assignment.lesson.course_id,
+                assignment=assignment.pk,
+                submission=submission.pk,
+            )
             messages.success(request, "Assignment submitted successfully!")
             return redirect("assignment_detail", pk=pk)
     else:
@@ -416,6 +701,15 @@ def grade_submission(request, pk):
             submission = form.save(commit=False)
             submission.graded = True
             submission.save()
+            events.record(
+                events.GRADE,
+                request.user,
+                course=submission.assignment.lesson.course_id,
+                assignment=submission.assignment_id,
+                submission=submission.pk,
+                student=submission.student.user_id,
+                score=submission.score,
+            )
             messages.success(request, "Submission graded successfully!")
             return redirect("grade_submissions")
     else:
@@ -428,6 +722,107 @@ def grade_submission(request, pk):
     )
 
 
+@login_required
+def course_grade_stats(request, pk):
+    course = get_object_or_404(Course, pk=pk)
+    if not _can_manage_course(request.user, course):
+        messages.error(request, "Access denied.")
+        return redirect("dashboard")
+
+    assignments, summary = course_stats(course)
+    return render(
+        request,
+        "courses/course_grade_stats.html",
+        {"course": course, "assignments": assignments, "summary": summary},
+    )
+
+
+@login_required
+def course_gradebook(request, pk):
+    course = get_object_or_404(Course, pk=pk)
+    if not _can_manage_course(request.user, course):
+        messages.error(request, "Access denied.")
+        return redirect("dashboard")
+
+    total_weight = course_weight(course)
+    page = Paginator(gradebook(course), 50).get_page(request.GET.get("page"))
+    for grade in page:
+        grade.overall = 100 * grade.earned / total_weight if total_weight else None
+    return render(
+        request,
+        "courses/course_gradebook.html",
+        {"course": course, "page": page, "total_weight": total_weight},
+    )
+
+
+@login_required
+def similarity_report(request, pk):
+    assignment = get_object_or_404(
+        Assignment.objects.select_related("lesson__course"), pk=pk
+    )
+
+    if (
+        request.user.role != "instructor"
+        or assignment.lesson.course.instructor != request.user.instructor_profile
+    ):
+        messages.error(request, "Access denied.")
+        return redirect("dashboard")
+
+    return render(
+        request,
+        "courses/similarity_report.html",
+        {"assignment": assignment, "pairs": suspicious_pairs(assignment)},
+    )
+
+
+@login_required
+def cohort_report(request):
+    if request.user.role != "employee":
+        messages.error(request, "Only employees can view reports.")
+        return redirect("dashboard")
+
+    group = request.GET.get("group")
+    group = group if group in GROUPS else "course"
+    period = request.GET.get("period")
+    period = period if period in PERIODS else "week"
+    try:
+        since = parse_date(request.GET.get("since") or "")
+    except ValueError:
+        # Well-formed but not a real date, e.g. 2024-02-30.
+        raise BadRequest("since must be a valid date (YYYY-MM-DD).")
+    category = parse_ids(request.GET.getlist("category"))
+    categories = reference_data.get().categories.items()
+
+    report = build_report(
+        group=group,
+        period=period,
+        since=since,
+        category=category[0] if category else None,
+    )
+    for row in report.retention:
+        row["cells"] = [
+            (rate, "0" if rate is None else f"{rate / 100:.2f}")
+            for rate in row["rates"]
+        ]
+    completion_labels = bucket_labels()
+    for row in report.completion:
+        row["buckets"] = list(zip(completion_labels, row["histogram"]))
+    return render(
+        request,
+        "courses/cohort_report.html",
+        {
+            "report": report,
+            "group": group,
+            "period": period,
+            "since": since,
+            "selected_category": category[0] if category else None,
+            "categories": categories,
+            "week_numbers": range(report.weeks),
+            "completion_labels": completion_labels,
+        },
+    )
+
+
 @login_required
 def create_review(request, course_pk):
     course = get_object_or_404(Course, pk=course_pk)
@@ -459,6 +854,9 @@ def create_review(request, course_pk):
             review.course = course
             review.student = request.user.student_profile
             review.save()
+            events.record(
+                events.REVIEW, request.user, course=course.pk, rating=review.rating
+            )
             messages.success(request, "Review submitted successfully!")
             return redirect("course_detail", pk=course_pk)
     else:
@@ -475,8 +873,39 @@ def my_grades(request):
         messages.error(request, "Only students can view grades.")
         return redirect("dashboard")
 
-    submissions = Submission.objects.filter(
-        student=request.user.student_profile, graded=True
-    ).select_related("assignment__lesson__course")
+    submissions = list(
+        Submission.objects.filter(
+            student=request.user.student_profile, graded=True
+        ).select_related("assignment__lesson__course")
+    )
+    stats = stats_for({s.assignment_id: s.assignment for s in submissions}.values())
+    for submission in submissions:
+        submission.percentile = None
+        if submission.score is not None:
+            assignment_stats = stats[submission.assignment_id]
+            submission.percentile = assignment_stats.percentile_rank(submission.score)
+            submission.rank = assignment_stats.rank(submission.score)
+            submission.graded_count = assignment_stats.count
+
+    course_grades = list(
+        CourseGrade.objects.filter(student=request.user.student_profile)
+        .select_related("course")
+        .order_by("course__title")
+    )
+    weights = dict(
+        Assignment.objects.filter(
+            lesson__course__in=[grade.course_id for grade in course_grades]
+        )
+        .values_list("lesson__course")
+        .annotate(total=Sum("weight"))
+        .order_by()
+    )
+    for grade in course_grades:
+        total_weight = weights.get(grade.course_id)
+        grade.overall = 100 * grade.earned / total_weight if total_weight else None
 
-    return render(request, "courses/my_grades.html", {"submissions": submissions})
+    return render(
+        request,
+        "courses/my_grades.html",
+        {"submissions": submissions, "course_grades": course_grades},
+    )
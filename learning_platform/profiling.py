@@ -0,0 +1,279 @@
+"""
+Sampling profiler for production requests.
+
+SamplingProfilerMiddleware profiles requests from staff users (with
+PROFILING_STAFF) and a random PROFILING_SAMPLE_RATE fraction of all other
+requests. A profiled request gets a sampler thread that reads the request
+thread's current Python stack every PROFILING_INTERVAL seconds, via
+sys._current_frames(), until the response is built. Template rendering
+happens inside the view's render() call, so it is covered as well. The
+request itself runs at full speed. The cost is one extra thread waking up
+a few hundred times a second, not a trace hook on every call.
+
+Samples are written as collapsed stacks ("frame;frame;frame count") to
+PROFILING_DIR/<url name>/<pid>.folded, appended per request. Each process
+writes only its own files. Frames above the middleware are cut off, so
+every stack starts at the view. The merge_profiles command sums the files
+into one flamegraph-ready stream.
+
+With PROFILING_MEMORY the sampled requests are traced with tracemalloc
+instead. Each request appends one JSON line to
+PROFILING_DIR/<url name>/<pid>.memory.jsonl. The line holds the peak
+traced memory and the top allocation sites of the memory still held
+when the traced size peaked. A site is the allocating line. With
+PROFILING_MEMORY_FRAMES deep enough to reach the project's code, a site
+also names the nearest project frame that led to it, because the
+allocating line is usually deep inside Django (Model.__init__, the
+SQLite cursor). Every extra frame makes each allocation slower. The
+sampler thread takes a snapshot whenever the traced size grows by a
+fifth, so the sites describe the peak rather than the end of the
+request. tracemalloc slows Python down several times and traces every
+thread, so with concurrent requests the peaks overlap. This mode is for
+a staging box or one worker, not for a whole fleet.
+
+With both settings off the middleware removes itself at startup
+(MiddlewareNotUsed). Otherwise an unsampled request costs one random()
+call and, for the staff check, the user lookup that authenticated views
+already do.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Label per code object; code objects live as long as their functions.
+_labels = {}
+_write_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+_tracing_requests = 0
+
+
+def _short(filename, lineno):
+    # Paths relative to sys.path entries: courses/views.py, django/db/...
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1 :]
+            break
+    return f"{filename}:{lineno}"
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        location = _short(code.co_filename, code.co_firstlineno)
+        label = _labels[code] = f"{code.co_name} ({location})"
+    return label
+
+
+def collapse(frame, root=None):
+    """Collapsed stack of ``frame``, outermost first, below ``root``."""
+    labels = []
+    while frame is not None and frame is not root:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class Sampler(threading.Thread):
+    """Samples one thread's stack until stop() is called."""
+
+    def __init__(self, thread_id, root, interval):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        current_frames = sys._current_frames
+        while not self._done.wait(self.interval):
+            frame = current_frames().get(self.thread_id)
+            # Once stop() is called the request thread is only waiting here.
+            if frame is not None and not self._done.is_set():
+                self.stacks[collapse(frame, self.root)] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+class MemorySampler(threading.Thread):
+    """Tracks peak traced memory and snapshots allocations near the peak."""
+
+    # Snapshot again once the traced size exceeds the last snapshot's by this.
+    GROWTH = 1.2
+
+    def __init__(self, interval, frames):
+        super().__init__(name="memory-profiler", daemon=True)
+        self.interval = interval
+        self.frames = frames
+        self.snapshot = None
+        self._snapshot_size = 0
+        self._done = threading.Event()
+
+    def start(self):
+        global _tracing_requests
+        with _tracing_lock:
+            if not _tracing_requests:
+                tracemalloc.start(self.frames)
+            _tracing_requests += 1
+        tracemalloc.reset_peak()
+        super().start()
+
+    def _check(self):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self._snapshot_size * self.GROWTH:
+            self.snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = current
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self._check()
+
+    def stop(self):
+        """Stop sampling; return (peak bytes, snapshot or None)."""
+        global _tracing_requests
+        self._done.set()
+        self.join()
+        self._check()
+        _, peak = tracemalloc.get_traced_memory()
+        with _tracing_lock:
+            _tracing_requests -= 1
+            if not _tracing_requests:
+                tracemalloc.stop()
+        return peak, self.snapshot
+
+
+def _project_frame(traceback):
+    # Innermost frame in the project's own code, if any.
+    base = str(settings.BASE_DIR) + os.sep
+    for frame in reversed(traceback):
+        filename = frame.filename
+        if (
+            filename.startswith(base)
+            and "site-packages" not in filename
+            and filename != __file__
+        ):
+            return frame
+    return None
+
+
+def allocation_sites(snapshot, top):
+    """[(site, via, bytes, blocks)] for the largest allocation sites."""
+    snapshot = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, threading.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+    )
+    sites = {}
+    for stat in snapshot.statistics("traceback"):
+        innermost = stat.traceback[-1]
+        project = _project_frame(stat.traceback)
+        key = (
+            _short(innermost.filename, innermost.lineno),
+            _short(project.filename, project.lineno) if project else "",
+        )
+        size, count = sites.get(key, (0, 0))
+        sites[key] = (size + stat.size, count + stat.count)
+    ranked = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)
+    return [(site, via, size, count) for (site, via), (size, count) in ranked[:top]]
+
+
+def profile_path(url_name, directory=None, suffix=".folded"):
+    directory = Path(directory or settings.PROFILING_DIR)
+    return directory / url_name / f"{os.getpid()}{suffix}"
+
+
+def _append(path, lines):
+    with _write_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as f:
+            f.writelines(lines)
+
+
+def write_stacks(url_name, stacks, elapsed, directory=None):
+    # The comment line counts requests for merge_profiles; flamegraph tools
+    # never see it because merge_profiles drops comment lines.
+    lines = [f"# request {elapsed:.6f}\n"]
+    lines.extend(f"{stack} {count}\n" for stack, count in stacks.items() if stack)
+    _append(profile_path(url_name, directory), lines)
+
+
+def write_memory(url_name, path, elapsed, peak, sites, directory=None):
+    record = {
+        "path": path,
+        "elapsed": round(elapsed, 6),
+        "peak": peak,
+        "sites": sites,
+    }
+    _append(
+        profile_path(url_name, directory, ".memory.jsonl"),
+        [json.dumps(record) + "\n"],
+    )
+
+
+class SamplingProfilerMiddleware:
+    def __init__(self, get_response):
+        self.rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0)
+        self.staff = getattr(settings, "PROFILING_STAFF", False)
+        if not self.rate and not self.staff:
+            raise MiddlewareNotUsed
+        self.interval = getattr(settings, "PROFILING_INTERVAL", 0.005)
+        self.memory = getattr(settings, "PROFILING_MEMORY", False)
+        self.frames = getattr(settings, "PROFILING_MEMORY_FRAMES", 1)
+        self.top = getattr(settings, "PROFILING_MEMORY_TOP", 10)
+        self.get_response = get_response
+
+    def _sampled(self, request):
+        if self.rate and random.random() < self.rate:
+            return True
+        return self.staff and request.user.is_staff
+
+    def __call__(self, request):
+        if not self._sampled(request):
+            return self.get_response(request)
+        if self.memory:
+            return self._trace_memory(request)
+
+        sampler = Sampler(threading.get_ident(), sys._getframe(), self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop()
+        elapsed = time.perf_counter() - start
+        write_stacks(_url_name(request), stacks, elapsed)
+        return response
+
+    def _trace_memory(self, request):
+        sampler = MemorySampler(self.interval, self.frames)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            peak, snapshot = sampler.stop()
+        elapsed = time.perf_counter() - start
+
+        sites = allocation_sites(snapshot, self.top) if snapshot else []
+        write_memory(_url_name(request), request.path, elapsed, peak, sites)
+        return response
+
+
+def _url_name(request):
+    match = request.resolver_match
+    return (match.url_name if match else None) or "unresolved"
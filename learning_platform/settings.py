@@ -27,6 +27,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'courses.invalidation.InvalidationBusMiddleware',
+    'learning_platform.profiling.SamplingProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -37,7 +39,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -45,6 +46,17 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates and the row partials they include are compiled once
+            # per process; runserver's autoreloader resets the cache on edits.
+            'loaders': [
+                (
+                    'django.template.loaders.cached.Loader',
+                    [
+                        'django.template.loaders.filesystem.Loader',
+                        'django.template.loaders.app_directories.Loader',
+                    ],
+                ),
+            ],
         },
     },
 ]
@@ -82,6 +94,10 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Serve STATIC_ROOT from Django when DEBUG is off and no web server sits in
+# front (e.g. air-gapped installs). Run collectstatic first.
+SERVE_STATIC = False
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -92,6 +108,82 @@ AUTH_USER_MODEL = 'courses.User'
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap4"
 CRISPY_TEMPLATE_PACK = "bootstrap4"
 
+# Seconds shared caches may serve anonymous catalog pages without revalidating.
+CATALOG_CACHE_MAX_AGE = 60
+
+# Compute submission MinHash signatures on a background thread after commit.
+SIMILARITY_INDEX_IN_BACKGROUND = True
+
+# LSH buckets shared by more submissions than this (usually unchanged starter
+# code) are not expanded into candidate pairs.
+SIMILARITY_MAX_BUCKET_SIZE = 50
+
+# Limits for each autograder test run, and the grading pool size
+# (None means one worker per CPU core).
+AUTOGRADER_TIME_LIMIT = 2
+AUTOGRADER_MEMORY_LIMIT_MB = 256
+AUTOGRADER_WORKERS = None
+AUTOGRADER_MAX_PROCESSES = 16
+
+# Isolation of student code (see courses/autograder.py): a user name or uid
+# to run it as, and a sandbox command prefix ("bwrap" or an argv list).
+# Leave both unset only for trusted code. AUTOGRADER_PYTHON is the
+# interpreter for student code (None: the grader's own); the sandbox user
+# must be able to execute it.
+AUTOGRADER_USER = None
+AUTOGRADER_SANDBOX = None
+AUTOGRADER_PYTHON = None
+
+# Seconds before a worker rebuilds its in-memory catalog facet index even
+# without local changes (other workers' edits normally arrive sooner over
+# the invalidation bus; the rebuild is the fallback).
+FACET_INDEX_TTL = 300
+
+# Same, for the autocomplete prefix index behind /api/autocomplete/.
+AUTOCOMPLETE_INDEX_TTL = 300
+
+# Seconds a worker trusts its cached categories, tags and instructor names
+# before re-reading their version counter (0 checks on every use).
+REFERENCE_DATA_CHECK_INTERVAL = 1
+
+# Invalidation bus: each worker reads the keys other workers published at
+# most every INVALIDATION_POLL_INTERVAL seconds and deletes them from the
+# INVALIDATION_CACHE cache (None to only run subscribers). Published keys
+# are kept for INVALIDATION_RETENTION seconds.
+INVALIDATION_POLL_INTERVAL = 1
+INVALIDATION_CACHE = 'default'
+INVALIDATION_RETENTION = 86400
+
+# Learning event log: day-partitioned JSONL segments, written in batches of
+# EVENT_LOG_BATCH_SIZE or every EVENT_LOG_FLUSH_INTERVAL seconds.
+EVENT_LOG_ENABLED = True
+EVENT_LOG_DIR = BASE_DIR / 'events'
+EVENT_LOG_BATCH_SIZE = 500
+EVENT_LOG_FLUSH_INTERVAL = 5
+
+# Completion certificates: rendering pool size for generate_certificates
+# (None means one worker per CPU core) and an optional TrueType font file
+# (None uses the font bundled with Pillow).
+CERTIFICATE_WORKERS = None
+CERTIFICATE_FONT = None
+
+# Sampling profiler: every staff request (PROFILING_STAFF) and a random
+# fraction of all requests write collapsed stacks, sampled every
+# PROFILING_INTERVAL seconds, under PROFILING_DIR. Merge them with
+# merge_profiles. With both off the middleware is not loaded at all.
+PROFILING_STAFF = False
+PROFILING_SAMPLE_RATE = 0
+PROFILING_INTERVAL = 0.005
+PROFILING_DIR = BASE_DIR / 'profiles'
+
+# Trace sampled requests with tracemalloc instead: peak memory and the top
+# PROFILING_MEMORY_TOP allocation sites. Raise PROFILING_MEMORY_FRAMES to
+# about 30 to see which project line led to each site. Traced requests run
+# 10-60x slower, so use this on one worker only.
+PROFILING_MEMORY = False
+PROFILING_MEMORY_FRAMES = 1
+PROFILING_MEMORY_TOP = 10
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
@@ -0,0 +1,104 @@
+"""
+Production settings profile.
+
+Select it with DJANGO_SETTINGS_MODULE=learning_platform.settings_production.
+Everything deployment-specific comes from the environment; the rest is
+inherited from the development settings module.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, TEMPLATES
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_list(name, default=""):
+    return [item.strip() for item in os.environ.get(name, default).split(",") if item.strip()]
+
+
+# DEBUG must stay off: with it on every executed SQL statement is kept in
+# connection.queries for the lifetime of the request.
+DEBUG = env_bool("DJANGO_DEBUG", False)
+
+SECRET_KEY = os.environ["DJANGO_SECRET_KEY"]
+
+ALLOWED_HOSTS = env_list("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1")
+CSRF_TRUSTED_ORIGINS = env_list("DJANGO_CSRF_TRUSTED_ORIGINS")
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get("DJANGO_DB_PATH", str(BASE_DIR / 'db.sqlite3')),
+        'CONN_MAX_AGE': int(os.environ.get("DJANGO_CONN_MAX_AGE", "60")),
+    }
+}
+
+# Compile each template once per worker and keep it in memory. APP_DIRS has
+# to be off when loaders are listed explicitly.
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+            'loaders': [
+                (
+                    'django.template.loaders.cached.Loader',
+                    [
+                        'django.template.loaders.filesystem.Loader',
+                        'django.template.loaders.app_directories.Loader',
+                    ],
+                ),
+            ],
+        },
+    },
+]
+
+STATIC_ROOT = os.environ.get("DJANGO_STATIC_ROOT", str(BASE_DIR / 'staticfiles'))
+MEDIA_ROOT = os.environ.get("DJANGO_MEDIA_ROOT", str(BASE_DIR / 'media'))
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'learning_platform.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+SERVE_STATIC = env_bool("DJANGO_SERVE_STATIC", False)
+
+PROFILING_STAFF = env_bool("DJANGO_PROFILE_STAFF", False)
+PROFILING_SAMPLE_RATE = float(os.environ.get("DJANGO_PROFILE_SAMPLE_RATE", "0"))
+PROFILING_MEMORY = env_bool("DJANGO_PROFILE_MEMORY", False)
+PROFILING_DIR = os.environ.get("DJANGO_PROFILE_DIR", str(BASE_DIR / 'profiles'))
+
+AUTOGRADER_USER = os.environ.get("DJANGO_AUTOGRADER_USER") or None
+AUTOGRADER_SANDBOX = os.environ.get("DJANGO_AUTOGRADER_SANDBOX") or None
+AUTOGRADER_PYTHON = os.environ.get("DJANGO_AUTOGRADER_PYTHON") or None
+
+SESSION_COOKIE_SECURE = env_bool("DJANGO_SECURE_COOKIES", True)
+CSRF_COOKIE_SECURE = env_bool("DJANGO_SECURE_COOKIES", True)
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SECURE_CONTENT_TYPE_NOSNIFF = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get("DJANGO_LOG_LEVEL", "WARNING"),
+    },
+}
@@ -0,0 +1,137 @@
+"""
+Static asset pipeline: hashed names, precompressed copies and a fallback
+server for deployments without a front-end web server.
+
+CompressedManifestStaticFilesStorage is ManifestStaticFilesStorage (content
+hashes in file names, references inside CSS rewritten) that also writes a
+``.gz`` next to every compressible file during collectstatic, so nothing is
+compressed per request.
+
+serve_static serves STATIC_ROOT when SERVE_STATIC is on. It sends the
+``.gz`` variant to clients that accept gzip. Hashed names are cached for a
+year as immutable, and anything else gets a short max-age because its
+content can change under the same URL.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage,
+    staticfiles_storage,
+)
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+COMPRESSIBLE_EXTENSIONS = {
+    ".css",
+    ".js",
+    ".map",
+    ".json",
+    ".svg",
+    ".txt",
+    ".html",
+    ".xml",
+    ".ttf",
+    ".otf",
+    ".eot",
+}
+# Files smaller than this gain nothing from compression.
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+DEFAULT_MAX_AGE = 60
+
+_HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{12}\.[^/.]+$")
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in list(self.hashed_files.values()) + list(paths):
+            self._compress(name)
+
+    def _compress(self, name):
+        if posixpath.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        path = self.path(name)
+        if not os.path.exists(path) or os.path.getsize(path) < MIN_COMPRESS_SIZE:
+            return
+        compressed = path + ".gz"
+        if os.path.exists(compressed) and os.path.getmtime(
+            compressed
+        ) >= os.path.getmtime(path):
+            return
+        with open(path, "rb") as source, open(compressed + ".tmp", "wb") as raw:
+            # mtime=0 keeps the output identical between runs.
+            with gzip.GzipFile(
+                filename="", mode="wb", fileobj=raw, compresslevel=9, mtime=0
+            ) as target:
+                shutil.copyfileobj(source, target)
+        if os.path.getsize(compressed + ".tmp") < os.path.getsize(path):
+            os.replace(compressed + ".tmp", compressed)
+        else:
+            os.remove(compressed + ".tmp")
+
+
+@lru_cache(maxsize=1)
+def _hashed_names():
+    hashed_files = getattr(staticfiles_storage, "hashed_files", None) or {}
+    return frozenset(hashed_files.values())
+
+
+def _is_hashed(path):
+    names = _hashed_names()
+    if names:
+        return path in names
+    return bool(_HASHED_NAME_RE.search(path))
+
+
+def serve_static(request, path):
+    """Serve a collected static file, preferring a precompressed copy."""
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path.")
+    if not os.path.isfile(fullpath):
+        raise Http404("File not found.")
+
+    served = fullpath
+    encoding = None
+    if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "") and os.path.isfile(
+        fullpath + ".gz"
+    ):
+        served, encoding = fullpath + ".gz", "gzip"
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(
+        request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime
+    ):
+        response = HttpResponseNotModified()
+    else:
+        content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+        response = FileResponse(
+            open(served, "rb"),
+            content_type=content_type,
+            filename=os.path.basename(fullpath),
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    if _is_hashed(path):
+        response["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response["Cache-Control"] = f"public, max-age={DEFAULT_MAX_AGE}"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
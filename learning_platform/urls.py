@@ -1,7 +1,8 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from .staticfiles import serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,3 +11,10 @@ urlpatterns = [
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+elif settings.SERVE_STATIC:
+    urlpatterns += [
+        re_path(
+            r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'),
+            serve_static,
+        ),
+    ]
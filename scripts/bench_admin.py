@@ -0,0 +1,157 @@
+"""
+Benchmark the Submission admin changelist on a large table.
+
+Builds a throwaway test database (the project database is not touched),
+fills it with --rows submissions spread over 10,000 students, runs ANALYZE
+and then times changelist requests with the stock ModelAdmin behaviour
+(exact counts, no joins, plain paginator) against the tuned SubmissionAdmin.
+
+Usage:
+    python scripts/bench_admin.py [--rows 1000000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "learning_platform.settings")
+django.setup()
+
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.utils import timezone
+
+from courses.models import (
+    User,
+    Student,
+    Instructor,
+    Category,
+    Course,
+    Lesson,
+    Assignment,
+    Submission,
+)
+
+STUDENTS = 10000
+URLS = [
+    ("first page", "/admin/courses/submission/"),
+    ("page 200", "/admin/courses/submission/?p=200"),
+    ("graded=no", "/admin/courses/submission/?graded__exact=0"),
+    ("search", "/admin/courses/submission/?q=student42"),
+]
+
+
+def populate(rows):
+    now = timezone.now()
+    user = User.objects.create(username="bench_instructor", role="instructor")
+    instructor = Instructor.objects.create(user=user)
+    category = Category.objects.create(name="Bench")
+    course = Course.objects.create(
+        title="Bench course", description="", instructor=instructor, category=category
+    )
+    assignments_needed = -(-rows // STUDENTS)
+    lessons = Lesson.objects.bulk_create(
+        Lesson(course=course, title=f"Lesson {i}", order=i)
+        for i in range(assignments_needed)
+    )
+    assignments = Assignment.objects.bulk_create(
+        Assignment(lesson=lesson, title=f"Assignment {i}", description="", due_date=now)
+        for i, lesson in enumerate(lessons)
+    )
+    users = User.objects.bulk_create(
+        User(username=f"student{i}", password="!", role="student")
+        for i in range(STUDENTS)
+    )
+    students = Student.objects.bulk_create(Student(user=u) for u in users)
+
+    table = Submission._meta.db_table
+    sql = (
+        f"INSERT INTO {table} (assignment_id, student_id, content, file, "
+        "submitted_date, score, feedback, graded) VALUES (%s, %s, '', '', %s, %s, '', %s)"
+    )
+    batch = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for n in range(rows):
+            graded = n % 3 != 0
+            batch.append(
+                (
+                    assignments[n // STUDENTS].pk,
+                    students[n % STUDENTS].pk,
+                    now - timezone.timedelta(minutes=n),
+                    n % 101 if graded else None,
+                    graded,
+                )
+            )
+            if len(batch) == 50000:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+        cursor.execute("ANALYZE")
+
+
+def measure(client, repeat):
+    results = {}
+    for label, url in URLS:
+        samples = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = client.get(url)
+                samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, (url, response.status_code)
+        results[label] = (statistics.median(samples) * 1000, len(ctx))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        start = time.perf_counter()
+        populate(args.rows)
+        print(f"inserted {args.rows} submissions in {time.perf_counter() - start:.1f}s")
+
+        client = Client()
+        client.force_login(User.objects.create_superuser("bench_admin", "", "x"))
+
+        model_admin = admin.site._registry[Submission]
+        tuned = {
+            name: getattr(model_admin, name)
+            for name in ("list_select_related", "paginator", "show_full_result_count")
+        }
+        stock = {
+            "list_select_related": False,
+            "paginator": Paginator,
+            "show_full_result_count": True,
+        }
+
+        report = {}
+        for label, attrs in (("stock", stock), ("tuned", tuned)):
+            for name, value in attrs.items():
+                setattr(model_admin, name, value)
+            report[label] = measure(client, args.repeat)
+
+        print(f"{'changelist':<14}{'stock ms':>10}{'queries':>9}{'tuned ms':>10}{'queries':>9}")
+        for label, _ in URLS:
+            stock_ms, stock_q = report["stock"][label]
+            tuned_ms, tuned_q = report["tuned"][label]
+            print(f"{label:<14}{stock_ms:>10.1f}{stock_q:>9}{tuned_ms:>10.1f}{tuned_q:>9}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
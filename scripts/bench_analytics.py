@@ -0,0 +1,187 @@
+"""
+Benchmark the cohort report on large activity tables.
+
+Builds a throwaway test database (the project database is not touched),
+fills it with --enrollments enrollments over 200 courses, six lesson
+completions and three submissions per enrollment (10M rows at the
+default), runs ANALYZE and then times cohort_report() grouped by course
+and by category. The rows are inserted with raw executemany, so filling
+the database takes longer than the report itself.
+
+Usage:
+    python scripts/bench_analytics.py [--enrollments 1000000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "learning_platform.settings")
+django.setup()
+
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+
+from courses.analytics import cohort_report
+from courses.models import (
+    User,
+    Student,
+    Instructor,
+    Category,
+    Course,
+    Enrollment,
+    Lesson,
+    LessonProgress,
+    Assignment,
+    Submission,
+)
+
+COURSES = 200
+CATEGORIES = 10
+LESSONS = 6
+ASSIGNMENTS = 3
+BATCH = 50000
+
+
+def insert(cursor, model, columns, rows):
+    sql = (
+        f"INSERT INTO {model._meta.db_table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+
+
+def populate(enrollments):
+    rng = random.Random(42)
+    now = timezone.now()
+    user = User.objects.create(username="bench_instructor", role="instructor")
+    instructor = Instructor.objects.create(user=user)
+    categories = Category.objects.bulk_create(
+        Category(name=f"Category {i}") for i in range(CATEGORIES)
+    )
+    courses = Course.objects.bulk_create(
+        Course(
+            title=f"Course {i}",
+            description="",
+            instructor=instructor,
+            category=categories[i % CATEGORIES],
+        )
+        for i in range(COURSES)
+    )
+    lessons = Lesson.objects.bulk_create(
+        Lesson(course=course, title=f"Lesson {n}", order=n)
+        for course in courses
+        for n in range(LESSONS)
+    )
+    assignments = Assignment.objects.bulk_create(
+        Assignment(lesson=lesson, title="Exercise", description="", due_date=now)
+        for lesson in lessons[::2]
+    )
+    course_lessons = [lessons[i : i + LESSONS] for i in range(0, len(lessons), LESSONS)]
+    course_assignments = [
+        assignments[i : i + ASSIGNMENTS]
+        for i in range(0, len(assignments), ASSIGNMENTS)
+    ]
+    students = -(-enrollments // 20)
+    users = User.objects.bulk_create(
+        User(username=f"student{i}", password="!", role="student")
+        for i in range(students)
+    )
+    student_ids = [
+        student.pk
+        for student in Student.objects.bulk_create(Student(user=u) for u in users)
+    ]
+
+    # (student, course index, enrolled) for every enrollment.
+    pairs = []
+    for n in range(enrollments):
+        enrolled = now - timezone.timedelta(seconds=rng.randrange(365 * 86400))
+        pairs.append((student_ids[n // 20], n % COURSES, enrolled))
+
+    def later(enrolled):
+        return enrolled + timezone.timedelta(seconds=rng.randrange(120 * 86400))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        insert(
+            cursor,
+            Enrollment,
+            ("student_id", "course_id", "enrolled_date", "completed", "progress"),
+            (
+                (student, courses[c].pk, enrolled, rng.random() < 0.3, 0)
+                for student, c, enrolled in pairs
+            ),
+        )
+        insert(
+            cursor,
+            LessonProgress,
+            ("student_id", "lesson_id", "completed", "completed_date"),
+            (
+                (student, lesson.pk, True, later(enrolled))
+                for student, c, enrolled in pairs
+                for lesson in course_lessons[c]
+            ),
+        )
+        insert(
+            cursor,
+            Submission,
+            (
+                "student_id",
+                "assignment_id",
+                "content",
+                "file",
+                "submitted_date",
+                "feedback",
+                "graded",
+            ),
+            (
+                (student, assignment.pk, "", "", later(enrolled), "", False)
+                for student, c, enrolled in pairs
+                for assignment in course_assignments[c]
+            ),
+        )
+        cursor.execute("ANALYZE")
+    return enrollments * (1 + LESSONS + ASSIGNMENTS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--enrollments", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        start = time.perf_counter()
+        rows = populate(args.enrollments)
+        print(f"inserted {rows} rows in {time.perf_counter() - start:.1f}s")
+        for group in ("course", "category"):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                cohort_report(group=group)
+                samples.append(time.perf_counter() - start)
+            median = statistics.median(samples)
+            print(
+                f"cohort_report(group={group!r}): median {median:.2f}s"
+                f", best {min(samples):.2f}s over {rows} rows"
+            )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Memory and time of the largest listings: manage_courses for an employee
+(every course) and grade_submissions (every ungraded submission of one
+instructor).
+
+Builds a throwaway test database (the project database is not touched) and
+loads each listing's queryset in several ways, touching the fields its
+table row shows:
+
+- instances: list(queryset), which is what rendering the template does
+- iterator:  queryset.iterator(chunk_size=2000), one chunk of instances
+             alive at a time
+- only:      instances limited to the shown columns with .only()
+- values:    list(queryset.values(...)) with just the shown columns
+- values_list iterator: tuples, streamed
+
+Time comes from an untraced run and the peak from a second run under
+tracemalloc. The full page, rendered through the test client, is the
+reference. A template {% for %} turns anything without __len__ into a
+list first, so .iterator() only helps when rows are rendered or written
+out as they are read (e.g. a StreamingHttpResponse).
+
+Usage:
+    python scripts/bench_listings.py [--courses 20000] [--submissions 100000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "learning_platform.settings")
+django.setup()
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from courses.models import (
+    User,
+    Student,
+    Instructor,
+    Employee,
+    Category,
+    Course,
+    Lesson,
+    Assignment,
+    Submission,
+)
+
+STUDENTS = 2000
+CONTENT = "print(sum(range(10)))\n" * 25
+
+
+def populate(courses, submissions):
+    now = timezone.now()
+    user = User.objects.create(username="bench_instructor", role="instructor")
+    instructor = Instructor.objects.create(user=user)
+    category = Category.objects.create(name="Bench")
+    Course.objects.bulk_create(
+        (
+            Course(
+                title=f"Course {i}",
+                description="Learn the fundamentals step by step. " * 20,
+                instructor=instructor,
+                category=category,
+                price=10,
+            )
+            for i in range(courses)
+        ),
+        batch_size=2000,
+    )
+    course = Course.objects.first()
+    lesson = Lesson.objects.create(course=course, title="Lesson", order=1)
+    assignments = Assignment.objects.bulk_create(
+        Assignment(lesson=lesson, title=f"Assignment {i}", description="", due_date=now)
+        for i in range(-(-submissions // STUDENTS))
+    )
+    users = User.objects.bulk_create(
+        User(username=f"student{i}", password="!", role="student")
+        for i in range(STUDENTS)
+    )
+    students = Student.objects.bulk_create(Student(user=u) for u in users)
+    with transaction.atomic():
+        Submission.objects.bulk_create(
+            (
+                Submission(
+                    assignment=assignments[n // STUDENTS],
+                    student=students[n % STUDENTS],
+                    content=CONTENT,
+                    submitted_date=now,
+                )
+                for n in range(submissions)
+            ),
+            batch_size=2000,
+        )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    employee = User.objects.create(username="bench_employee", role="employee")
+    Employee.objects.create(user=employee)
+    return user, employee
+
+
+# The querysets below repeat the ones in courses/views.py.
+def course_queryset():
+    return Course.objects.select_related("instructor__user", "category").annotate(
+        student_count=Count("enrollments")
+    )
+
+
+def submission_queryset(instructor):
+    return Submission.objects.filter(
+        assignment__lesson__course__instructor=instructor, graded=False
+    ).select_related("student__user", "assignment__lesson__course")
+
+
+def course_row(course):
+    user = course.instructor.user
+    return (
+        course.pk,
+        course.title,
+        user.get_full_name() or user.username,
+        course.category.name,
+        course.student_count,
+        course.published,
+        course.created_date,
+    )
+
+
+def submission_row(submission):
+    user = submission.student.user
+    return (
+        submission.pk,
+        user.get_full_name() or user.username,
+        submission.assignment.lesson.course.title,
+        submission.assignment.title,
+        submission.assignment_id,
+        submission.submitted_date,
+    )
+
+
+COURSE_COLUMNS = (
+    "pk",
+    "title",
+    "instructor__user__first_name",
+    "instructor__user__last_name",
+    "instructor__user__username",
+    "category__name",
+    "student_count",
+    "published",
+    "created_date",
+)
+COURSE_ONLY = (
+    "title",
+    "published",
+    "created_date",
+    "instructor__user__first_name",
+    "instructor__user__last_name",
+    "instructor__user__username",
+    "category__name",
+)
+SUBMISSION_COLUMNS = (
+    "pk",
+    "student__user__first_name",
+    "student__user__last_name",
+    "student__user__username",
+    "assignment__lesson__course__title",
+    "assignment__title",
+    "assignment_id",
+    "submitted_date",
+)
+SUBMISSION_ONLY = (
+    "submitted_date",
+    "assignment_id",
+    "student__user__first_name",
+    "student__user__last_name",
+    "student__user__username",
+    "assignment__title",
+    "assignment__lesson__course__title",
+)
+
+
+def strategies(queryset, row, columns, only):
+    # Each returns something that keeps the loaded rows alive like a page would.
+    return {
+        "instances": lambda: [row(obj) for obj in list(queryset())],
+        "iterator": lambda: sum(
+            1 for obj in queryset().iterator(chunk_size=2000) if row(obj)
+        ),
+        "only": lambda: [row(obj) for obj in list(queryset().only(*only))],
+        "values": lambda: list(queryset().values(*columns)),
+        "values_list iterator": lambda: sum(
+            1 for _ in queryset().values_list(*columns).iterator(chunk_size=2000)
+        ),
+    }
+
+
+def measure(function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed * 1000, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--courses", type=int, default=20000)
+    parser.add_argument("--submissions", type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        start = time.perf_counter()
+        instructor, employee = populate(args.courses, args.submissions)
+        print(
+            f"inserted {args.courses} courses and {args.submissions} submissions "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        listings = {
+            "manage_courses": (
+                employee,
+                reverse("manage_courses"),
+                strategies(course_queryset, course_row, COURSE_COLUMNS, COURSE_ONLY),
+            ),
+            "grade_submissions": (
+                instructor,
+                reverse("grade_submissions"),
+                strategies(
+                    lambda: submission_queryset(instructor.instructor_profile),
+                    submission_row,
+                    SUBMISSION_COLUMNS,
+                    SUBMISSION_ONLY,
+                ),
+            ),
+        }
+
+        print(f"{'listing':<20}{'strategy':<24}{'ms':>10}{'peak MB':>10}")
+        for name, (user, url, paths) in listings.items():
+            client = Client()
+            client.force_login(user)
+
+            def page():
+                response = client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+
+            for label, function in {"full page": page, **paths}.items():
+                elapsed, peak = measure(function)
+                print(f"{name:<20}{label:<24}{elapsed:>10.0f}{peak:>10.1f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Measure worker cold start for the development and production settings.
+
+Each run happens in a fresh interpreter so nothing is shared between
+samples. For every settings module we report:
+
+- import time: python start -> django.setup() + WSGI application ready
+- first request: the first GET of the course list through the WSGI handler
+- second request: the same GET again, i.e. with warm template caches
+
+The production settings use the manifest static files storage, so unless
+DJANGO_STATIC_ROOT is set the static files are first collected into a
+temporary directory. A run whose response is not 200 aborts the benchmark
+instead of being reported as a timing.
+
+Usage:
+    python scripts/bench_startup.py [--runs 5] [--path /courses/]
+"""
+import argparse
+import json
+import os
+import statistics
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SETTINGS = {
+    "before (settings)": "learning_platform.settings",
+    "after (settings_production)": "learning_platform.settings_production",
+}
+
+
+def child(path):
+    start = time.perf_counter()
+    sys.path.insert(0, BASE_DIR)
+    from learning_platform.wsgi import application
+
+    ready = time.perf_counter()
+
+    from wsgiref.util import setup_testing_defaults
+
+    def request():
+        environ = {"PATH_INFO": path, "HTTP_HOST": "localhost"}
+        setup_testing_defaults(environ)
+        status = []
+        t0 = time.perf_counter()
+        body = b"".join(
+            application(environ, lambda s, h, exc_info=None: status.append(s))
+        )
+        return time.perf_counter() - t0, status[0], len(body)
+
+    first, status, size = request()
+    second, _, _ = request()
+    print(
+        json.dumps(
+            {
+                "import": ready - start,
+                "first": first,
+                "second": second,
+                "status": status,
+                "bytes": size,
+            }
+        )
+    )
+
+
+def environment(settings_module):
+    env = dict(os.environ)
+    env["DJANGO_SETTINGS_MODULE"] = settings_module
+    env.setdefault("DJANGO_SECRET_KEY", "benchmark-only-secret-key")
+    env.setdefault("DJANGO_ALLOWED_HOSTS", "localhost")
+    return env
+
+
+def collectstatic(settings_module):
+    subprocess.check_call(
+        [sys.executable, "manage.py", "collectstatic", "--noinput", "-v", "0"],
+        env=environment(settings_module),
+        cwd=BASE_DIR,
+    )
+
+
+def run(settings_module, path):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", "--path", path],
+        env=environment(settings_module),
+        cwd=BASE_DIR,
+    )
+    sample = json.loads(output.decode().strip().splitlines()[-1])
+    if not sample["status"].startswith("200"):
+        sys.exit(f"{settings_module}: GET {path} returned {sample['status']}")
+    return sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/courses/")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.path)
+        return
+
+    static_root = None
+    if "DJANGO_STATIC_ROOT" not in os.environ:
+        static_root = tempfile.mkdtemp(prefix="bench-static-")
+        os.environ["DJANGO_STATIC_ROOT"] = static_root
+    try:
+        collectstatic(SETTINGS["after (settings_production)"])
+        report(args)
+    finally:
+        if static_root:
+            shutil.rmtree(static_root)
+
+
+def report(args):
+    print(f"GET {args.path}, {args.runs} fresh interpreters per profile (median ms)")
+    print(f"{'profile':<30}{'import':>10}{'first req':>12}{'second req':>12}  status")
+    for label, module in SETTINGS.items():
+        samples = [run(module, args.path) for _ in range(args.runs)]
+        med = lambda key: statistics.median(s[key] for s in samples) * 1000
+        print(
+            f"{label:<30}{med('import'):>10.1f}{med('first'):>12.1f}"
+            f"{med('second'):>12.1f}  {samples[0]['status']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
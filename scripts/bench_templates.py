@@ -0,0 +1,129 @@
+"""
+Micro-benchmark for list page rendering with 1,000 rows.
+
+Renders the course catalog, course management table, grading queue and
+student dashboard against in-memory (unsaved) model instances, so only
+template CPU is measured. Each page is rendered through an engine that
+recompiles templates on every render and through the cached loader used by
+the project settings.
+
+Usage:
+    python scripts/bench_templates.py [--rows 1000] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "learning_platform.settings")
+django.setup()
+
+from django.conf import settings
+from django.template import Context, Engine
+from django.utils import timezone
+
+from courses.models import (
+    User,
+    Student,
+    Instructor,
+    Category,
+    Course,
+    Enrollment,
+    Lesson,
+    Assignment,
+    Submission,
+)
+
+LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
+
+def build_rows(count):
+    now = timezone.now()
+    instructor = Instructor(
+        pk=1, user=User(pk=1, username="instructor", first_name="Jane", last_name="Teacher")
+    )
+    category = Category(pk=1, name="Programming")
+    courses, enrollments, submissions = [], [], []
+    for i in range(1, count + 1):
+        course = Course(
+            pk=i,
+            title=f"Course {i}",
+            description="Learn the fundamentals step by step. " * 5,
+            instructor=instructor,
+            category=category,
+            price=Decimal("49.99"),
+            published=bool(i % 2),
+            created_date=now,
+        )
+        course.rating_avg = (i % 5) + 1
+        course.review_count = i % 17
+        course.student_count = i % 40
+        courses.append(course)
+
+        student = Student(pk=i, user=User(pk=i + 1, username=f"student{i}"))
+        enrollments.append(
+            Enrollment(pk=i, student=student, course=course, progress=i % 100, enrolled_date=now)
+        )
+        assignment = Assignment(
+            pk=i, title=f"Assignment {i}", lesson=Lesson(pk=i, title=f"Lesson {i}", course=course)
+        )
+        submissions.append(
+            Submission(pk=i, student=student, assignment=assignment, submitted_date=now)
+        )
+    return courses, enrollments, submissions
+
+
+def make_engine(cached):
+    loaders = [("django.template.loaders.cached.Loader", LOADERS)] if cached else LOADERS
+    return Engine(
+        dirs=settings.TEMPLATES[0]["DIRS"],
+        loaders=loaders,
+        libraries={
+            "crispy_forms_tags": "crispy_forms.templatetags.crispy_forms_tags",
+            "static": "django.templatetags.static",
+        },
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    courses, enrollments, submissions = build_rows(args.rows)
+    user = User(username="bench", role="student")
+    pages = {
+        "courses/course_list.html": {"courses": courses},
+        "courses/manage_courses.html": {"courses": courses},
+        "courses/grade_submissions.html": {"submissions": submissions},
+        "courses/student_dashboard.html": {"enrollments": enrollments},
+    }
+    engines = {"uncached": make_engine(False), "cached": make_engine(True)}
+
+    print(f"{args.rows} rows, median of {args.repeat} renders (ms)")
+    print(f"{'template':<34}" + "".join(f"{name:>12}" for name in engines))
+    for name, extra in pages.items():
+        timings = []
+        for engine in engines.values():
+            engine.get_template(name)  # warm the cache for the cached engine
+            samples = []
+            for _ in range(args.repeat):
+                context = Context({"user": user, "csrf_token": "bench", **extra})
+                start = time.perf_counter()
+                engine.get_template(name).render(context)
+                samples.append(time.perf_counter() - start)
+            timings.append(statistics.median(samples) * 1000)
+        print(f"{name:<34}" + "".join(f"{t:>12.1f}" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Check that the invalidation bus evicts keys in every worker process.
+
+Builds a throwaway SQLite database file (the project database is not
+touched) with some published courses, then starts several worker
+processes on it. Each worker fills its locmem cache with one "course:<pk>"
+entry per course, builds its catalog facet index and polls the bus in a
+loop, as InvalidationBusMiddleware would between requests. The parent
+then unpublishes the courses one by one through Course.save(), so the
+normal signals publish the keys, and finally makes one change inside a
+transaction that is rolled back.
+
+Every worker must evict every published key and drop the course from its
+facet index, and must keep the key of the rolled-back change. The report
+shows the propagation delay from save() to eviction; it is bounded by
+--interval (INVALIDATION_POLL_INTERVAL) plus the time between polls.
+
+Usage:
+    python scripts/check_invalidation.py [--workers 4] [--courses 20]
+                                         [--interval 0.2]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "learning_platform.settings")
+
+
+def setup(database, interval):
+    # The connection is not open yet, so pointing it elsewhere is enough.
+    from django.conf import settings
+
+    django.setup()
+    settings.DATABASES["default"]["NAME"] = database
+    settings.INVALIDATION_POLL_INTERVAL = interval
+    settings.SIMILARITY_INDEX_IN_BACKGROUND = False
+
+
+def worker(database, interval, timeout):
+    setup(database, interval)
+    from django.core.cache import cache
+
+    from courses.facets import catalog_index
+    from courses.invalidation import bus
+    from courses.models import Course
+
+    pks = list(Course.objects.values_list("pk", flat=True))
+    keys = {f"course:{pk}": pk for pk in pks}
+    cache.set_many({key: "cached" for key in keys})
+    catalog_index.build()
+    bus.poll(force=True)
+    print("ready", flush=True)
+
+    control = f"course:{sys.stdin.readline().strip()}"
+    evicted = {}
+    reindexed = {}
+    deadline = time.monotonic() + timeout
+    while len(reindexed) < len(keys) - 1 and time.monotonic() < deadline:
+        bus.poll()
+        now = time.time()
+        present = cache.get_many(list(keys))
+        for key, pk in keys.items():
+            if key not in present:
+                evicted.setdefault(key, now)
+            if pk not in catalog_index.courses:
+                reindexed.setdefault(key, now)
+        time.sleep(0.002)
+    # Give the rolled-back change time to (wrongly) arrive.
+    time.sleep(interval * 2)
+    bus.poll(force=True)
+    print(
+        json.dumps(
+            {
+                "evicted": evicted,
+                "reindexed": reindexed,
+                "control_kept": cache.get(control) is not None,
+            }
+        ),
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--courses", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args.worker, args.interval, args.timeout)
+
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, "bus.sqlite3")
+    setup(database, args.interval)
+    from django.core.management import call_command
+    from django.db import transaction
+
+    from courses.models import Category, Course, Instructor, User
+
+    call_command("migrate", verbosity=0)
+    user = User.objects.create(username="bus_instructor", role="instructor")
+    instructor = Instructor.objects.create(user=user)
+    category = Category.objects.create(name="Bus")
+    courses = [
+        Course.objects.create(
+            title=f"Course {i}",
+            description="",
+            instructor=instructor,
+            category=category,
+            price=10,
+            published=True,
+        )
+        for i in range(args.courses + 1)
+    ]
+    *courses, control = courses
+
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        f"--worker={database}",
+        f"--interval={args.interval}",
+        f"--timeout={args.timeout}",
+    ]
+    workers = [
+        subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(args.workers)
+    ]
+    for process in workers:
+        assert process.stdout.readline().strip() == "ready"
+        process.stdin.write(f"{control.pk}\n")
+        process.stdin.flush()
+
+    published = {}
+    for course in courses:
+        course.published = False
+        published[f"course:{course.pk}"] = time.time()
+        course.save()
+        time.sleep(0.02)
+    try:
+        with transaction.atomic():
+            control.published = False
+            control.save()
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    failures = 0
+    delays = []
+    for n, process in enumerate(workers):
+        result = json.loads(process.stdout.readline())
+        process.wait()
+        missing = set(published) - set(result["evicted"])
+        stale = set(published) - set(result["reindexed"])
+        delays.extend(
+            result["evicted"][key] - published[key]
+            for key in published
+            if key in result["evicted"]
+        )
+        ok = not missing and not stale and result["control_kept"]
+        failures += not ok
+        print(
+            f"worker {n}: evicted {len(published) - len(missing)}/{len(published)}"
+            f", reindexed {len(published) - len(stale)}/{len(published)}"
+            f", rolled-back key {'kept' if result['control_kept'] else 'EVICTED'}"
+        )
+    if delays:
+        delays.sort()
+        print(
+            f"propagation delay: median {statistics.median(delays) * 1000:.0f}ms"
+            f", max {delays[-1] * 1000:.0f}ms (poll interval {args.interval}s)"
+        )
+    print("FAILED" if failures else "OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,458 @@
+"""
+Scenario load generator: concurrent simulated users walking through the site.
+
+Each session is one thread with its own cookie jar that logs in as a load
+test account and runs the journey of its role (User.ROLE_CHOICES):
+
+- student:    login, dashboard, catalog, course, enroll, lesson, assignment,
+              submit, my grades, logout
+- instructor: login, dashboard, manage courses, grading queue, grade one
+              submission, gradebook, logout
+- employee:   login, dashboard, manage courses, cohort report, catalog,
+              logout
+
+Pages are followed through the links they contain, the way a browser user
+would, and forms are posted with the CSRF token from the csrftoken cookie.
+A step fails on a network error, an HTTP status of 400 or more or a
+redirect to the login page, and the rest of that journey is skipped. A
+page without the link the next step needs (a course without lessons)
+ends the journey early without counting as an error.
+
+--prepare creates the accounts (load_<role>_<n>, one shared password) in
+the database of DJANGO_SETTINGS_MODULE. Each load instructor also gets a
+published course with a lesson and an assignment due next week, so the
+students have work to submit and the instructors have work to grade.
+--start runs `manage.py runserver` on a free port for the run. For
+numbers that mean anything in production, point --url at the real
+server stack (gunicorn behind the web server) instead.
+
+Usage:
+    python scripts/load_journeys.py --prepare --start --sessions 50 \\
+        [--mix student=90,instructor=8,employee=2] [--iterations 1 | --duration 60]
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROLES = ("student", "instructor", "employee")
+PASSWORD = "load-test-password"
+
+
+class StepFailed(Exception):
+    pass
+
+
+class DeadEnd(StepFailed):
+    """The page has nothing to follow (e.g. a course without lessons)."""
+
+
+class Stats:
+    """Latencies and errors per (role, step), shared by all sessions."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.journeys = defaultdict(lambda: [0, 0, 0])
+        self.failures = Counter()
+
+    def record(self, role, step, elapsed, ok):
+        with self.lock:
+            self.latencies[role, step].append(elapsed)
+            if not ok:
+                self.errors[role, step] += 1
+
+    def failure(self, role, reason):
+        with self.lock:
+            self.failures[role, reason] += 1
+
+    def journey(self, role, outcome):
+        # outcome: 0 completed, 1 failed, 2 dead end.
+        with self.lock:
+            self.journeys[role][outcome] += 1
+
+
+def percentile(values, fraction):
+    # Nearest rank on sorted values.
+    return values[max(0, min(len(values) - 1, round(fraction * len(values)) - 1))]
+
+
+class Session:
+    def __init__(self, base_url, role, username, password, stats, think, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.role = role
+        self.username = username
+        self.password = password
+        self.stats = stats
+        self.think = think
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies)
+        )
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == "csrftoken":
+                return cookie.value
+        raise StepFailed("no csrftoken cookie")
+
+    def request(self, step, path, data=None):
+        """Fetch ``path`` (POST if ``data``), following redirects; return HTML."""
+        if self.think:
+            time.sleep(random.uniform(0, self.think))
+        url = self.base_url + path
+        headers = {"User-Agent": "load-journeys"}
+        if data is not None:
+            data = {"csrfmiddlewaretoken": self.csrf_token(), **data}
+            data = urllib.parse.urlencode(data).encode()
+            headers["Referer"] = url
+        start = time.perf_counter()
+        try:
+            with self.opener.open(
+                urllib.request.Request(url, data=data, headers=headers),
+                timeout=self.timeout,
+            ) as response:
+                body = response.read().decode("utf-8", "replace")
+                final_path = urllib.parse.urlsplit(response.geturl()).path
+        except (urllib.error.URLError, OSError) as e:
+            self.stats.record(self.role, step, time.perf_counter() - start, False)
+            raise StepFailed(f"{step}: {e}")
+        elapsed = time.perf_counter() - start
+        logged_out = final_path.startswith("/login/") and step not in (
+            "login page",
+            "logout",
+        )
+        self.stats.record(self.role, step, elapsed, not logged_out)
+        if logged_out:
+            raise StepFailed(f"{step}: redirected to login")
+        return body
+
+    def pick(self, step, html, pattern):
+        # A random link target matching ``pattern`` (one capture group).
+        matches = re.findall(pattern, html)
+        if not matches:
+            raise DeadEnd(f"{step}: no link matching {pattern}")
+        return random.choice(matches)
+
+    def login(self):
+        self.request("login page", "/login/")
+        self.request(
+            "login", "/login/", {"username": self.username, "password": self.password}
+        )
+
+    def logout(self):
+        self.request("logout", "/logout/", {})
+
+    def student(self):
+        self.request("dashboard", "/dashboard/")
+        catalog = self.request("catalog", "/courses/")
+        course = self.pick("course", catalog, r'href="/courses/(\d+)/"')
+        self.request("course", f"/courses/{course}/")
+        # Enrolling redirects back to the course page, now with lesson links.
+        page = self.request("enroll", f"/courses/{course}/enroll/")
+        lesson = self.pick("lesson", page, r'href="/lessons/(\d+)/"')
+        page = self.request("lesson", f"/lessons/{lesson}/")
+        assignment = self.pick("assignment", page, r'href="/assignments/(\d+)/"')
+        self.request("assignment", f"/assignments/{assignment}/")
+        self.request("submit form", f"/assignments/{assignment}/submit/")
+        self.request(
+            "submit",
+            f"/assignments/{assignment}/submit/",
+            {"content": f"print({random.randint(0, 99)})\n"},
+        )
+        self.request("my grades", "/grades/")
+
+    def instructor(self):
+        self.request("dashboard", "/dashboard/")
+        manage = self.request("manage courses", "/courses/manage/")
+        queue = self.request("grading queue", "/submissions/grade/")
+        if re.search(r'href="/submissions/\d+/grade/"', queue):
+            submission = self.pick(
+                "grade form", queue, r'href="/submissions/(\d+)/grade/"'
+            )
+            self.request("grade form", f"/submissions/{submission}/grade/")
+            self.request(
+                "grade",
+                f"/submissions/{submission}/grade/",
+                {"score": random.randint(50, 100), "feedback": "Load test."},
+            )
+        course = self.pick("gradebook", manage, r'href="/courses/(\d+)/gradebook/"')
+        self.request("gradebook", f"/courses/{course}/gradebook/")
+
+    def employee(self):
+        self.request("dashboard", "/dashboard/")
+        self.request("manage courses", "/courses/manage/")
+        self.request("cohort report", "/reports/cohorts/")
+        self.request("catalog", "/courses/")
+
+    def run_journey(self):
+        try:
+            self.login()
+            getattr(self, self.role)()
+            self.logout()
+        except StepFailed as e:
+            self.stats.journey(self.role, 2 if isinstance(e, DeadEnd) else 1)
+            self.stats.failure(self.role, str(e))
+            # Start the next journey from a clean session.
+            self.cookies.clear()
+            return
+        self.stats.journey(self.role, 0)
+
+
+def prepare(counts):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "learning_platform.settings")
+    import django
+
+    django.setup()
+    from django.contrib.auth.hashers import make_password
+    from django.utils import timezone
+
+    from courses.models import (
+        Assignment,
+        Category,
+        Course,
+        Employee,
+        Instructor,
+        Lesson,
+        Student,
+        User,
+    )
+
+    assert set(ROLES) == {role for role, _ in User.ROLE_CHOICES}
+    profiles = {"student": Student, "instructor": Instructor, "employee": Employee}
+    password = make_password(PASSWORD)
+    for role, count in counts.items():
+        names = [f"load_{role}_{n}" for n in range(count)]
+        existing = set(
+            User.objects.filter(username__in=names).values_list("username", flat=True)
+        )
+        users = User.objects.bulk_create(
+            User(username=name, password=password, role=role, first_name="Load")
+            for name in names
+            if name not in existing
+        )
+        profiles[role].objects.bulk_create(profiles[role](user=user) for user in users)
+        if role == "instructor":
+            category, _ = Category.objects.get_or_create(name="Load Test")
+            for user in users:
+                course = Course.objects.create(
+                    title=f"Load Test Course {user.username}",
+                    description="Course used by scripts/load_journeys.py.",
+                    instructor=user.instructor_profile,
+                    category=category,
+                    published=True,
+                )
+                lesson = Lesson.objects.create(course=course, title="Lesson 1", order=1)
+                Assignment.objects.create(
+                    lesson=lesson,
+                    title="Assignment 1",
+                    description="Print a number.",
+                    due_date=timezone.now() + timezone.timedelta(days=7),
+                )
+        print(f"{role}: {len(users)} accounts created, {len(existing)} existed")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server():
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "manage.py", "runserver", f"127.0.0.1:{port}", "--noreload"],
+        cwd=BASE_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit("runserver did not start within 30s")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        role, _, weight = part.partition("=")
+        if role not in ROLES:
+            raise argparse.ArgumentTypeError(f"unknown role {role!r}")
+        mix[role] = int(weight)
+        if mix[role] < 0:
+            raise argparse.ArgumentTypeError(f"negative weight for {role}")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("the mix needs a positive weight")
+    return mix
+
+
+def report(stats, wall):
+    rows = []
+    print(
+        f"{'role':<11}{'step':<16}{'count':>7}{'errors':>8}{'req/s':>8}"
+        f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    )
+    for (role, step), values in sorted(
+        stats.latencies.items(), key=lambda item: ROLES.index(item[0][0])
+    ):
+        values = sorted(values)
+        errors = stats.errors[role, step]
+        row = {
+            "role": role,
+            "step": step,
+            "count": len(values),
+            "errors": errors,
+            "rate": len(values) / wall,
+            "p50": percentile(values, 0.5) * 1000,
+            "p90": percentile(values, 0.9) * 1000,
+            "p99": percentile(values, 0.99) * 1000,
+            "max": values[-1] * 1000,
+        }
+        rows.append(row)
+        print(
+            f"{role:<11}{step:<16}{row['count']:>7}{errors:>8}{row['rate']:>8.1f}"
+            f"{row['p50']:>9.0f}{row['p90']:>9.0f}{row['p99']:>9.0f}{row['max']:>9.0f}"
+        )
+    total = sum(row["count"] for row in rows)
+    errors = sum(row["errors"] for row in rows)
+    print(
+        f"\n{total} requests in {wall:.1f}s ({total / wall:.1f}/s), "
+        f"{errors} errors ({100 * errors / max(total, 1):.1f}%)"
+    )
+    for role, (ok, failed, dead_ends) in stats.journeys.items():
+        print(
+            f"{role}: {ok} journeys completed, {failed} failed, "
+            f"{dead_ends} ended early"
+        )
+    if stats.failures:
+        print("\nmost common reasons for failing or ending early:")
+        for (role, reason), count in stats.failures.most_common(5):
+            print(f"{count:>7}  {role}: {reason}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--start", action="store_true", help="Run manage.py runserver for the test."
+    )
+    parser.add_argument(
+        "--prepare", action="store_true", help="Create the load test accounts first."
+    )
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent users.")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("student=90,instructor=8,employee=2"),
+        help="Relative share of sessions per role.",
+    )
+    parser.add_argument(
+        "--accounts",
+        type=int,
+        default=200,
+        help="Most load test accounts per role; sessions share them.",
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=1, help="Journeys per session."
+    )
+    parser.add_argument(
+        "--duration", type=float, help="Repeat journeys for this many seconds instead."
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=5.0, help="Seconds over which sessions start."
+    )
+    parser.add_argument(
+        "--think", type=float, default=0.0, help="Max random pause before each request."
+    )
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="Also write the per-step results here.")
+    args = parser.parse_args()
+
+    # Sessions per role follow the mix, rounded up so every role with a
+    # weight gets at least one, then taken back from the largest roles to
+    # keep the total at --sessions.
+    total_weight = sum(args.mix.values())
+    shares = {
+        role: -(-args.sessions * weight // total_weight)
+        for role, weight in args.mix.items()
+        if weight > 0
+    }
+    while sum(shares.values()) > max(args.sessions, len(shares)):
+        shares[max(shares, key=shares.get)] -= 1
+    # Accounts per role follow the mix too, so repeated runs reuse them.
+    counts = {
+        role: max(1, min(args.accounts, share)) for role, share in shares.items()
+    }
+    # Interleaved so the ramp starts every role early.
+    roles = [(role, n) for role, share in shares.items() for n in range(share)]
+    roles.sort(key=lambda item: item[1] / shares[item[0]])
+    if args.prepare:
+        prepare(counts)
+
+    server = None
+    if args.start:
+        server, args.url = start_server()
+    stats = Stats()
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    def run(index, role, n):
+        time.sleep(args.ramp * index / max(len(roles), 1))
+        session = Session(
+            args.url,
+            role,
+            f"load_{role}_{n % counts[role]}",
+            PASSWORD,
+            stats,
+            args.think,
+            args.timeout,
+        )
+        iteration = 0
+        while (
+            time.monotonic() < deadline if deadline else iteration < args.iterations
+        ):
+            session.run_journey()
+            iteration += 1
+
+    print(f"{len(roles)} sessions against {args.url}")
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(roles), 1)) as executor:
+            for future in [
+                executor.submit(run, index, role, n)
+                for index, (role, n) in enumerate(roles)
+            ]:
+                future.result()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    rows = report(stats, time.perf_counter() - start)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()